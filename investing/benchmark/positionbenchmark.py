@@ -0,0 +1,171 @@
+""" Position Engine Benchmark
+
+Generates synthetic FIDELITY data in a new local SQLite database, times each stage of
+Position.generate_position_history() and writes the results to a JSON file so runs can be compared across commits.
+
+Usage:
+    python -m investing.benchmark.positionbenchmark run --accounts 5 --years 3 --out before.json
+    python -m investing.benchmark.positionbenchmark compare before.json after.json
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+def compare(base_file, new_file):
+    """ Print stage times of two benchmark result files and the change from base_file to new_file
+
+    Args:
+        base_file (str): result JSON file
+        new_file (str): result JSON file
+    """
+    with open(base_file) as f:
+        base_dict = json.load(f)
+    with open(new_file) as f:
+        new_dict = json.load(f)
+
+    if base_dict["config"] != new_dict["config"]:
+        print("WARNING: configs are different")
+    print("commit".ljust(15) + str(base_dict["commit"])[:10].rjust(12) + str(new_dict["commit"])[:10].rjust(12))
+    for key in list(base_dict["stages"].keys()) + ["total", "peak_memory_mb"]:
+        base_val = base_dict["stages"].get(key, base_dict.get(key))
+        new_val = new_dict["stages"].get(key, new_dict.get(key))
+        change = "" if base_val is None or new_val is None or base_val == 0 \
+            else "{:+.1%}".format(new_val / base_val - 1)
+        print(key.ljust(15) + "".join(("-" if val is None else "{:.3f}".format(val)).rjust(12)
+                                      for val in (base_val, new_val)) + change.rjust(10))
+
+
+def git_commit():
+    """ Get the current git commit of this repository
+
+    Returns:
+        Optional[str]: commit hash. None if not in a git repository or git is not available
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    """ Create the database and synthetic data, then time position history generation
+
+    Args:
+        args (argparse.Namespace): parsed "run" arguments
+
+    Returns:
+        dict: results written to args.out
+    """
+    db_file = args.db if args.db is not None else os.path.join(tempfile.mkdtemp(), "positionbenchmark.sqlite3")
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    # settings are read from the environment when django is set up. always use a local SQLite database
+    os.environ["MYSQL_ENGINE"] = "django.db.backends.sqlite3"
+    os.environ["MYSQL_NAME"] = db_file
+    os.environ.setdefault("DJANGO_ALLOWED_HOSTS", "[]")
+    os.environ.setdefault("DJANGO_SECRET_KEY", "positionbenchmark")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "assetmanagement.settings")
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+
+    from ..models import Position, PositionInterval
+    from ..models.investmentaccount import Broker
+    from .syntheticdata import SyntheticBrokerData
+
+    call_command("migrate", verbosity=0)
+    config = {"accounts": args.accounts, "years": args.years, "tickers": args.tickers,
+              "trades_per_day": args.trades_per_day, "lot_ratio": args.lot_ratio, "splits": args.splits,
+              "mergers": args.mergers, "option_ratio": args.option_ratio, "seed": args.seed, "bulk": args.bulk,
+              "processes": args.processes, "intervals": args.intervals}
+    start = time.perf_counter()
+    counts = SyntheticBrokerData(
+        accounts=args.accounts, years=args.years, tickers=args.tickers, trades_per_day=args.trades_per_day,
+        lot_ratio=args.lot_ratio, splits=args.splits, mergers=args.mergers, option_ratio=args.option_ratio,
+        seed=args.seed).create()
+    print("Created synthetic data in " + "{:.1f}".format(time.perf_counter() - start) + "s: " + str(counts))
+
+    pos_model = PositionInterval if args.intervals else Position
+
+    def generate(stage_func=None):
+        pos_model.objects.all().delete()
+        return Position.generate_position_history(Broker.FIDELITY, bulk=args.bulk, processes=args.processes,
+                                                  intervals=args.intervals, stage_func=stage_func)
+
+    # best time of each stage over all repeats
+    stage_dict = {}
+    total_list = []
+    for i in range(args.repeat):
+        run_dict = {}
+        start = time.perf_counter()
+        generate(lambda stage, seconds: run_dict.__setitem__(stage, seconds))
+        total_list.append(time.perf_counter() - start)
+        for stage, seconds in run_dict.items():
+            stage_dict[stage] = min(seconds, stage_dict.get(stage, seconds))
+        print("Run " + str(i + 1) + ": " + ", ".join(k + " " + "{:.3f}".format(v) + "s" for k, v in run_dict.items()))
+
+    # tracing slows down allocation heavy code so memory is measured in a separate run. worker processes are not traced
+    peak_memory_mb = None
+    if not args.no_memory:
+        tracemalloc.start()
+        generate()
+        peak_memory_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+    result_dict = {
+        "commit": git_commit(), "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0], "config": config, "counts": counts, "stages": stage_dict,
+        "total": min(total_list), "positions": pos_model.objects.count(), "peak_memory_mb": peak_memory_mb}
+    with open(args.out, "w") as f:
+        json.dump(result_dict, f, indent=2)
+    print("Wrote " + args.out)
+
+    return result_dict
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Position.generate_position_history() on synthetic data")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="generate synthetic data and time position history generation")
+    run_parser.add_argument("--accounts", type=int, default=2)
+    run_parser.add_argument("--years", type=float, default=1)
+    run_parser.add_argument("--tickers", type=int, default=20)
+    run_parser.add_argument("--trades-per-day", type=float, default=5)
+    run_parser.add_argument("--lot-ratio", type=float, default=0.8,
+                            help="fraction of equity securities broken into lots")
+    run_parser.add_argument("--splits", type=int, default=2)
+    run_parser.add_argument("--mergers", type=int, default=1)
+    run_parser.add_argument("--option-ratio", type=float, default=0.1, help="fraction of trades in options")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--bulk", action="store_true", help="save positions with bulk_create")
+    run_parser.add_argument("--processes", type=int, default=None)
+    run_parser.add_argument("--intervals", action="store_true", help="save positions as PositionInterval")
+    run_parser.add_argument("--repeat", type=int, default=3, help="number of timed runs. best time is recorded")
+    run_parser.add_argument("--no-memory", action="store_true", help="skip the peak memory run")
+    run_parser.add_argument("--db", default=None,
+                            help="SQLite database file. replaced if it exists. Default a new temporary file")
+    run_parser.add_argument("--out", default="positionbenchmark.json", help="result JSON file")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two result JSON files")
+    compare_parser.add_argument("base_file")
+    compare_parser.add_argument("new_file")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run(args)
+    else:
+        compare(args.base_file, args.new_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+from decimal import Decimal
+import datetime
+import math
+
+import numpy as np
+
+from ..models.closedposition import ClosedPosition
+from ..models.investmentaccount import Broker, InvestmentAccount
+from ..models.securitymaster import AssetClass, AssetSubClass, ChangeType, OptionType, SecurityMaster, TickerHistory
+from ..models.transaction import ActionType, Transaction, TransactionType
+import util.pythonutil as PyUtil
+
+
+class SyntheticBrokerData:
+    """ Synthetic FIDELITY accounts, securities, transactions and closed positions
+
+    Closed positions are generated with the transactions from the synthetic lots (first in, first out) so every sell
+    and cover matches existing lots the same way FIDELITY reports them. Securities that are not broken into lots are
+    only bought. Dividends are paid to the core position. Splits and mergers are market wide events on securities
+    broken into lots and apply to every account that holds the security. Options are calls sold short and later covered
+    or expired.
+
+    Attributes:
+        accounts (int): number of investment accounts
+        years (float): years of history per account
+        tickers (int): number of equity securities
+        trades_per_day (float): average number of trades per account per business day
+        lot_ratio (float): fraction of equity securities broken into lots by FIDELITY
+        splits (int): number of 2 for 1 stock splits
+        mergers (int): number of mergers
+        option_ratio (float): fraction of trades in options
+        start_date (datetime.date): create date of all accounts
+        rng (np.random.Generator):
+    """
+    def __init__(self, accounts=2, years=1, tickers=20, trades_per_day=5, lot_ratio=0.8, splits=2, mergers=1,
+                 option_ratio=0.1, start_date=datetime.date(2018, 1, 2), seed=0):
+        self.accounts = accounts
+        self.years = years
+        self.tickers = tickers
+        self.trades_per_day = trades_per_day
+        self.lot_ratio = lot_ratio
+        self.splits = splits
+        self.mergers = mergers
+        self.option_ratio = option_ratio
+        self.start_date = start_date
+        self.rng = np.random.default_rng(seed)
+
+    def create(self, batch_size=5000):
+        """ Create synthetic data in the database
+
+        The database must not have any investment accounts, securities, transactions or closed positions.
+
+        Args:
+            batch_size (int): bulk_create batch size. Default 5000
+
+        Returns:
+            dict[str, int]: number of accounts, securities, transactions and closed positions created
+        """
+        date_list = PyUtil.date_range(self.start_date, PyUtil.change_dt_date(self.start_date, years=self.years))
+
+        SecurityMaster.objects.create(my_id="MF_0000001", ticker="SPAXX", asset_class=AssetClass.MUTUAL_FUND,
+                                      asset_subclass=AssetSubClass.MONEY_MARKET, has_fidelity_lots=False)
+        lot_count = round(self.tickers * self.lot_ratio)
+        eq_list = [SecurityMaster.objects.create(
+            my_id="EQ_" + str(i + 1).zfill(7), ticker="SYN" + str(i + 1), asset_class=AssetClass.EQUITY,
+            asset_subclass=AssetSubClass.COMMON_STOCK, has_fidelity_lots=i < lot_count) for i in range(self.tickers)]
+        opt_list = [SecurityMaster.objects.create(
+            my_id="OP_" + str(i + 1).zfill(7), ticker=sec.ticker + "C" + str(i + 1), asset_class=AssetClass.OPTION,
+            asset_subclass=AssetSubClass.EQUITY_OPTION, underlying_security=sec, expiration_date=date_list[-1],
+            option_type=OptionType.AMERICAN_CALL, strike_price=Decimal(100), contract_size=100)
+            for i, sec in enumerate(eq_list[:max(1, self.tickers // 4)])]
+
+        # market wide events on distinct securities broken into lots. merged securities are replaced by a new security
+        event_sec_arr = self.rng.permutation(lot_count)
+        event_date_arr = np.sort(self.rng.choice(np.arange(1, len(date_list)), size=self.splits + self.mergers,
+                                                 replace=False))
+        split_dict = {date_list[d]: eq_list[s] for d, s in zip(event_date_arr[:self.splits],
+                                                                event_sec_arr[:self.splits])}
+        merger_dict = {}
+        for i, (d, s) in enumerate(zip(event_date_arr[self.splits:], event_sec_arr[self.splits:])):
+            new_sec = SecurityMaster.objects.create(
+                my_id="EQ_" + str(self.tickers + i + 1).zfill(7), ticker="SYNM" + str(i + 1),
+                asset_class=AssetClass.EQUITY, asset_subclass=AssetSubClass.COMMON_STOCK, has_fidelity_lots=True)
+            TickerHistory.objects.create(security=new_sec, new_ticker=new_sec.ticker, old_ticker=eq_list[s].ticker,
+                                         change_date=date_list[d], change_type=ChangeType.MERGER)
+            merger_dict[date_list[d]] = (eq_list[s], new_sec)
+
+        trans_list = []
+        cp_list = []
+        for i in range(self.accounts):
+            inv_acc = InvestmentAccount.objects.create(
+                broker=Broker.FIDELITY, account_id="SYN" + str(i + 1).zfill(5), account_name="Synthetic " + str(i + 1),
+                taxable=i % 2 == 0, create_date=self.start_date)
+            self._create_account(inv_acc, date_list, list(eq_list), opt_list, split_dict, merger_dict, trans_list,
+                                 cp_list)
+
+        Transaction.objects.bulk_create(trans_list, batch_size=batch_size)
+        ClosedPosition.objects.bulk_create(cp_list, batch_size=batch_size)
+
+        return {"accounts": self.accounts, "securities": SecurityMaster.objects.count(),
+                "transactions": len(trans_list), "closed_positions": len(cp_list), "business_days": len(date_list)}
+
+    def _create_account(self, inv_acc, date_list, eq_list, opt_list, split_dict, merger_dict, trans_list, cp_list):
+        """ Create (not saved) transactions and closed positions for inv_acc and append them to the lists """
+        lot_dict = {}
+        short_dict = {}
+        cash = Decimal(0)
+
+        def trans(trans_date, trans_type, action_type, description, amount_net, security=None, quantity=None,
+                  price=None):
+            nonlocal cash
+            # cash is contributed in multiples of 100,000 before the core position would become negative
+            if cash + amount_net < 0:
+                contribution = Decimal(math.ceil(-(cash + amount_net) / 100000) * 100000)
+                cash += contribution
+                trans_list.append(Transaction(
+                    investment_account=inv_acc, trans_date=trans_date, trans_type=TransactionType.TRANSFER,
+                    action_type=ActionType.TRANSFER, description="CONTRIBUTION", amount_net=contribution,
+                    commission=Decimal(0), fees=Decimal(0)))
+            cash += amount_net
+            trans_list.append(Transaction(
+                investment_account=inv_acc, trans_date=trans_date, trans_type=trans_type, action_type=action_type,
+                description=description, security=security, quantity=quantity, price=price, amount_net=amount_net,
+                commission=Decimal(0), fees=Decimal(0)))
+
+        def closed_position(close_date, security, quantity, enter_date, enter_price_net, close_price, cost_basis_price,
+                            cost_basis_total, proceeds_price, proceeds_total):
+            cp_list.append(ClosedPosition(
+                investment_account=inv_acc, security=security, quantity=quantity, enter_date=enter_date,
+                enter_price_net=enter_price_net, close_date=close_date, close_price_net=close_price,
+                cost_basis_price=cost_basis_price, cost_basis_total=cost_basis_total,
+                cost_basis_price_unadj=cost_basis_price, cost_basis_total_unadj=cost_basis_total,
+                proceeds_price=proceeds_price, proceeds_total=proceeds_total, short_term_pnl=Decimal(0),
+                long_term_pnl=Decimal(0), short_term_pnl_unadj=Decimal(0), long_term_pnl_unadj=Decimal(0)))
+
+        def price(low, high):
+            return round(Decimal(self.rng.uniform(low, high)), 2)
+
+        for cur_date in date_list[1:]:
+            if cur_date in split_dict and lot_dict.get(split_dict[cur_date]):
+                sec = split_dict[cur_date]
+                trans(cur_date, TransactionType.CORP_ACT, ActionType.STOCK_SPLIT, "DISTRIBUTION", Decimal(0), sec,
+                      sum(lot[1] for lot in lot_dict[sec]))
+                lot_dict[sec] = [[lot[0], lot[1] * 2, round(lot[2] / 2, 4)] for lot in lot_dict[sec]]
+            if cur_date in merger_dict:
+                old_sec, new_sec = merger_dict[cur_date]
+                if lot_dict.get(old_sec):
+                    qty = sum(lot[1] for lot in lot_dict[old_sec])
+                    trans(cur_date, TransactionType.CORP_ACT, ActionType.MERGER_NEW, "MERGER", Decimal(0), new_sec,
+                          qty)
+                    trans(cur_date, TransactionType.CORP_ACT, ActionType.MERGER_OLD, "MERGER", Decimal(0), old_sec,
+                          -qty)
+                    lot_dict[new_sec] = lot_dict.pop(old_sec)
+                else:
+                    lot_dict.pop(old_sec, None)
+                eq_list[eq_list.index(old_sec)] = new_sec
+
+            # a security is closed at most once per day and not on a day it is opened so closed positions always match
+            # lots entered on earlier days
+            traded_set = set()
+            for _ in range(self.rng.poisson(self.trades_per_day)):
+                held_list = [sec for sec, lot_list in lot_dict.items() if lot_list and sec not in traded_set]
+                if self.rng.random() < self.option_ratio:
+                    short_list = [sec for sec, lot_list in short_dict.items() if lot_list and sec not in traded_set]
+                    if len(short_list) > 0 and self.rng.random() < 0.5:
+                        sec = short_list[self.rng.integers(len(short_list))]
+                        traded_set.add(sec)
+                        for enter_date, qty, epn in short_dict.pop(sec):
+                            close_price = price(0.05, 5)
+                            cost = round(qty * close_price * 100, 2)
+                            proceeds_total = round(qty * epn * 100, 2)
+                            trans(cur_date, TransactionType.TRADE, ActionType.BUY_COVER, "YOU BOUGHT CLOSING", -cost,
+                                  sec, qty, close_price)
+                            closed_position(cur_date, sec, qty, enter_date, epn, close_price, close_price, cost, epn,
+                                            proceeds_total)
+                    else:
+                        sec = opt_list[self.rng.integers(len(opt_list))]
+                        qty = Decimal(int(self.rng.integers(1, 10)))
+                        open_price = price(0.05, 5)
+                        amount = round(qty * open_price * 100, 2)
+                        trans(cur_date, TransactionType.TRADE, ActionType.SELL_SHORT, "YOU SOLD OPENING", amount, sec,
+                              -qty, open_price)
+                        traded_set.add(sec)
+                        short_dict.setdefault(sec, []).append([cur_date, qty, round(amount / qty / 100, 4)])
+                elif len(held_list) > 0 and self.rng.random() < 0.4:
+                    sec = held_list[self.rng.integers(len(held_list))]
+                    traded_set.add(sec)
+                    close_price = price(10, 500)
+                    sell_qty = min(sum(lot[1] for lot in lot_dict[sec]), Decimal(int(self.rng.integers(1, 100))))
+                    trans(cur_date, TransactionType.TRADE, ActionType.SELL, "YOU SOLD",
+                          round(sell_qty * close_price, 2), sec, -sell_qty, close_price)
+                    while sell_qty > 0:
+                        lot = lot_dict[sec][0]
+                        qty = min(sell_qty, lot[1])
+                        closed_position(cur_date, sec, qty, lot[0], lot[2], close_price, lot[2],
+                                        round(qty * lot[2], 2), close_price, round(qty * close_price, 2))
+                        lot[1] -= qty
+                        sell_qty -= qty
+                        if lot[1] == 0:
+                            lot_dict[sec].pop(0)
+                else:
+                    sec = eq_list[self.rng.integers(len(eq_list))]
+                    qty = Decimal(int(self.rng.integers(1, 100)))
+                    buy_price = price(10, 500)
+                    amount = round(qty * buy_price, 2)
+                    trans(cur_date, TransactionType.TRADE, ActionType.BUY, "YOU BOUGHT", -amount, sec, qty, buy_price)
+                    if sec.has_fidelity_lots:
+                        lot_dict.setdefault(sec, []).append([cur_date, qty, round(amount / qty, 4)])
+                        traded_set.add(sec)
+
+            held_list = [sec for sec, lot_list in lot_dict.items() if lot_list]
+            if len(held_list) > 0 and self.rng.random() < 0.05:
+                trans(cur_date, TransactionType.CORP_ACT, ActionType.DIV, "DIVIDEND RECEIVED", price(1, 100),
+                      held_list[self.rng.integers(len(held_list))])
+
+        # open short options expire on the last date
+        for sec, short_list in short_dict.items():
+            for enter_date, qty, epn in short_list:
+                trans(date_list[-1], TransactionType.OTHER, ActionType.OPT_EXP, "EXPIRED", Decimal(0), sec, qty)
+                closed_position(date_list[-1], sec, qty, enter_date, epn, Decimal(0), Decimal(0), Decimal(0), epn,
+                                round(qty * epn * 100, 2))
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from enum import Enum
 from io import StringIO
@@ -5,12 +6,17 @@ from json import JSONDecodeError
 from typing import Any, Optional, Union
 import datetime
 import logging
-import requests
+import threading
+import time
 
 import numpy as np
 import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
 
 from .dataproviderexception import DataProviderException
+from .ratelimiter import TokenBucket
+from .responsecache import ResponseCache
 
 
 class Endpoints(Enum):
@@ -335,18 +341,76 @@ class NewsSentiment:
 class AlphaVantage:
     """ Access AlphaVantage API using requests package and return data as pandas dataframes
 
+    All instances share one keep-alive requests.Session and one token bucket rate limiter sized to the API plan, since
+    the request quota is per API key and not per instance.
+
     Class Attributes:
         _URL_BASE (str): base of url for all API endpoints
+        _CALLS_PER_MINUTE (int): API plan request quota
+        _POOL_SIZE (int): max keep-alive connections kept by the shared session
+        _RATE_LIMITER (TokenBucket): shared by instances that are not given a rate limiter
+        _session (Optional[requests.Session]): shared session. created on first request
+        _session_lock (threading.Lock):
+        _CACHE_TTL (dict[Endpoints, datetime.timedelta]): how long a cached response of each endpoint is used
 
     Attributes:
         api_key (str): API key for access to API
         logger (logging.Logger):
+        url_base (str): base of url for all API endpoints
+        timeout (tuple[float, float]): connect and read timeouts in seconds
+        max_retries (int): number of times a request is retried after a connection error, 429 or 5xx status code or a
+            throttle response
+        backoff (float): seconds to wait before the first retry. doubled for each following retry
+        rate_limiter (TokenBucket):
+        cache (Optional[ResponseCache]): successful responses are cached by url without the api key
+        refresh (boolean): True to skip reading cached responses. new responses are still cached
     """
     _URL_BASE = "https://www.alphavantage.co/query?"
+    _CALLS_PER_MINUTE = 5
+    _POOL_SIZE = 10
+    _RATE_LIMITER = TokenBucket(_CALLS_PER_MINUTE / 60, _CALLS_PER_MINUTE)
+    _session = None
+    _session_lock = threading.Lock()
+    _CACHE_TTL = {
+        Endpoints.TIME_SERIES_INTRADAY: datetime.timedelta(minutes=5),
+        **{e: datetime.timedelta(days=1) for e in (
+            Endpoints.TIME_SERIES_DAILY, Endpoints.TIME_SERIES_DAILY_ADJUSTED, Endpoints.TIME_SERIES_WEEKLY,
+            Endpoints.TIME_SERIES_WEEKLY_ADJUSTED, Endpoints.TIME_SERIES_MONTHLY,
+            Endpoints.TIME_SERIES_MONTHLY_ADJUSTED, Endpoints.NEWS_SENTIMENT, Endpoints.EARNINGS_CALENDAR,
+            Endpoints.IPO_CALENDAR)},
+        Endpoints.TOP_GAINERS_LOSERS: datetime.timedelta(hours=1),
+        **{e: datetime.timedelta(weeks=2) for e in (
+            Endpoints.OVERVIEW, Endpoints.INCOME_STATEMENT, Endpoints.BALANCE_SHEET, Endpoints.CASH_FLOW,
+            Endpoints.EARNINGS, Endpoints.LISTING_STATUS)},
+        # macro series are released monthly or quarterly but treasury yields can be daily
+        **{e: datetime.timedelta(days=1) for e in (
+            Endpoints.REAL_GDP, Endpoints.REAL_GDP_PER_CAPITA, Endpoints.TREASURY_YIELD,
+            Endpoints.FEDERAL_FUNDS_RATE, Endpoints.CPI, Endpoints.INFLATION, Endpoints.RETAIL_SALES,
+            Endpoints.DURABLES, Endpoints.UNEMPLOYMENT, Endpoints.NONFARM_PAYROLL)},
+    }
+
+    def __init__(self, timeout=(5., 30.), max_retries=3, backoff=1., rate_limiter=None, url_base=None, cache=None,
+                 refresh=False):
+        """ init
 
-    def __init__(self):
+        Args:
+            timeout (tuple[float, float]): connect and read timeouts in seconds. Default (5, 30)
+            max_retries (int): Default 3
+            backoff (float): Default 1 second
+            rate_limiter (Optional[TokenBucket]): Default None for the limiter shared by all instances
+            url_base (Optional[str]): Default None for AlphaVantage._URL_BASE. e.g. a local stub server for testing
+            cache (Optional[Union[ResponseCache, str]]): cache or SQLite file of a cache. Default None to not cache
+            refresh (boolean): Default False
+        """
         self.api_key = "QH8F7RKNS3R4VXP7"
         self.logger = logging.getLogger(__name__)
+        self.url_base = AlphaVantage._URL_BASE if url_base is None else url_base
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limiter = AlphaVantage._RATE_LIMITER if rate_limiter is None else rate_limiter
+        self.cache = ResponseCache(cache) if isinstance(cache, str) else cache
+        self.refresh = refresh
 
     def _base_create_url(self, endpoint, param_dict):
         """ See _base_request()
@@ -385,7 +449,7 @@ class AlphaVantage:
             if val is not None:
                 param_str += ("&" + param + "=" + val)
 
-        return AlphaVantage._URL_BASE + "function=" + endpoint.value + param_str + "&apikey=" + self.api_key
+        return self.url_base + "function=" + endpoint.value + param_str + "&apikey=" + self.api_key
 
     def _base_request(self, endpoint, param_dict):
         """ Compile AlphaVantage URL, send request and handle response
@@ -397,16 +461,40 @@ class AlphaVantage:
                 datetime.date -> str format YYYY-MM-DD, list/tuple -> conversions for scalar elements applied to each
                 element and all elements joined with ",", all others -> str(value)
 
+        Requests wait for the rate limiter. Connection errors, 429 and 5xx status codes and throttle responses (a
+        "Note" or an "Information" message about the call frequency or rate limit) are retried up to max_retries
+        times with exponential backoff. If the instance has a cache, a cached response younger than the endpoint's
+        time to live is returned without a request and successful responses are cached.
+
         Returns:
             requests.Response: callers of this function handle the response
 
         Raises:
-            DataProviderException: if response status code is not 200 or response text is an error or information
-                message. exception message is logged and exception is raised
+            DataProviderException: if response status code is not 200, response text is an error or information
+                message or the request still fails after all retries. exception message is logged and exception is
+                raised
         """
         url = self._base_create_url(endpoint, param_dict)
-
-        response = requests.get(url)
+        cache_key = url.replace("&apikey=" + self.api_key, "")
+        ttl = AlphaVantage._CACHE_TTL.get(endpoint)
+        if self.cache is not None and ttl is not None and not self.refresh:
+            cached = self.cache.get(cache_key, ttl.total_seconds())
+            if cached is not None:
+                return AlphaVantage._cached_response(cache_key, *cached)
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = AlphaVantage._get_session().get(url, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                if attempt == self.max_retries:
+                    self.logger.exception("URL: " + self.url_base + "function=" + endpoint.value + ", " + repr(ex))
+                    raise DataProviderException(repr(ex) + ", See log for full trace.")
+            else:
+                if not AlphaVantage._is_retry_response(response) or attempt == self.max_retries:
+                    break
+            self.logger.warning(endpoint.value + " request failed or was throttled. retry " + str(attempt + 1))
+            time.sleep(self.backoff * 2 ** attempt)
 
         if response.status_code != 200:
             self.logger.exception("Status Code: " + str(response.status_code) + ", Reason: " + response.reason)
@@ -416,7 +504,7 @@ class AlphaVantage:
             try:
                 # status code can be 200 but response still indicates an error
                 res_dict = response.json()
-                if any([x in res_dict for x in ["Error Message", "Information"]]):
+                if any([x in res_dict for x in ["Error Message", "Information", "Note"]]):
                     self.logger.exception("URL: " + response.url + ", Text: " + response.text)
                     raise DataProviderException("URL: " + response.url + ", Text: " + response.text +
                                                 " See log for full trace.")
@@ -424,6 +512,8 @@ class AlphaVantage:
                 # response is not JSON format. this is ok (probably requested CSV format)
                 pass
 
+        if self.cache is not None and ttl is not None:
+            self.cache.set(cache_key, endpoint.value, response.content, response.encoding)
         return response
 
     def intraday(self, symbol, interval=IntradayInterval.M1, adjusted=True, extended_hours=True, month=None,
@@ -1068,3 +1158,181 @@ class AlphaVantage:
         df["people"] = df["people"].astype("int64") * 1000
 
         return df
+
+    def daily_batch(self, symbols, adjusted=True, output_size=OutputSize.FULL, max_workers=4):
+        """ daily() for many symbols with requests sent concurrently
+
+        Args:
+            symbols (Iterable[str]): duplicates are ignored
+            adjusted (boolean): See daily()
+            output_size (OutputSize): See daily()
+            max_workers (int): max concurrent requests. Default 4
+
+        Returns:
+            tuple[dict[str, pd.DataFrame], dict[str, Exception]]: See _batch()
+        """
+        return self._batch(self.daily, symbols, max_workers, adjusted=adjusted, output_size=output_size)
+
+    def intraday_batch(self, symbols, interval=IntradayInterval.M1, adjusted=True, extended_hours=True, month=None,
+                       output_size=OutputSize.FULL, max_workers=4):
+        """ intraday() for many symbols with requests sent concurrently
+
+        Args:
+            symbols (Iterable[str]): duplicates are ignored
+            interval, adjusted, extended_hours, month, output_size: See intraday()
+            max_workers (int): max concurrent requests. Default 4
+
+        Returns:
+            tuple[dict[str, pd.DataFrame], dict[str, Exception]]: See _batch()
+        """
+        return self._batch(self.intraday, symbols, max_workers, interval=interval, adjusted=adjusted,
+                           extended_hours=extended_hours, month=month, output_size=output_size)
+
+    def company_overview_batch(self, symbols, max_workers=4):
+        """ company_overview() for many symbols with requests sent concurrently
+
+        Args:
+            symbols (Iterable[str]): duplicates are ignored
+            max_workers (int): max concurrent requests. Default 4
+
+        Returns:
+            tuple[dict[str, dict[str, str]], dict[str, Exception]]: See _batch()
+        """
+        return self._batch(self.company_overview, symbols, max_workers)
+
+    def income_statement_batch(self, symbols, max_workers=4):
+        """ income_statement() for many symbols with requests sent concurrently
+
+        Args:
+            symbols (Iterable[str]): duplicates are ignored
+            max_workers (int): max concurrent requests. Default 4
+
+        Returns:
+            tuple[dict[str, pd.DataFrame], dict[str, Exception]]: See _batch()
+        """
+        return self._batch(self.income_statement, symbols, max_workers)
+
+    def balance_sheet_batch(self, symbols, max_workers=4):
+        """ balance_sheet() for many symbols with requests sent concurrently
+
+        Args:
+            symbols (Iterable[str]): duplicates are ignored
+            max_workers (int): max concurrent requests. Default 4
+
+        Returns:
+            tuple[dict[str, pd.DataFrame], dict[str, Exception]]: See _batch()
+        """
+        return self._batch(self.balance_sheet, symbols, max_workers)
+
+    def cash_flow_statement_batch(self, symbols, max_workers=4):
+        """ cash_flow_statement() for many symbols with requests sent concurrently
+
+        Args:
+            symbols (Iterable[str]): duplicates are ignored
+            max_workers (int): max concurrent requests. Default 4
+
+        Returns:
+            tuple[dict[str, pd.DataFrame], dict[str, Exception]]: See _batch()
+        """
+        return self._batch(self.cash_flow_statement, symbols, max_workers)
+
+    def earnings_batch(self, symbols, max_workers=4):
+        """ earnings() for many symbols with requests sent concurrently
+
+        Args:
+            symbols (Iterable[str]): duplicates are ignored
+            max_workers (int): max concurrent requests. Default 4
+
+        Returns:
+            tuple[dict[str, pd.DataFrame], dict[str, Exception]]: See _batch()
+        """
+        return self._batch(self.earnings, symbols, max_workers)
+
+    def _batch(self, func, symbols, max_workers, **kwargs):
+        """ Call func for each symbol on a thread pool
+
+        Threads share this instance's session and rate limiter so the request rate stays within the API quota and
+        wall clock time is bound by the quota instead of request latency.
+
+        Args:
+            func (Callable): single symbol method of this instance. called as func(symbol, **kwargs)
+            symbols (Iterable[str]): duplicates are ignored
+            max_workers (int): max concurrent requests
+            **kwargs: passed to func
+
+        Returns:
+            tuple[dict[str, Any], dict[str, Exception]]: symbol to func result for symbols that succeeded and symbol to
+                exception for symbols that failed. both in the order of symbols. exceptions are not raised
+        """
+        symbols = list(dict.fromkeys(symbols))
+        result_dict = {}
+        error_dict = {}
+        if not symbols:
+            return result_dict, error_dict
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(symbols)),
+                                thread_name_prefix="alphavantage") as executor:
+            future_dict = {symbol: executor.submit(func, symbol, **kwargs) for symbol in symbols}
+        for symbol, future in future_dict.items():
+            try:
+                result_dict[symbol] = future.result()
+            except Exception as ex:
+                error_dict[symbol] = ex
+        return result_dict, error_dict
+
+    @classmethod
+    def _get_session(cls):
+        """ Get the session shared by all instances. created on first use
+
+        Returns:
+            requests.Session: session with a keep-alive connection pool of up to _POOL_SIZE connections
+        """
+        with cls._session_lock:
+            if cls._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=cls._POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                cls._session = session
+        return cls._session
+
+    @staticmethod
+    def _cached_response(url, body, encoding):
+        """ Create a response from a cached body
+
+        Args:
+            url (str): cache key
+            body (bytes):
+            encoding (Optional[str]):
+
+        Returns:
+            requests.Response: response with status code 200
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = url
+        response.encoding = encoding
+        response._content = body
+        return response
+
+    @staticmethod
+    def _is_retry_response(response):
+        """ Should the request of response be retried
+
+        Args:
+            response (requests.Response):
+
+        Returns:
+            boolean: True if status code is 429 or 5xx or the response is a throttle message
+        """
+        if response.status_code == 429 or response.status_code >= 500:
+            return True
+        if response.status_code != 200 or not response.text.lstrip().startswith("{"):
+            return False
+        try:
+            res_dict = response.json()
+        except JSONDecodeError:
+            return False
+        info = str(res_dict.get("Note", "")) + str(res_dict.get("Information", ""))
+        return any(x in info.lower() for x in ["call frequency", "rate limit"])
@@ -0,0 +1,70 @@
+""" Module for data provider request rate limiting. """
+import threading
+import time
+
+
+class TokenBucket:
+    """ Thread safe token bucket rate limiter
+
+    The bucket holds up to capacity tokens and refills at rate tokens per second. Each request takes one token and
+    waits for the bucket to refill if it is empty, so bursts of up to capacity requests are sent immediately and the
+    long run request rate is at most rate.
+
+    Attributes:
+        rate (float): tokens added per second
+        capacity (float): max tokens in the bucket. the bucket starts full
+    """
+
+    def __init__(self, rate, capacity):
+        """ init
+
+        Args:
+            rate (float): tokens added per second. e.g. 5 / 60 for 5 requests per minute
+            capacity (float): max tokens in the bucket. must be at least 1
+
+        Raises:
+            ValueError: if rate is not positive or capacity is less than 1
+        """
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate must be positive and capacity must be at least 1")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Take one token. Block until one is available
+
+        Returns:
+            float: seconds waited
+        """
+        waited = 0.
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            # sleep without the lock so other threads can check the bucket
+            time.sleep(wait)
+            waited += wait
+
+    def try_acquire(self):
+        """ Take one token if one is available without blocking
+
+        Returns:
+            boolean: True if a token was taken
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_time) * self.rate)
+        self._last_time = now
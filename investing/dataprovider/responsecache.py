@@ -0,0 +1,73 @@
+""" Module for caching data provider responses on disk. """
+from contextlib import closing
+import sqlite3
+import time
+import zlib
+
+
+class ResponseCache:
+    """ SQLite file cache of data provider response bodies
+
+    Bodies are stored zlib compressed with the time they were fetched. Expiration is decided when reading so each
+    caller can use its own time to live. Every call opens its own connection so a cache can be shared by threads.
+
+    Attributes:
+        path (str): SQLite file. created if it does not exist
+    """
+
+    def __init__(self, path):
+        """ init
+
+        Args:
+            path (str): SQLite file. created if it does not exist
+        """
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS response (key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, "
+                         "fetch_time REAL NOT NULL, encoding TEXT, body BLOB NOT NULL)")
+
+    def clear(self, endpoint=None):
+        """ Delete cached responses
+
+        Args:
+            endpoint (Optional[str]): delete responses of this endpoint only. Default None to delete all responses
+
+        Returns:
+            int: number of responses deleted
+        """
+        with closing(self._connect()) as conn, conn:
+            if endpoint is None:
+                return conn.execute("DELETE FROM response").rowcount
+            return conn.execute("DELETE FROM response WHERE endpoint = ?", (endpoint,)).rowcount
+
+    def get(self, key, ttl):
+        """ Get cached response body of key if it is not older than ttl
+
+        Args:
+            key (str): e.g. request url without credentials
+            ttl (float): time to live in seconds
+
+        Returns:
+            Optional[tuple[bytes, Optional[str]]]: body and text encoding. None if key is not cached or expired
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT fetch_time, encoding, body FROM response WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[0] > ttl:
+            return None
+        return zlib.decompress(row[2]), row[1]
+
+    def set(self, key, endpoint, body, encoding=None):
+        """ Cache response body of key. replaces an existing response
+
+        Args:
+            key (str): e.g. request url without credentials
+            endpoint (str): used by clear()
+            body (bytes):
+            encoding (Optional[str]): text encoding of body. Default None
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO response (key, endpoint, fetch_time, encoding, body) "
+                         "VALUES (?, ?, ?, ?, ?)", (key, endpoint, time.time(), encoding, zlib.compress(body)))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
@@ -46,14 +46,18 @@ class SecurityMasterAdminForm(forms.ModelForm):
         self.fields["my_id"].widget.attrs['readonly'] = True
 
     def clean(self):
-        """ Override clean to set my_id if creating new SecurityMaster object or changing asset_class """
+        """ Override clean to set a placeholder my_id if creating new SecurityMaster object or changing asset_class
+
+        The placeholder has the asset class prefix so model validation passes. The my_id is generated in save() after
+        all validation so a form with errors does not use up a my_id
+        """
         cd = super().clean()  # super returns self.cleaned_data
 
         if len(self.errors) > 0:
             return self.cleaned_data
 
-        if len(self.initial) == 0 or self.initial["asset_class"] != cd["asset_class"]:
-            cd["my_id"] = SecurityMaster.generate_my_id(cd["asset_class"])
+        if self._is_my_id_required():
+            cd["my_id"] = SecurityMaster.AssetClass.get_my_id_prefix(cd["asset_class"]) + "0000000"
         if cd["asset_class"] == SecurityMaster.AssetClass.OPTION.label:
             fld_list = ["underlying_security", "expiration_date", "option_type", "strike_price", "contract_size"]
             if any([cd[x] is None for x in fld_list]):
@@ -67,3 +71,12 @@ class SecurityMasterAdminForm(forms.ModelForm):
                     cd[f] = cd[f] if cd[f] is not None else val_list[i]
 
         return self.cleaned_data
+
+    def save(self, commit=True):
+        """ Override save to generate my_id if creating new SecurityMaster object or changing asset_class """
+        if self._is_my_id_required():
+            self.instance.my_id = SecurityMaster.generate_my_id(self.instance.asset_class)
+        return super().save(commit=commit)
+
+    def _is_my_id_required(self):
+        return len(self.initial) == 0 or self.initial["asset_class"] != self.cleaned_data["asset_class"]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investing', '0034_alter_position_cost_basis_price_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='action_type',
+            field=models.CharField(choices=[('BUY', 'Buy'), ('BUY_COVER', 'Buy Cover'), ('CONVERSION', 'Conversion'), ('COUP_PMT', 'Coupon Payment'), ('DIVIDEND', 'Dividend'), ('FEE', 'Fee'), ('INT_PMT', 'Interest Payment'), ('LOAN', 'Loan'), ('MERGER_OLD', 'Merger Old'), ('MERGER_NEW', 'Merger New'), ('OPT_EXER', 'Option Exercise'), ('OPT_EXP', 'Option Expire'), ('SELL', 'Sell'), ('SELL_SHORT', 'Sell Short'), ('SPINOFF', 'Spin-Off'), ('STOCK_CONS', 'Stock Consolidation'), ('STOCK_DIV', 'Stock Dividend'), ('STOCK_SPLIT', 'Stock Split'), ('TRANSFER', 'Transfer')], max_length=11),
+        ),
+        migrations.CreateModel(
+            name='PositionInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('valid_from', models.DateField()),
+                ('valid_to', models.DateField()),
+                ('quantity', models.DecimalField(decimal_places=4, max_digits=12)),
+                ('enter_date', models.DateField(blank=True, help_text='Required if broker breaks position into lots.', null=True)),
+                ('enter_price', models.DecimalField(decimal_places=4, max_digits=9)),
+                ('enter_total', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('enter_price_net', models.DecimalField(decimal_places=4, max_digits=9)),
+                ('enter_total_net', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('cost_basis_price', models.DecimalField(blank=True, decimal_places=4, max_digits=9, null=True)),
+                ('cost_basis_total', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('investment_account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='investing.investmentaccount')),
+                ('security', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='investing.securitymaster')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['investment_account', 'valid_to', 'valid_from'], name='investing_p_investm_232d72_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='positioninterval',
+            constraint=models.CheckConstraint(check=models.Q(('valid_from__lte', models.F('valid_to'))), name='check_investing_positioninterval_valid_from_valid_to'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investing', '0035_positioninterval'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='position',
+            index=models.Index(fields=['investment_account', 'eod_date', 'security'], name='investing_p_investm_3dfb7e_idx'),
+        ),
+    ]
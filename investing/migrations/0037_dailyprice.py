@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investing', '0036_position_as_of_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_date', models.DateField()),
+                ('close', models.DecimalField(decimal_places=4, max_digits=9)),
+                ('security', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='investing.securitymaster')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyprice',
+            constraint=models.UniqueConstraint(fields=('security', 'price_date'), name='unique_investing_dailyprice_security_pricedate'),
+        ),
+    ]
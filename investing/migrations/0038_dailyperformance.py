@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investing', '0037_dailyprice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPerformance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('eod_date', models.DateField()),
+                ('market_value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('cash_flow', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('pnl', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('cumulative_pnl', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('daily_return', models.DecimalField(decimal_places=8, max_digits=14)),
+                ('twr', models.DecimalField(decimal_places=8, max_digits=14)),
+                ('investment_account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='investing.investmentaccount')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyperformance',
+            constraint=models.UniqueConstraint(fields=('investment_account', 'eod_date'), name='unique_investing_dailyperformance_investmentaccount_eoddate'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:39
+
+from django.db import migrations, models
+import pandas as pd
+
+import util.pandasutil as PdUtil
+
+
+def backfill_content_hash(apps, schema_editor):
+    # same columns as Transaction.content_hash_srs() and ClosedPosition.content_hash_srs(). rows are hashed in pk order
+    # which is the order they were loaded from files
+    model_cols_list = [
+        ("Transaction", ["investment_account", "trans_date", "trans_type", "action_type", "description"],
+         ["quantity", "price", "amount_net", "commission", "fees"]),
+        ("ClosedPosition", ["investment_account", "enter_date", "close_date"],
+         ["quantity", "enter_price_net", "close_price_net", "cost_basis_price", "cost_basis_total", "proceeds_price",
+          "proceeds_total", "short_term_pnl", "long_term_pnl", "cost_basis_price_unadj", "cost_basis_total_unadj",
+          "short_term_pnl_unadj", "long_term_pnl_unadj"])]
+    for model_name, cols, dec_cols in model_cols_list:
+        model = apps.get_model("investing", model_name)
+        cols = cols + dec_cols
+        df = pd.DataFrame(list(model.objects.order_by("pk").values_list("pk", *cols)), columns=["pk"] + cols)
+        if len(df) == 0:
+            continue
+        for col in dec_cols:
+            dp = model._meta.get_field(col).decimal_places
+            df[col] = pd.Series([None if x is None else int(x.scaleb(dp)) for x in df[col]], dtype=object)
+
+        hash_srs = PdUtil.row_hashes(df[cols])
+        model.objects.bulk_update([model(pk=pk, content_hash=h) for pk, h in zip(df["pk"], hash_srs)],
+                                  ["content_hash"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investing', '0038_dailyperformance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='closedposition',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='closedposition',
+            index=models.Index(fields=['investment_account', 'close_date'], name='investing_c_investm_dcf3f2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['investment_account', 'trans_date'], name='investing_t_investm_93c78f_idx'),
+        ),
+    ]
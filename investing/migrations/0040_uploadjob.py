@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investing', '0039_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_type', models.CharField(choices=[('CLOSED_POSITION', 'CLOSED_POSITION'), ('TRANSACTION', 'TRANSACTION')], max_length=20)),
+                ('broker', models.CharField(choices=[('FIDELITY', 'FIDELITY')], max_length=30)),
+                ('filename', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('QUEUED', 'QUEUED'), ('RUNNING', 'RUNNING'), ('SUCCEEDED', 'SUCCEEDED'), ('FAILED', 'FAILED')], default='QUEUED', max_length=10)),
+                ('progress', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('start_time', models.DateTimeField(blank=True, null=True)),
+                ('end_time', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-create_time'],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investing', '0040_uploadjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MyIdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asset_class', models.CharField(choices=[('BOND', 'BOND'), ('CRYPTO', 'CRYPTO'), ('EQUITY', 'EQUITY'), ('INDEX', 'INDEX'), ('FX', 'FX'), ('MUTUAL_FUND', 'MUTUAL_FUND'), ('NOT_SET', 'NOT_SET'), ('OPTION', 'OPTION')], max_length=20, unique=True)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 08:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investing', '0041_myidsequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyprice',
+            name='high',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailyprice',
+            name='low',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailyprice',
+            name='open',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailyprice',
+            name='volume',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-17 08:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investing', '0042_dailyprice_ohlcv'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='closedposition',
+            name='upload_job',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='investing.uploadjob'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='upload_job',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='investing.uploadjob'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investing', '0043_transaction_closedposition_upload_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='heartbeat_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from .closedposition import ClosedPosition
+from .dailyprice import DailyPrice
 from .investmentaccount import InvestmentAccount
 from .newssentiment import TopicSentiment, TickerSentiment, NewsSentiment
-from .position import Position
+from .performance import DailyPerformance
+from .position import Position, PositionInterval
 from .securitymaster import SecurityMaster
 from .transaction import Transaction
+from .uploadjob import UploadJob
@@ -10,13 +10,15 @@ import pandas as pd
 
 from ..models.investmentaccount import Broker, InvestmentAccount
 from ..models.securitymaster import SecurityMaster
+import util.fixedpointutil as FpUtil
+import util.pandasutil as PdUtil
 
 
 class ClosedPositionManager(models.Manager):
     def full_constructor(self, investment_account, enter_date, close_date, security, quantity, enter_price_net,
                          close_price_net, cost_basis_price, cost_basis_total, proceeds_price, proceeds_total,
                          short_term_pnl, long_term_pnl, cost_basis_price_unadj, cost_basis_total_unadj,
-                         short_term_pnl_unadj, long_term_pnl_unadj, create=True):
+                         short_term_pnl_unadj, long_term_pnl_unadj, content_hash=None, create=True):
         """ Instantiate ClosedPosition instance with option to save to database
 
         Args:
@@ -32,7 +34,8 @@ class ClosedPositionManager(models.Manager):
             cost_basis_price=cost_basis_price, cost_basis_total=cost_basis_total, proceeds_price=proceeds_price,
             proceeds_total=proceeds_total, short_term_pnl=short_term_pnl, long_term_pnl=long_term_pnl,
             cost_basis_price_unadj=cost_basis_price_unadj, cost_basis_total_unadj=cost_basis_total_unadj,
-            short_term_pnl_unadj=short_term_pnl_unadj, long_term_pnl_unadj=long_term_pnl_unadj)
+            short_term_pnl_unadj=short_term_pnl_unadj, long_term_pnl_unadj=long_term_pnl_unadj,
+            content_hash=content_hash)
 
 
 class ClosedPosition(models.Model):
@@ -66,7 +69,12 @@ class ClosedPosition(models.Model):
             even if position was held short term
         long_term_pnl_unadj (Decimal): long term pnl before wash sale adjustment. non taxable accounts always show pnl
             here for all position (those held short term and long term)
+        content_hash (Optional[str]): sha256 hex digest of the row content for closed positions loaded from a file.
+            used to skip closed positions that were already loaded. None for closed positions not loaded from a file
+        upload_job (Optional[UploadJob]): job that loaded the closed position. None if not loaded by an upload job
     """
+    class Meta:
+        indexes = [models.Index(fields=["investment_account", "close_date"])]
 
     investment_account = models.ForeignKey(InvestmentAccount, models.PROTECT)
     enter_date = models.DateField()
@@ -85,6 +93,8 @@ class ClosedPosition(models.Model):
     cost_basis_total_unadj = models.DecimalField(max_digits=13, decimal_places=3)
     short_term_pnl_unadj = models.DecimalField(max_digits=13, decimal_places=3)
     long_term_pnl_unadj = models.DecimalField(max_digits=13, decimal_places=3)
+    content_hash = models.CharField(max_length=64, unique=True, blank=True, null=True, editable=False)
+    upload_job = models.ForeignKey("UploadJob", models.SET_NULL, blank=True, null=True, editable=False)
 
     objects = ClosedPositionManager()
 
@@ -111,7 +121,27 @@ class ClosedPosition(models.Model):
                                   "accounts must be entered in long term pnl fields")
 
     @classmethod
-    def load_closed_positions_from_fidelity_file(cls, file):
+    def content_hash_srs(cls, pos_df):
+        """ Create content hashes of closed positions
+
+        Security is not included so a ticker change does not change the hash. Identical closed positions are numbered
+        in order (see PdUtil.row_hashes()) so each gets a different hash.
+
+        Args:
+            pos_df (pd.DataFrame): columns investment_account (pk), enter_date, close_date (datetime.date) and all
+                decimal fields scaled to ints by field decimal places
+
+        Returns:
+            pd.Series: sha256 hex digests (str) with pos_df index
+        """
+        return PdUtil.row_hashes(pos_df[[
+            "investment_account", "enter_date", "close_date", "quantity", "enter_price_net", "close_price_net",
+            "cost_basis_price", "cost_basis_total", "proceeds_price", "proceeds_total", "short_term_pnl",
+            "long_term_pnl", "cost_basis_price_unadj", "cost_basis_total_unadj", "short_term_pnl_unadj",
+            "long_term_pnl_unadj"]])
+
+    @classmethod
+    def load_closed_positions_from_fidelity_file(cls, file, bulk=False, batch_size=5000, progress_func=None):
         """ Open Fidelity file and create and return closed positions
 
         File must be csv from Fidelity Active Trader Pro -> Accounts -> Closed Positions.
@@ -123,27 +153,37 @@ class ClosedPosition(models.Model):
         "Unadj Long-Term G/L", "Unadj Date Acquired".
         Closed positions must be expanded to show the lots.
         Do not remove the last two lines (total line and line of "")
+        Each lot's content is hashed (see content_hash_srs()). Lots with a content hash that is already saved are not
+        created, so files with overlapping dates can be loaded and a partially loaded date is completed by loading it
+        again. Files are expected to have all lots of each close date in the file since identical lots are told apart
+        by their order.
+        Bulk mode: the rules checked by save() are checked for all new closed positions at once before any securities
+            are created, then closed positions are saved with bulk_create, one atomic transaction per batch of
+            batch_size. if a batch fails, earlier batches stay saved and the file can be loaded again to save the rest.
 
         Args:
             file (Union[str, django.core.files.base.File]): name of file in media directory
                 /files/input/closedpositions/ or a File object. file is expected to be csv
+            bulk (boolean): True to validate all closed positions at once and save with bulk_create. Default False to
+                save closed positions one at a time
+            batch_size (int): number of closed positions per batch in bulk mode. Default 5000
+            progress_func (Optional[Callable[[int, int], None]]): called in bulk mode after each batch is saved with the
+                number of closed positions saved so far and the total number to save. Default None
 
         Returns:
             tuple[list[ClosedPosition], list[SecurityMaster], set[tuple[InvestmentAccount, datetime.date]]]:
-                ClosedPosition instances with investment account / close date combinations that have no records are
-                saved to the database, SecurityMaster list contains securities that did not exist but were created and
-                set to default, set of investment account / close date combinations that have records in the
-                database already (we dont want to create multiple copies of the same closed position)
+                ClosedPosition instances with new content hashes are saved to the database, SecurityMaster list
+                contains securities that did not exist but were created and set to default, set of investment account
+                / close date combinations with closed positions that were saved already and were not created again
 
         Raises:
-            DatabaseError: if atomic transaction to save all positions fails
+            DatabaseError: if saving positions fails. all positions are saved in one atomic transaction unless bulk
+                is True
             ObjectDoesNotExist: if investment account not found
+            ValidationError: if a closed position in a non taxable account has short term pnl
             ValueError: if a closed position is not expanded into lots
         """
-        dp_dict = {}
-        for f in ClosedPosition._meta.get_fields():
-            if isinstance(f, models.DecimalField):
-                dp_dict[f.name] = f.decimal_places
+        dp_dict = FpUtil.decimal_places_dict(ClosedPosition)
 
         df = pd.read_csv(file, names=list(range(14)))
         df.columns = df.loc[9]
@@ -189,52 +229,64 @@ class ClosedPosition(models.Model):
             "Long-Term G/L": "long_term_pnl", "Unadj Basis/Share": "cost_basis_price_unadj",
             "Unadj Basis": "cost_basis_total_unadj", "Unadj Short-Term G/L": "short_term_pnl_unadj",
             "Unadj Long-Term G/L": "long_term_pnl_unadj"})
+        scaled_dict = {}
         for col in df.columns[4:]:
-            df[col] = df[col].replace("--", "0").str.replace(",", "").map(lambda x: round(Decimal(x), dp_dict[col]))
+            scaled_dict[col] = FpUtil.str_to_scaled(
+                df[col].replace("--", "0").str.replace(",", "", regex=False), dp_dict[col])
+            df[col] = FpUtil.from_scaled(scaled_dict[col], dp_dict[col])
 
         acc_dict = InvestmentAccount.objects.field_to_account_dict(
             "account_id", df["Account ID"].drop_duplicates().tolist(), Broker.FIDELITY)
-        sec_dict = SecurityMaster.objects.field_to_security_dict("ticker", df["Symbol"].drop_duplicates().tolist())
-
-        # investment account and close date combinations that have closed position(s) saved already
-        rem_acc_dates = list(ClosedPosition.objects.values("investment_account", "close_date").distinct())
-        rem_acc_dates = [(d["investment_account"], d["close_date"]) for d in rem_acc_dates]
 
-        sec_ns_list = []
+        missing_acc_rows = ~df["Account ID"].isin(acc_dict.keys())
+        if missing_acc_rows.any():
+            raise ObjectDoesNotExist("Account ID: " + str(df.loc[missing_acc_rows, "Account ID"].iloc[0]) +
+                                     " does not exist as a " + str(Broker.FIDELITY) + " account")
+
+        df["Content Hash"] = ClosedPosition.content_hash_srs(pd.DataFrame(dict(
+            investment_account=df["Account ID"].map({acc_id: acc.pk for acc_id, acc in acc_dict.items()}),
+            enter_date=df["Enter Date"], close_date=df["Close Date"], **scaled_dict), index=df.index))
+        # one lookup of saved hashes limited to the accounts and close dates in the file
+        exist_hash_set = set(ClosedPosition.objects.filter(
+            investment_account__in=list(acc_dict.values()), close_date__gte=df["Close Date"].min(),
+            close_date__lte=df["Close Date"].max(), content_hash__isnull=False).values_list("content_hash", flat=True))
+        exist_rows = df["Content Hash"].isin(exist_hash_set)
+        exist_inv_acc_dates_set = {
+            (acc_dict[acc_id], close_date) for acc_id, close_date in
+            df.loc[exist_rows, ["Account ID", "Close Date"]].drop_duplicates().itertuples(index=False)}
+        df = df[~exist_rows]
+
+        if bulk:
+            ClosedPosition.validate_df(pd.DataFrame({
+                "investment_account": df["Account ID"].map(acc_dict), "short_term_pnl": df["short_term_pnl"],
+                "short_term_pnl_unadj": df["short_term_pnl_unadj"]}))
+
+        sec_dict, sec_ns_list = SecurityMaster.objects.get_or_create_defaults(df["Symbol"].drop_duplicates().tolist())
         pos_list = []
-        exist_inv_acc_dates_set = set()
-        for ind, row in df.iterrows():
-            try:
-                inv_acc = acc_dict[row["Account ID"]]
-            except KeyError:
-                raise ObjectDoesNotExist("Account ID: " + row["Account ID"] + " does not exist as a " +
-                                         str(Broker.FIDELITY) + " account")
-
-            # don't keep closed position if its investment account and close date combo has saved closed position(s)
-            if (inv_acc.pk, row["Close Date"]) in rem_acc_dates:
-                exist_inv_acc_dates_set.add((inv_acc, row["Close Date"]))
-                continue
-
-            security = sec_dict.get(row["Symbol"], None)
-            if security is None:
-                security = SecurityMaster.objects.get_or_create_default(row["Symbol"])
-                sec_ns_list.append(security)
-                sec_dict[row["Symbol"]] = security
-
+        for row in df.to_dict("records"):
             pos_list.append(ClosedPosition.objects.full_constructor(
-                inv_acc, row["Enter Date"], row["Close Date"], security, row["quantity"], row["enter_price_net"],
-                row["close_price_net"], row["cost_basis_price"], row["cost_basis_total"], row["proceeds_price"],
-                row["proceeds_total"], row["short_term_pnl"], row["long_term_pnl"], row["cost_basis_price_unadj"],
-                row["cost_basis_total_unadj"], row["short_term_pnl_unadj"], row["long_term_pnl_unadj"], create=False))
-
-        with transaction.atomic():
-            for pos in pos_list:
-                pos.save()
+                acc_dict[row["Account ID"]], row["Enter Date"], row["Close Date"], sec_dict[row["Symbol"]],
+                row["quantity"], row["enter_price_net"], row["close_price_net"], row["cost_basis_price"],
+                row["cost_basis_total"], row["proceeds_price"], row["proceeds_total"], row["short_term_pnl"],
+                row["long_term_pnl"], row["cost_basis_price_unadj"], row["cost_basis_total_unadj"],
+                row["short_term_pnl_unadj"], row["long_term_pnl_unadj"], content_hash=row["Content Hash"],
+                create=False))
+
+        if bulk:
+            for start in range(0, len(pos_list), batch_size):
+                with transaction.atomic():
+                    ClosedPosition.objects.bulk_create(pos_list[start:start + batch_size])
+                if progress_func is not None:
+                    progress_func(min(start + batch_size, len(pos_list)), len(pos_list))
+        else:
+            with transaction.atomic():
+                for pos in pos_list:
+                    pos.save()
 
         return pos_list, sec_ns_list, exist_inv_acc_dates_set
 
     @classmethod
-    def load_closed_positions_from_file(cls, broker, file):
+    def load_closed_positions_from_file(cls, broker, file, bulk=False, batch_size=5000, progress_func=None):
         """ Open file and create and return closed positions
 
         If a ticker/symbol is not found, a default SecurityMaster object for that ticker/symbol will be created
@@ -243,13 +295,17 @@ class ClosedPosition(models.Model):
             broker (Broker): load closed positions from this broker
             file (Union[str, django.core.files.base.File]): name of file in media directory
                 /files/input/closedpositions/ or a File object.
+            bulk (boolean): True to validate all closed positions at once and save with bulk_create. Default False to
+                save closed positions one at a time
+            batch_size (int): number of closed positions per batch in bulk mode. Default 5000
+            progress_func (Optional[Callable[[int, int], None]]): called in bulk mode after each batch is saved with the
+                number of closed positions saved so far and the total number to save. Default None
 
         Returns:
             tuple[list[ClosedPosition], list[SecurityMaster], set[tuple[InvestmentAccount, datetime.date]]]:
-                ClosedPosition instances with investment account / close date combinations that have no records are
-                saved to the database, SecurityMaster list contains securities that did not exist but were created and
-                set to default, set of investment account / close date combinations that have records in the
-                database already (we dont want to create multiple copies of the same closed position)
+                ClosedPosition instances with new content hashes are saved to the database, SecurityMaster list
+                contains securities that did not exist but were created and set to default, set of investment account
+                / close date combinations with closed positions that were saved already and were not created again
 
         Raises:
             DatabaseError: if a function called from this function raises a DatabaseError
@@ -266,6 +322,24 @@ class ClosedPosition(models.Model):
             file = settings.MEDIA_ROOT + "/files/input/closedpositions/" + file
 
         if broker == Broker.FIDELITY:
-            return cls.load_closed_positions_from_fidelity_file(file)
+            return cls.load_closed_positions_from_fidelity_file(file, bulk=bulk, batch_size=batch_size,
+                                                                progress_func=progress_func)
         else:
-            raise NotImplementedError("broker not set in load_closed_positions_from_file()")
\ No newline at end of file
+            raise NotImplementedError("broker not set in load_closed_positions_from_file()")
+
+    @classmethod
+    def validate_df(cls, pos_df):
+        """ Check the rules checked by save() for all closed positions at once
+
+        Args:
+            pos_df (pd.DataFrame): columns investment_account (InvestmentAccount), short_term_pnl, short_term_pnl_unadj
+                (Decimal)
+
+        Raises:
+            ValidationError: if a closed position in a non taxable account has short term pnl. same message as save()
+        """
+        bad_rows = ~pos_df["investment_account"].map(lambda x: x.taxable).astype(bool) & \
+            ((pos_df["short_term_pnl"] != 0) | (pos_df["short_term_pnl_unadj"] != 0))
+        if bad_rows.any():
+            raise ValidationError("Non taxable accounts must have short term pnl fields set to 0. pnl for non taxable "
+                                  "accounts must be entered in long term pnl fields")
@@ -0,0 +1,184 @@
+from decimal import Decimal
+import datetime
+
+import numpy as np
+from django.db import connections, models
+import pandas as pd
+
+from .securitymaster import SecurityMaster
+from ..dataprovider.alphavantage import AlphaVantage, OutputSize
+
+
+class DailyPriceManager(models.Manager):
+    def close_price_df(self, securities, start_date, end_date):
+        """ Create DataFrame of close prices for securities from start_date through end_date
+
+        The latest close price on or before start_date is also included for each security so prices can be forward
+        filled from start_date.
+
+        Args:
+            securities (Union[list[SecurityMaster], list[int]]): securities or security pks
+            start_date (datetime.date):
+            end_date (datetime.date):
+
+        Returns:
+            pd.DataFrame: columns security (pk, int64), price_date (datetime64[ns]), close (Decimal) sorted by
+                price_date, security
+        """
+        first_date_qs = self.filter(security=models.OuterRef("security"), price_date__lte=start_date).order_by(
+            "-price_date").values("price_date")[:1]
+        dp_qs = self.filter(security__in=securities, price_date__lte=end_date).alias(
+            first_date=models.Subquery(first_date_qs)).filter(
+            models.Q(price_date__gte=models.F("first_date")) | models.Q(first_date__isnull=True))
+
+        price_df = pd.DataFrame.from_records(
+            list(dp_qs.order_by("price_date", "security").values_list("security", "price_date", "close")),
+            columns=["security", "price_date", "close"])
+        price_df = price_df.astype({"security": "int64"})
+        price_df["price_date"] = pd.to_datetime(price_df["price_date"])
+
+        return price_df
+
+    def load_alphavantage_daily(self, security, output_size=OutputSize.COMPACT):
+        """ Create or update daily bars for security from AlphaVantage daily (not adjusted) time series
+
+        Args:
+            security (SecurityMaster):
+            output_size (OutputSize): Default OutputSize.COMPACT for the latest 100 prices. OutputSize.FULL for all
+                prices
+
+        Returns:
+            list[DailyPrice]: prices created or updated
+
+        Raises:
+            DataProviderException: if api request returns an error
+        """
+        av_df = AlphaVantage().daily(security.ticker, adjusted=False, output_size=output_size)
+        return self._upsert(self._alphavantage_daily_prices(security, av_df))
+
+    def sync_alphavantage_daily(self, securities, today=None, max_workers=4):
+        """ Create or update daily bars for securities from AlphaVantage daily (not adjusted) time series
+
+        Only bars that are new or changed are saved. Securities whose latest saved bar is within the last
+        DailyPrice.COMPACT_BARS business days request OutputSize.COMPACT (the latest 100 bars). Securities without bars
+        or with older bars request OutputSize.FULL. Requests are sent concurrently with AlphaVantage.daily_batch()
+
+        Args:
+            securities (list[SecurityMaster]):
+            today (Optional[datetime.date]): Default None for today
+            max_workers (int): max concurrent requests. Default 4
+
+        Returns:
+            tuple[dict[str, int], dict[str, Exception]]: ticker to number of bars created or updated for securities
+                that were synced, ticker to exception for securities whose request failed
+        """
+        today = datetime.date.today() if today is None else today
+        last_date_dict = dict(self.filter(security__in=securities).values("security").annotate(
+            last_date=models.Max("price_date")).values_list("security", "last_date"))
+        sec_list_dict = {OutputSize.COMPACT: [], OutputSize.FULL: []}
+        for sec in securities:
+            last_date = last_date_dict.get(sec.pk)
+            # business days are never fewer than trading days so a compact request always reaches last_date
+            is_compact = last_date is not None and np.busday_count(last_date, today) < DailyPrice.COMPACT_BARS
+            sec_list_dict[OutputSize.COMPACT if is_compact else OutputSize.FULL].append(sec)
+
+        av = AlphaVantage()
+        count_dict = {}
+        error_dict = {}
+        dp_list = []
+        for output_size, sec_list in sec_list_dict.items():
+            if not sec_list:
+                continue
+            av_df_dict, av_error_dict = av.daily_batch([sec.ticker for sec in sec_list], adjusted=False,
+                                                       output_size=output_size, max_workers=max_workers)
+            error_dict.update(av_error_dict)
+            sec_dp_dict = {sec: self._alphavantage_daily_prices(sec, av_df_dict[sec.ticker])
+                           for sec in sec_list if sec.ticker in av_df_dict}
+            if not sec_dp_dict:
+                continue
+
+            # one query for the saved bars in the downloaded date range of all securities
+            first_date = min([dp.price_date for sec_dp_list in sec_dp_dict.values() for dp in sec_dp_list],
+                             default=today)
+            exist_set = set(self.filter(security__in=list(sec_dp_dict), price_date__gte=first_date).values_list(
+                "security", "price_date", "open", "high", "low", "close", "volume"))
+            for sec, sec_dp_list in sec_dp_dict.items():
+                sec_dp_list = [dp for dp in sec_dp_list if (sec.pk, dp.price_date, dp.open, dp.high, dp.low, dp.close,
+                                                            dp.volume) not in exist_set]
+                count_dict[sec.ticker] = len(sec_dp_list)
+                dp_list.extend(sec_dp_list)
+
+        self._upsert(dp_list)
+        return count_dict, error_dict
+
+    def _alphavantage_daily_prices(self, security, av_df):
+        """ Create (not saved) daily prices from AlphaVantage daily (not adjusted) time series
+
+        Args:
+            security (SecurityMaster):
+            av_df (pd.DataFrame): See AlphaVantage.daily()
+
+        Returns:
+            list[DailyPrice]:
+        """
+        dec_places = DailyPrice._meta.get_field("close").decimal_places
+        return [DailyPrice(security=security, price_date=row.timestamp, open=round(Decimal(str(row.open)), dec_places),
+                           high=round(Decimal(str(row.high)), dec_places), low=round(Decimal(str(row.low)), dec_places),
+                           close=round(Decimal(str(row.close)), dec_places), volume=int(row.volume))
+                for row in av_df.itertuples(index=False)]
+
+    def _upsert(self, dp_list):
+        """ Create daily prices or update existing prices with the same security and price date
+
+        Args:
+            dp_list (list[DailyPrice]):
+
+        Returns:
+            list[DailyPrice]: dp_list
+        """
+        # mysql does not allow unique fields to be specified. the unique constraint is used
+        unique_fields = ["security", "price_date"] \
+            if connections[self.db].features.supports_update_conflicts_with_target else None
+        return self.bulk_create(dp_list, update_conflicts=True, unique_fields=unique_fields,
+                                update_fields=["open", "high", "low", "close", "volume"])
+
+
+class DailyPrice(models.Model):
+    """ Daily Price Model
+
+    Daily bars. End of day close prices are used to value positions
+
+    Class Attributes:
+        COMPACT_BARS (int): number of latest bars returned by an OutputSize.COMPACT request
+
+    Attributes:
+        security (SecurityMaster):
+        price_date (datetime.date):
+        open (Optional[Decimal]): NOT ADJUSTED. None for prices saved before bars were loaded
+        high (Optional[Decimal]): NOT ADJUSTED. None for prices saved before bars were loaded
+        low (Optional[Decimal]): NOT ADJUSTED. None for prices saved before bars were loaded
+        close (Decimal): actual close price at the end of day. NOT ADJUSTED
+        volume (Optional[int]): None for prices saved before bars were loaded
+    """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["security", "price_date"],
+                                    name="unique_%(app_label)s_%(class)s_security_pricedate")]
+
+    COMPACT_BARS = 100
+
+    security = models.ForeignKey(SecurityMaster, models.PROTECT)
+    price_date = models.DateField()
+    open = models.DecimalField(max_digits=9, decimal_places=4, blank=True, null=True)
+    high = models.DecimalField(max_digits=9, decimal_places=4, blank=True, null=True)
+    low = models.DecimalField(max_digits=9, decimal_places=4, blank=True, null=True)
+    close = models.DecimalField(max_digits=9, decimal_places=4)
+    volume = models.BigIntegerField(blank=True, null=True)
+
+    objects = DailyPriceManager()
+
+    def __repr__(self):
+        return repr(self.security) + ", " + repr(self.price_date) + ", " + repr(self.close)
+
+    def __str__(self):
+        return self.security.ticker + ", " + str(self.price_date) + ", " + str(self.close)
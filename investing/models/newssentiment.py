@@ -127,11 +127,13 @@ class TickerSentimentLabel(models.TextChoices):
 
 class TickerSentimentDataManager(models.Manager):
 
-    def alphavantage_ticker_sentiment_constructor(self, av_ts):
+    def alphavantage_ticker_sentiment_constructor(self, av_ts, sec_dict=None):
         """ Create a new TickerSentiment object from an AlphaVantage TickerSentiment object
 
         Args:
             av_ts (AVTickerSentiment):
+            sec_dict (Optional[dict[str, SecurityMaster]]): ticker to SecurityMaster object cache. See
+                SecurityMasterDataManager.get_or_create_defaults(). Default None to get or create the security
 
         Returns:
             TickerSentiment: created object
@@ -141,9 +143,12 @@ class TickerSentimentDataManager(models.Manager):
                 KeyError if ticker_sentiment_label does not match a label in TickerSentimentLabel
                 ValidationError if ticker_sentiment_score is not in the correct range for the ticker_sentiment_label
         """
+        security = None if sec_dict is None else sec_dict.get(av_ts.ticker)
+        if security is None:
+            security = SecurityMaster.objects.get_or_create_default(ticker=av_ts.ticker)
         return self.get_or_create(
-            security_master=SecurityMaster.objects.get_or_create_default(ticker=av_ts.ticker), ticker=av_ts.ticker,
-            relevance_score=av_ts.relevance_score, ticker_sentiment_score=av_ts.ticker_sentiment_score,
+            security_master=security, ticker=av_ts.ticker, relevance_score=av_ts.relevance_score,
+            ticker_sentiment_score=av_ts.ticker_sentiment_score,
             ticker_sentiment_label=TickerSentimentLabel(av_ts.ticker_sentiment_label.value))[0]
 
 
@@ -195,11 +200,16 @@ class TickerSentiment(models.Model):
 
 class NewsSentimentDataManager(models.Manager):
 
-    def alphavantage_news_sentiment_constructor(self, av_ns):
+    def alphavantage_news_sentiment_constructor(self, av_ns, sec_dict=None):
         """ Create a new NewsSentiment object from an AlphaVantage NewsSentiment object
 
+        Securities of all ticker sentiments are fetched or created in bulk. Pass the same sec_dict when constructing
+        many articles so each ticker is resolved once.
+
         Args:
             av_ns (AVNewsSentiment):
+            sec_dict (Optional[dict[str, SecurityMaster]]): ticker to SecurityMaster object cache. See
+                SecurityMasterDataManager.get_or_create_defaults(). Default None
 
         Returns:
             NewsSentiment: created object
@@ -218,8 +228,11 @@ class NewsSentimentDataManager(models.Manager):
             overall_sentiment_score=av_ns.overall_sentiment_score,
             overall_sentiment_label=TickerSentimentLabel(av_ns.overall_sentiment_label.value))[0]
         ns.topics.set([TopicSentiment.objects.alphavantage_topic_sentiment_constructor(t) for t in av_ns.topics])
-        ns.ticker_sentiments.set(
-            [TickerSentiment.objects.alphavantage_ticker_sentiment_constructor(t) for t in av_ns.ticker_sentiments])
+        sec_dict = SecurityMaster.objects.get_or_create_defaults(
+            [t.ticker for t in av_ns.ticker_sentiments], sec_dict=sec_dict)[0]
+        ns.ticker_sentiments.set([
+            TickerSentiment.objects.alphavantage_ticker_sentiment_constructor(t, sec_dict=sec_dict)
+            for t in av_ns.ticker_sentiments])
         return ns
 
 
@@ -0,0 +1,257 @@
+import logging
+
+import numpy as np
+from django.db import models, transaction
+import pandas as pd
+
+from ..models.investmentaccount import InvestmentAccount
+from ..models.position import Position
+from ..models.securitymaster import SecurityMaster
+from ..models.transaction import Transaction, TransactionType
+import util.fixedpointutil as FpUtil
+
+
+logger = logging.getLogger(__name__)
+
+
+class DailyPerformanceManager(models.Manager):
+    def last_performance_dict(self, investment_accounts):
+        """ Create dict of investment account pk to the latest cached performance for that account
+
+        Args:
+            investment_accounts (list[InvestmentAccount]):
+
+        Returns:
+            dict[int, DailyPerformance]: investment account pk (keys) to latest performance (values). accounts without
+                cached performance are not included
+        """
+        last_date_qs = self.filter(investment_account=models.OuterRef("investment_account")).order_by(
+            "-eod_date").values("eod_date")[:1]
+        return {dp.investment_account_id: dp for dp in self.filter(
+            investment_account__in=investment_accounts, eod_date=models.Subquery(last_date_qs))}
+
+    def series_df(self, investment_accounts, start_date=None, end_date=None, combined=False):
+        """ Create DataFrame of cached daily performance
+
+        Args:
+            investment_accounts (list[InvestmentAccount]):
+            start_date (Optional[datetime.date]): only dates on or after this date. Default None for no limit
+            end_date (Optional[datetime.date]): only dates on or before this date. Default None for no limit
+            combined (boolean): True to combine all investment_accounts into one series. market_value, cash_flow and pnl
+                are summed by end of day date and returns are calculated from the sums. Default False for one series per
+                account
+
+        Returns:
+            pd.DataFrame: columns investment_account (pk, not included if combined), eod_date (datetime64[ns]),
+                market_value, cash_flow, pnl, cumulative_pnl (Decimal), daily_return, twr (float64) sorted by account,
+                eod_date. if combined, cumulative_pnl and twr start from start_date
+        """
+        dp_qs = self.filter(investment_account__in=investment_accounts)
+        if end_date is not None:
+            dp_qs = dp_qs.filter(eod_date__lte=end_date)
+
+        if combined:
+            # returns need the combined market value on the day before start_date so all dates are combined
+            row_list = list(dp_qs.values("eod_date").annotate(
+                models.Sum("market_value"), models.Sum("cash_flow"), models.Sum("pnl")).order_by(
+                "eod_date").values_list("eod_date", "market_value__sum", "cash_flow__sum", "pnl__sum"))
+            perf_df = pd.DataFrame(row_list, columns=["eod_date", "market_value", "cash_flow", "pnl"])
+            dp = DailyPerformance._meta.get_field("market_value").decimal_places
+            mv_arr = FpUtil.to_scaled(perf_df["market_value"], dp)
+            cf_arr = FpUtil.to_scaled(perf_df["cash_flow"], dp)
+            pnl_arr = FpUtil.to_scaled(perf_df["pnl"], dp)
+            perf_df["daily_return"] = DailyPerformance.daily_returns(np.concatenate([[0], mv_arr[:-1]]), cf_arr,
+                                                                     pnl_arr)
+            if start_date is not None:
+                perf_df = perf_df[perf_df["eod_date"] >= start_date].reset_index(drop=True)
+                pnl_arr = pnl_arr[len(pnl_arr) - len(perf_df):]
+            perf_df["cumulative_pnl"] = FpUtil.from_scaled(np.cumsum(pnl_arr), dp)
+            perf_df["twr"] = np.cumprod(1 + perf_df["daily_return"].to_numpy(dtype=np.float64)) - 1
+            perf_df = perf_df[["eod_date", "market_value", "cash_flow", "pnl", "cumulative_pnl", "daily_return",
+                               "twr"]]
+        else:
+            if start_date is not None:
+                dp_qs = dp_qs.filter(eod_date__gte=start_date)
+            col_list = ["investment_account", "eod_date", "market_value", "cash_flow", "pnl", "cumulative_pnl",
+                        "daily_return", "twr"]
+            perf_df = pd.DataFrame(list(dp_qs.order_by("investment_account", "eod_date").values_list(*col_list)),
+                                   columns=col_list)
+            perf_df = perf_df.astype({"investment_account": np.int64, "daily_return": np.float64,
+                                      "twr": np.float64})
+
+        perf_df["eod_date"] = pd.to_datetime(perf_df["eod_date"])
+        return perf_df
+
+
+class DailyPerformance(models.Model):
+    """ Daily Performance Model
+
+    Cached end of day value and returns of an investment account calculated from positions and transfers. Cash flows
+    are assumed to happen at the start of the day so the daily return is pnl / (previous market value + cash flow).
+    Transfers of a security (in kind) are valued the same way as positions: transaction quantity * contract size * the
+    close price on or before the transfer date. their amount_net is not used because positions don't use it either.
+
+    Attributes:
+        investment_account (InvestmentAccount):
+        eod_date (datetime.date):
+        market_value (Decimal): sum of position market values (net asset value)
+        cash_flow (Decimal): external cash flow. sum of TRANSFER transaction values after the previous end of day date
+            through eod_date. amount_net for cash transfers (and security transfers without a quantity) and the
+            market value for security transfers
+        pnl (Decimal): market_value - previous market_value - cash_flow
+        cumulative_pnl (Decimal): sum of pnl through eod_date
+        daily_return (Decimal): pnl / (previous market_value + cash_flow). 0 if the denominator is not positive
+        twr (Decimal): time-weighted return through eod_date. product of (1 + daily_return) - 1
+    """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["investment_account", "eod_date"],
+                                    name="unique_%(app_label)s_%(class)s_investmentaccount_eoddate")]
+
+    investment_account = models.ForeignKey(InvestmentAccount, models.PROTECT)
+    eod_date = models.DateField()
+    market_value = models.DecimalField(max_digits=14, decimal_places=2)
+    cash_flow = models.DecimalField(max_digits=14, decimal_places=2)
+    pnl = models.DecimalField(max_digits=14, decimal_places=2)
+    cumulative_pnl = models.DecimalField(max_digits=14, decimal_places=2)
+    daily_return = models.DecimalField(max_digits=14, decimal_places=8)
+    twr = models.DecimalField(max_digits=14, decimal_places=8)
+
+    objects = DailyPerformanceManager()
+
+    def __repr__(self):
+        return repr(self.investment_account) + ", " + repr(self.eod_date) + ", " + repr(self.market_value) + ", " + \
+            repr(self.twr)
+
+    def __str__(self):
+        return self.investment_account.broker + ", " + self.investment_account.account_name + ", " + \
+            str(self.eod_date) + ", " + str(self.market_value) + ", " + str(self.twr)
+
+    @classmethod
+    def generate_performance_history(cls, investment_accounts=None, rebuild=False):
+        """ Calculate and cache daily performance for end of day dates with positions that are not cached yet
+
+        Market values are summed by account and end of day date in one grouped query and transfers in others. Each
+        account's series is extended from its latest cached date so existing dates are not recalculated. Security
+        transfers are valued with stored close prices (see DailyPerformance) so prices must be loaded first. Transfers
+        dated after an account's latest end of day date with positions are included once positions exist for a later
+        date. Positions or transfers changed on or before the latest cached date require rebuild.
+
+        Args:
+            investment_accounts (Optional[list[InvestmentAccount]]): Default None for all accounts
+            rebuild (boolean): True to delete cached performance for investment_accounts and recalculate all dates.
+                Default False to extend cached performance
+
+        Returns:
+            list[DailyPerformance]: created performance sorted by account, end of day date
+
+        Raises:
+            DatabaseError: if atomic transaction to save performance fails
+            ObjectDoesNotExist: if there are security transfers and SPAXX security is not created
+        """
+        if investment_accounts is None:
+            investment_accounts = list(InvestmentAccount.objects.all())
+        dp = DailyPerformance._meta.get_field("market_value").decimal_places
+        ret_dp = DailyPerformance._meta.get_field("twr").decimal_places
+
+        with transaction.atomic():
+            if rebuild:
+                DailyPerformance.objects.filter(investment_account__in=investment_accounts).delete()
+            last_perf_dict = DailyPerformance.objects.last_performance_dict(investment_accounts)
+
+            pos_q = trans_q = models.Q(pk__in=[])
+            for inv_acc in investment_accounts:
+                acc_pos_q = acc_trans_q = models.Q(investment_account=inv_acc)
+                if inv_acc.pk in last_perf_dict:
+                    acc_pos_q &= models.Q(eod_date__gt=last_perf_dict[inv_acc.pk].eod_date)
+                    acc_trans_q &= models.Q(trans_date__gt=last_perf_dict[inv_acc.pk].eod_date)
+                pos_q |= acc_pos_q
+                trans_q |= acc_trans_q
+            mv_df = pd.DataFrame(list(Position.objects.filter(pos_q).values("investment_account", "eod_date").annotate(
+                models.Sum("market_value")).order_by("investment_account", "eod_date").values_list(
+                "investment_account", "eod_date", "market_value__sum")),
+                columns=["investment_account", "eod_date", "market_value"])
+            cash_q = models.Q(security__isnull=True) | models.Q(quantity__isnull=True)
+            cf_df = pd.DataFrame(list(Transaction.objects.filter(trans_q, cash_q, trans_type=TransactionType.TRANSFER)
+                                      .values("investment_account", "trans_date").annotate(models.Sum("amount_net"))
+                                      .values_list("investment_account", "trans_date", "amount_net__sum")),
+                                 columns=["investment_account", "trans_date", "amount_net"])
+            cf_df = pd.concat([cf_df, DailyPerformance._security_transfer_df(trans_q & ~cash_q, dp)],
+                              ignore_index=True)
+
+            perf_list = []
+            inv_acc_dict = {inv_acc.pk: inv_acc for inv_acc in investment_accounts}
+            for acc_pk, acc_mv_df in mv_df.groupby("investment_account", sort=True):
+                last_perf = last_perf_dict.get(acc_pk)
+                eod_date_arr = acc_mv_df["eod_date"].to_numpy(dtype="datetime64[D]")
+                mv_arr = FpUtil.to_scaled(acc_mv_df["market_value"], dp)
+
+                # transfers are added to the first end of day date on or after the transfer date
+                acc_cf_df = cf_df[cf_df["investment_account"] == acc_pk]
+                date_ind_arr = np.searchsorted(eod_date_arr, acc_cf_df["trans_date"].to_numpy(dtype="datetime64[D]"))
+                in_arr = date_ind_arr < len(eod_date_arr)
+                cf_arr = np.zeros(len(eod_date_arr), dtype=np.int64)
+                np.add.at(cf_arr, date_ind_arr[in_arr], FpUtil.to_scaled(acc_cf_df["amount_net"], dp)[in_arr])
+
+                prev_mv_arr = np.concatenate(
+                    [[0 if last_perf is None else FpUtil.to_scaled([last_perf.market_value], dp)[0]], mv_arr[:-1]])
+                pnl_arr = mv_arr - prev_mv_arr - cf_arr
+                cum_pnl_arr = np.cumsum(pnl_arr) + \
+                    (0 if last_perf is None else FpUtil.to_scaled([last_perf.cumulative_pnl], dp)[0])
+                ret_arr = DailyPerformance.daily_returns(prev_mv_arr, cf_arr, pnl_arr)
+                twr_arr = (1 + (0 if last_perf is None else float(last_perf.twr))) * np.cumprod(1 + ret_arr) - 1
+
+                perf_list += [DailyPerformance(
+                    investment_account=inv_acc_dict[acc_pk], eod_date=eod_date, market_value=mv, cash_flow=cf,
+                    pnl=pnl, cumulative_pnl=cum_pnl, daily_return=ret, twr=twr)
+                    for eod_date, mv, cf, pnl, cum_pnl, ret, twr in zip(
+                        acc_mv_df["eod_date"], acc_mv_df["market_value"], FpUtil.from_scaled(cf_arr, dp),
+                        FpUtil.from_scaled(pnl_arr, dp), FpUtil.from_scaled(cum_pnl_arr, dp),
+                        FpUtil.from_scaled(FpUtil.to_scaled(ret_arr, ret_dp), ret_dp),
+                        FpUtil.from_scaled(FpUtil.to_scaled(twr_arr, ret_dp), ret_dp))]
+
+            DailyPerformance.objects.bulk_create(perf_list)
+
+        logger.info("Cached " + str(len(perf_list)) + " daily performance dates")
+        return perf_list
+
+    @classmethod
+    def _security_transfer_df(cls, trans_q, dp):
+        """ Create DataFrame of security TRANSFER transactions valued at quantity * contract size * close price
+
+        Args:
+            trans_q (models.Q): filter of security transfers with a quantity
+            dp (int): decimal places of amount_net
+
+        Returns:
+            pd.DataFrame: columns investment_account (pk), trans_date (datetime.date), amount_net (Decimal)
+        """
+        col_list = ["investment_account", "trans_date", "security", "security__contract_size", "quantity"]
+        tr_df = pd.DataFrame(list(Transaction.objects.filter(trans_q, trans_type=TransactionType.TRANSFER).values_list(
+            *col_list)), columns=col_list)
+        if len(tr_df) == 0:
+            return pd.DataFrame(columns=["investment_account", "trans_date", "amount_net"])
+
+        val_df = pd.DataFrame({"security": tr_df["security"], "eod_date": tr_df["trans_date"],
+                               "quantity": tr_df["quantity"],
+                               "contract_size": pd.array(tr_df["security__contract_size"], dtype="Int64")})
+        dp_dict = FpUtil.decimal_places_dict(Position) | {"market_value": dp}
+        mv_arr = Position._eod_value_arrays(val_df, SecurityMaster.objects.get(ticker="SPAXX"), dp_dict)[1]
+        return pd.DataFrame({"investment_account": tr_df["investment_account"], "trans_date": tr_df["trans_date"],
+                             "amount_net": FpUtil.from_scaled(mv_arr, dp)})
+
+    @staticmethod
+    def daily_returns(prev_mv_arr, cf_arr, pnl_arr):
+        """ Calculate daily returns with cash flows at the start of the day
+
+        Args:
+            prev_mv_arr (np.ndarray): previous market values. scaled int64 array
+            cf_arr (np.ndarray): cash flows. scaled int64 array with the same scale as prev_mv_arr
+            pnl_arr (np.ndarray): pnl. scaled int64 array with the same scale as prev_mv_arr
+
+        Returns:
+            np.ndarray: float64 array of pnl / (previous market value + cash flow). 0 if the denominator is not
+                positive
+        """
+        denom_arr = (prev_mv_arr + cf_arr).astype(np.float64)
+        return np.divide(pnl_arr.astype(np.float64), denom_arr, out=np.zeros(len(denom_arr)), where=denom_arr > 0)
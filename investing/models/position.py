@@ -1,23 +1,97 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from decimal import Decimal
 from typing import Union
 import datetime
+import logging
+import time
 
 import numpy as np
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
-from django.db import DatabaseError, models, transaction
+from django.db import DatabaseError, connection, connections, models, transaction
+import django
 import django_pandas.io
 import pandas as pd
 
 from ..models.closedposition import ClosedPosition
+from ..models.dailyprice import DailyPrice
 from ..models.investmentaccount import Broker, InvestmentAccount
 from ..models.securitymaster import AssetClass, ChangeType, SecurityMaster, TickerHistory
 from ..models.transaction import ActionType, Transaction, TransactionType
+from ..positionengine import Lot, LotBook
+import util.fixedpointutil as FpUtil
 import util.pythonutil as PyUtil
-import util.pandasutil as PdUtil
+
+
+logger = logging.getLogger(__name__)
 
 
 class PositionManager(models.Manager):
+    def as_of(self, investment_accounts, as_of_date, nearest_prior=False, as_float=False):
+        """ Create DataFrame of positions for investment_accounts as of as_of_date with one query
+
+        Values are read with values() so security and investment account fields do not require a query per position.
+
+        Args:
+            investment_accounts (Union[InvestmentAccount, list[InvestmentAccount], list[int]]): accounts or account pks
+            as_of_date (datetime.date):
+            nearest_prior (boolean): True to use the latest end of day date on or before as_of_date for each account
+                (e.g. as_of_date is a weekend or holiday). Default False for positions on as_of_date only
+            as_float (boolean): True for decimal columns as float64. Default False for Decimal values
+
+        Returns:
+            pd.DataFrame: one row per position sorted by account, ticker, enter date. columns "investment_account"
+                (account pk), "broker", "account_name", "eod_date", "security" (security pk), "ticker", "asset_class",
+                "contract_size" (Int64), "quantity", "eod_price", "market_value", "enter_date", "enter_price",
+                "enter_total", "enter_price_net", "enter_total_net", "cost_basis_price", "cost_basis_total". dates are
+                datetime64[ns]. accounts without positions are not included
+        """
+        if isinstance(investment_accounts, InvestmentAccount):
+            investment_accounts = [investment_accounts]
+        acc_pk_list = [acc.pk if isinstance(acc, InvestmentAccount) else acc for acc in investment_accounts]
+
+        if nearest_prior:
+            # one index lookup per account for the latest end of day date
+            q = models.Q(pk__in=[])
+            for acc_pk in acc_pk_list:
+                q |= models.Q(investment_account=acc_pk, eod_date=models.Subquery(
+                    self.filter(investment_account=acc_pk, eod_date__lte=as_of_date).order_by("-eod_date").values(
+                        "eod_date")[:1]))
+            pos_qs = self.filter(q)
+        else:
+            pos_qs = self.filter(investment_account__in=acc_pk_list, eod_date=as_of_date)
+
+        dec_col_list = [f.name for f in Position._meta.get_fields() if isinstance(f, models.DecimalField)]
+        pos_qs = pos_qs.order_by("investment_account", "security__ticker", "enter_date").values(
+            "investment_account", "eod_date", "security", "enter_date", *dec_col_list,
+            broker=models.F("investment_account__broker"), account_name=models.F("investment_account__account_name"),
+            ticker=models.F("security__ticker"), asset_class=models.F("security__asset_class"),
+            contract_size=models.F("security__contract_size"))
+
+        col_list = ["investment_account", "broker", "account_name", "eod_date", "security", "ticker", "asset_class",
+                    "contract_size", "quantity", "eod_price", "market_value", "enter_date", "enter_price",
+                    "enter_total", "enter_price_net", "enter_total_net", "cost_basis_price", "cost_basis_total"]
+        pos_df = pd.DataFrame.from_records(list(pos_qs), columns=col_list)
+        pos_df = pos_df.astype({"investment_account": np.int64, "security": np.int64, "contract_size": "Int64"})
+        pos_df["eod_date"] = pd.to_datetime(pos_df["eod_date"])
+        pos_df["enter_date"] = pd.to_datetime(pos_df["enter_date"])
+        if as_float:
+            pos_df = pos_df.astype({col: np.float64 for col in dec_col_list})
+
+        return pos_df
+
+    def eod_date_set(self, investment_account):
+        """ Set of end of day dates with positions for investment_account
+
+        Args:
+            investment_account (InvestmentAccount):
+
+        Returns:
+            set[datetime.date]:
+        """
+        return set(self.filter(investment_account=investment_account).values_list("eod_date", flat=True).distinct())
+
     def full_constructor(self, investment_account, eod_date, security, quantity, eod_price, market_value, enter_date,
                          enter_price, enter_total, enter_price_net, enter_total_net, cost_basis_price, cost_basis_total,
                          create=True):
@@ -36,6 +110,111 @@ class PositionManager(models.Manager):
             enter_total=enter_total, enter_price_net=enter_price_net, enter_total_net=enter_total_net,
             cost_basis_price=cost_basis_price, cost_basis_total=cost_basis_total)
 
+    def last_eod_date_dict(self, broker):
+        """ Create dict of investment account pk to the latest end of day date with positions for that account
+
+        Args:
+            broker (Broker): only accounts with this broker
+
+        Returns:
+            dict[int, datetime.date]: investment account pk (keys) to latest end of day date (values). accounts without
+                positions are not included
+        """
+        return {d["investment_account"]: d["eod_date__max"] for d in self.filter(
+            investment_account__broker=broker).values("investment_account").annotate(models.Max("eod_date"))}
+
+
+class PositionIntervalManager(models.Manager):
+    def eod_date_set(self, investment_account):
+        """ Set of end of day (business day) dates covered by intervals for investment_account
+
+        Args:
+            investment_account (InvestmentAccount):
+
+        Returns:
+            set[datetime.date]:
+        """
+        date_set = set()
+        for valid_from, valid_to in self.filter(investment_account=investment_account).values_list(
+                "valid_from", "valid_to").distinct():
+            date_set.update(PyUtil.date_range(valid_from, valid_to))
+        return date_set
+
+    def expand(self, investment_accounts=None, start_date=None, end_date=None):
+        """ Expand intervals to one Position per business day
+
+        eod_price and market_value are set the same way as generated positions
+
+        Args:
+            investment_accounts (Optional[list[InvestmentAccount]]): only intervals for these accounts. Default None for
+                all accounts
+            start_date (Optional[datetime.date]): only positions on or after this date. Default None for no limit
+            end_date (Optional[datetime.date]): only positions on or before this date. Default None for no limit
+
+        Returns:
+            list[Position]: positions (not saved to database) sorted by end of day date, account, security ticker, enter
+                date
+
+        Raises:
+            ObjectDoesNotExist: if SPAXX security does not exist
+        """
+        pi_qs = self.select_related("investment_account", "security")
+        if investment_accounts is not None:
+            pi_qs = pi_qs.filter(investment_account__in=investment_accounts)
+        if start_date is not None:
+            pi_qs = pi_qs.filter(valid_to__gte=start_date)
+        if end_date is not None:
+            pi_qs = pi_qs.filter(valid_from__lte=end_date)
+
+        row_list = []
+        for pi in pi_qs.order_by("valid_from", "pk"):
+            for eod_date in PyUtil.date_range(pi.valid_from if start_date is None else max(pi.valid_from, start_date),
+                                              pi.valid_to if end_date is None else min(pi.valid_to, end_date)):
+                row_list.append((pi.investment_account, eod_date, pi.security, pi.quantity, pi.enter_date,
+                                 pi.enter_price, pi.enter_total, pi.enter_price_net, pi.enter_total_net,
+                                 pi.cost_basis_price, pi.cost_basis_total))
+        if len(row_list) == 0:
+            return []
+
+        pos_df = pd.DataFrame(row_list, columns=["investment_account", "eod_date", "security", "quantity", "enter_date",
+                                                 "enter_price", "enter_total", "enter_price_net", "enter_total_net",
+                                                 "cost_basis_price", "cost_basis_total"])
+        Position._insert_eod_values(pos_df, SecurityMaster.objects.get(ticker="SPAXX"),
+                                    FpUtil.decimal_places_dict(Position))
+        pos_df["account_pk"] = pos_df["investment_account"].map(lambda x: x.pk)
+        pos_df["ticker"] = pos_df["security"].map(lambda x: x.ticker)
+        pos_df = pos_df.sort_values(by=["eod_date", "account_pk", "ticker", "enter_date"])
+
+        return [Position.objects.full_constructor(
+            row.investment_account, row.eod_date, row.security, row.quantity, row.eod_price, row.market_value,
+            row.enter_date, row.enter_price, row.enter_total, row.enter_price_net, row.enter_total_net,
+            row.cost_basis_price, row.cost_basis_total, create=False) for row in pos_df.itertuples(index=False)]
+
+    def last_eod_date_dict(self, broker):
+        """ Create dict of investment account pk to the latest end of day date covered by intervals for that account
+
+        Args:
+            broker (Broker): only accounts with this broker
+
+        Returns:
+            dict[int, datetime.date]: investment account pk (keys) to latest end of day date (values). accounts without
+                intervals are not included
+        """
+        return {d["investment_account"]: d["valid_to__max"] for d in self.filter(
+            investment_account__broker=broker).values("investment_account").annotate(models.Max("valid_to"))}
+
+    def valid_on(self, investment_account, eod_date):
+        """ Intervals for investment_account that cover eod_date
+
+        Args:
+            investment_account (InvestmentAccount):
+            eod_date (datetime.date):
+
+        Returns:
+            models.QuerySet: PositionInterval queryset
+        """
+        return self.filter(investment_account=investment_account, valid_from__lte=eod_date, valid_to__gte=eod_date)
+
 
 class Position(models.Model):
     """ Position Model
@@ -75,6 +254,9 @@ class Position(models.Model):
 
     objects = PositionManager()
 
+    class Meta:
+        indexes = [models.Index(fields=["investment_account", "eod_date", "security"])]
+
     def __repr__(self):
         return repr(self.investment_account) + ", " + repr(self.security) + ", " + repr(self.quantity) + ", " + \
             repr(self.enter_date)
@@ -98,12 +280,34 @@ class Position(models.Model):
                                   " is broken into lots by FIDELITY so positions must have an enter date.")
 
     @classmethod
-    def generate_position_history(cls, broker, transfer_security_file=None):
+    def generate_position_history(cls, broker, transfer_security_file=None, incremental=False, bulk=False,
+                                  batch_size=5000, progress_func=None, processes=None, intervals=False,
+                                  stage_func=None):
         """ Generate missing daily end of day position history for all accounts with broker
 
         Only generated through most recent transaction per account to prevent positions from being generated without up
         to date transaction info.
         Only applied for account and date combinations where there are no positions, starting from account create date
+        Incremental mode: generation resumes from the latest end of day date with positions for each account. positions
+            on that date are used as the starting point and only transactions and closed positions after that date are
+            loaded. positions are saved in a single atomic transaction so the latest end of day date is always complete.
+            accounts without positions start from the account create date.
+        Bulk mode: the lots/enter date rule is validated for all positions at once, then positions are saved with
+            bulk_create, one atomic transaction per chunk of about batch_size positions. chunks only end where the end
+            of day date changes so each saved end of day date is complete (and incremental mode can resume from it)
+            even if a later chunk fails.
+        Multiple processes: accounts are independent so each account is generated in a worker process that only
+            receives that account's transactions, closed positions and transfer security file rows. results are combined
+            and saved in the same order as when generated in this process. workers connect to the database on their own.
+            inside an atomic block (e.g. ATOMIC_REQUESTS) accounts are generated in this process instead because the
+            connections have to be closed before starting workers and closing a connection breaks the transaction.
+        Intervals: positions are saved as PositionInterval instead of Position. consecutive end of day dates where a
+            position is unchanged are saved as one interval. existing dates and starting positions also come from
+            PositionInterval. an existing interval that ends on the day before a generated unchanged position is
+            extended instead of creating a new interval. bulk, batch_size and progress_func are not used.
+        End of day values: eod_price is the DailyPrice close price on the end of day date, forward filled from the
+            latest earlier close price if missing. market_value is quantity * contract size * eod_price. existing
+            positions can be revalued with mark_to_market() after prices are loaded
         Fidelity default settings:
             lots are sold first in, first out (oldest sold first then moving to more recent)
             Core position is set to SPAXX
@@ -120,30 +324,65 @@ class Position(models.Model):
                 /files/input/transactions/ or a File object. file is expected to be csv with columns
                 "trans_date", "account_id", "ticker", "quantity", "enter_date", "cost_basis_price", "cost_basis_total".
                 Dates can have any common format. account_id must be an existing account. Default None
+            incremental (boolean): True to resume each account from its latest end of day position date. Default False
+                to start each account from its create date
+            bulk (boolean): True to save positions in chunks with bulk_create. Default False to save positions one at a
+                time in a single atomic transaction
+            batch_size (int): minimum number of positions per chunk in bulk mode. Default 5000
+            progress_func (Optional[Callable[[int, int], None]]): called in bulk mode after each chunk is saved with the
+                number of positions saved so far and the total number of positions. Default None
+            processes (Optional[int]): number of worker processes used to generate accounts. ignored inside an atomic
+                block. Default None to generate all accounts in this process
+            intervals (boolean): True to save positions as PositionInterval. Default False to save Position
+            stage_func (Optional[Callable[[str, float], None]]): called after each stage with the stage name and the
+                seconds it took. stages are "load" (transactions, closed positions and transfer security file),
+                "loop" (daily positions for each account), "aggregate" (combine and sort accounts) and "save".
+                Default None
 
         Returns:
-            list[Position]: positions generated and sorted by end of day date, account, security ticker, enter date.
+            Union[list[Position], list[PositionInterval]]: positions generated and sorted by end of day date, account,
+                security ticker, enter date. if intervals is True, intervals created or extended sorted by valid from
+                date, account, security ticker, enter date
 
         Raises:
+            DatabaseError: in bulk mode, if a chunk fails to save. chunks saved before the failing chunk remain saved
             ObjectDoesNotExist: if SPAXX security is not created before calling this function, if account_id in
-                transfer_security_file not found
+                transfer_security_file not found, if a merger transaction does not have merger ticker history
+            ValidationError: if a position in a security broken into lots does not have an enter date
             ValueError: if a transfer with a security does not have a matching account_id and trans_date in
                 transfer_security_file (or if the file is not provided but is required),
         """
-        dp_dict = {}
-        for f in Position._meta.get_fields():
-            if isinstance(f, models.DecimalField):
-                dp_dict[f.name] = f.decimal_places
+        stage_start = time.perf_counter()
+
+        def end_stage(stage):
+            nonlocal stage_start
+            if stage_func is not None:
+                stage_func(stage, time.perf_counter() - stage_start)
+            stage_start = time.perf_counter()
 
+        dp_dict = FpUtil.decimal_places_dict(Position)
         core_security = SecurityMaster.objects.get(ticker="SPAXX")
 
-        cp_df = ClosedPosition.objects.filter(investment_account__broker=broker)
+        # latest end of day date with positions for each account. transactions and closed positions on or before this
+        # date are already reflected in the positions on this date
+        last_eod_dict = (PositionInterval if intervals else Position).objects.last_eod_date_dict(broker) \
+            if incremental else {}
+        t_q = cp_q = models.Q(investment_account__broker=broker)
+        if len(last_eod_dict) > 0:
+            t_q &= ~models.Q(investment_account__in=last_eod_dict.keys())
+            cp_q = t_q
+            for acc_pk, last_eod_date in last_eod_dict.items():
+                t_q |= models.Q(investment_account=acc_pk, trans_date__gt=last_eod_date)
+                cp_q |= models.Q(investment_account=acc_pk, close_date__gt=last_eod_date)
+
+        cp_df = ClosedPosition.objects.filter(cp_q)
         cp_df = django_pandas.io.read_frame(cp_df, verbose=False)
 
         # must be ordered by trans_date increasing first. others are optional
-        t_df = Transaction.objects.filter(investment_account__broker=broker).order_by(
-            "trans_date", "investment_account", "security")
+        t_df = Transaction.objects.filter(t_q).order_by("trans_date", "investment_account", "security")
         t_df = django_pandas.io.read_frame(t_df, verbose=False)
+        if len(t_df) == 0:
+            return []
 
         if any((t_df["trans_type"] == TransactionType.TRANSFER.value) & (~t_df["security"].isnull())) \
                 and transfer_security_file is None:
@@ -180,49 +419,136 @@ class Position(models.Model):
 
         t_df["security"] = t_df["security"].map(sec_dict)
         cp_df["security"] = cp_df["security"].map(sec_dict)
+        merger_dict = Position._merger_dict(t_df)
+        end_stage("load")
 
-        pos_df = pd.DataFrame()
-        for acc_pk, acc in inv_acc_dict.items():
-            pos_df = pd.concat([pos_df, Position.generate_position_history_by_account(
-                t_df, cp_df, trans_sec_df, acc, core_security, dp_dict)], ignore_index=True)
+        if processes is None or processes <= 1 or len(inv_acc_dict) <= 1 or connection.in_atomic_block:
+            acc_pos_df_list = [Position.generate_position_history_by_account(
+                t_df, cp_df, trans_sec_df, acc, core_security, dp_dict, last_eod_date=last_eod_dict.get(acc_pk),
+                intervals=intervals, merger_dict=merger_dict) for acc_pk, acc in inv_acc_dict.items()]
+        else:
+            # connections can't be shared with worker processes. each worker opens its own connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=min(processes, len(inv_acc_dict)),
+                                     initializer=django.setup) as executor:
+                future_list = [executor.submit(
+                    Position.generate_position_history_by_account, t_df[t_df["investment_account"] == acc_pk],
+                    cp_df[cp_df["investment_account"] == acc_pk],
+                    None if trans_sec_df is None else trans_sec_df[trans_sec_df["account_id"] == acc.account_id], acc,
+                    core_security, dp_dict, last_eod_date=last_eod_dict.get(acc_pk), intervals=intervals,
+                    merger_dict=merger_dict) for acc_pk, acc in inv_acc_dict.items()]
+                acc_pos_df_list = [future.result() for future in future_list]
+        end_stage("loop")
+        pos_df = pd.concat(acc_pos_df_list, ignore_index=True)
+
+        if len(pos_df) == 0:
+            return []
 
         # sort by specified return order before saving
         # positions generated and sorted by end of day date, account, security ticker, enter date.
         pos_df["ticker"] = pos_df["security"].map(lambda x: x.ticker)
         pos_df = pos_df.sort_values(by=["eod_date", "investment_account", "ticker", "enter_date"])
-        save_pos_list = []
-        with transaction.atomic():
-            for ind, row in pos_df.iterrows():
-                save_pos_list.append(Position.objects.full_constructor(
-                    inv_acc_dict[row["investment_account"]], row["eod_date"], row["security"], row["quantity"],
-                    row["eod_price"], row["market_value"], row["enter_date"], row["enter_price"], row["enter_total"],
-                    row["enter_price_net"], row["enter_total_net"], row["cost_basis_price"], row["cost_basis_total"]))
+        end_stage("aggregate")
+        if intervals:
+            save_pos_list = Position._save_intervals(pos_df, inv_acc_dict, dp_dict)
+        elif bulk:
+            save_pos_list = Position._bulk_save_positions(pos_df, inv_acc_dict, broker, batch_size, progress_func)
+        else:
+            save_pos_list = []
+            with transaction.atomic():
+                for ind, row in pos_df.iterrows():
+                    save_pos_list.append(Position.objects.full_constructor(
+                        inv_acc_dict[row["investment_account"]], row["eod_date"], row["security"], row["quantity"],
+                        row["eod_price"], row["market_value"], row["enter_date"], row["enter_price"],
+                        row["enter_total"], row["enter_price_net"], row["enter_total_net"], row["cost_basis_price"],
+                        row["cost_basis_total"]))
+        end_stage("save")
 
         return save_pos_list
 
     @classmethod
-    def generate_position_history_by_account(cls, trans_df, closed_pos_df, ts_df, inv_acc, core_security, dp_dict):
-        """
+    def generate_position_history_by_account(cls, trans_df, closed_pos_df, ts_df, inv_acc, core_security, dp_dict,
+                                             last_eod_date=None, intervals=False, merger_dict=None):
+        """ Generate missing daily end of day position history for a single account
 
-        assumes df is sorted by trans_date increasing
+        Positions from iter_position_history_by_account() are combined into a DataFrame once at the end and valued in a
+        single pass.
 
         Args:
-            trans_df:
-            closed_pos_df:
-            ts_df:
-            inv_acc:
-            core_security:
+            see iter_position_history_by_account()
 
         Returns:
+            pd.DataFrame: generated positions with investment_account (pk), eod_date and Position field columns
+                (except id). empty DataFrame if no positions are generated for inv_acc
+
+        Raises:
+            ValueError: see iter_position_history_by_account()
+        """
+        row_list = []
+        for _, day_row_list, _ in Position.iter_position_history_by_account(
+                trans_df, closed_pos_df, ts_df, inv_acc, core_security, dp_dict, last_eod_date=last_eod_date,
+                intervals=intervals, merger_dict=merger_dict):
+            row_list.extend(day_row_list)
+        if len(row_list) == 0:
+            return pd.DataFrame()
+
+        return Position.position_df(row_list, core_security, dp_dict)
+
+    @classmethod
+    def iter_position_history_by_account(cls, trans_df, closed_pos_df, ts_df, inv_acc, core_security, dp_dict,
+                                         last_eod_date=None, intervals=False, merger_dict=None, changes_only=False):
+        """ Generate missing daily end of day positions for a single account one end of day date at a time
+
+        Positions are kept in a LotBook that is changed in place as each day's transactions are applied. The end of day
+        positions are yielded for each generated date before the next date is applied, so memory is bounded by one
+        day's book and callers can save positions in chunks or stop early. Dates that already have positions are not
+        generated. The book restarts from the existing positions on the latest of these dates.
+
+        Changes only: positions that are new or changed since the previous date are yielded with the positions on the
+            previous date that were closed or changed (ended positions). the previous positions of the first generated
+            date are the existing positions it starts from (none for a new account)
 
+        Args:
+            trans_df (pd.DataFrame): transactions for all accounts sorted by trans_date increasing. security column
+                has SecurityMaster instances
+            closed_pos_df (pd.DataFrame): closed positions for all accounts. security column has SecurityMaster
+                instances
+            ts_df (Optional[pd.DataFrame]): transfer security file data for all accounts. None if no file provided
+            inv_acc (InvestmentAccount): generate position history for this account
+            core_security (SecurityMaster):
+            dp_dict (dict[str, int]): Position decimal field name (keys) to decimal places (values)
+            last_eod_date (Optional[datetime.date]): start from positions on this end of day date instead of from
+                inv_acc create date. only transactions and closed positions after this date are applied. Default None
+            intervals (boolean): True if existing positions are saved as PositionInterval. Default False for Position
+            merger_dict (Optional[dict[tuple[int, datetime.date], TickerHistory]]): merger ticker history by security
+                pk and change date (see _merger_dict()). Default None to load the merger ticker history needed for
+                inv_acc transactions
+            changes_only (boolean): True to only yield new, changed and ended positions. Default False to yield all
+                positions
+
+        Yields:
+            tuple[datetime.date, list[tuple], list[tuple]]: end of day date, positions and ended positions. positions
+                are tuples of investment_account (pk), eod_date and values in Lot.FIELDS order, without end of day
+                values (see position_df()). ended positions have the same form and the yielded date. ended positions
+                are empty if changes_only is False. nothing is yielded if no transactions for inv_acc
+
+        Raises:
+            ObjectDoesNotExist: if a merger transaction does not have merger ticker history
+            ValueError: if earliest transaction is before inv_acc create date, if a transaction type and action type
+                combination is not implemented
         """
         closed_pos_df = closed_pos_df[closed_pos_df["investment_account"] == inv_acc.pk]
-        closed_pos_df["processed"] = False
-        ts_df = ts_df[ts_df["account_id"] == inv_acc.account_id]
+        if ts_df is not None:
+            ts_df = ts_df[ts_df["account_id"] == inv_acc.account_id]
 
         # get the oldest and newest transaction dates here so the positions are created through the entire transaction
         # date range
         trans_df = trans_df[trans_df["investment_account"] == inv_acc.pk]
+        if last_eod_date is not None:
+            trans_df = trans_df[trans_df["trans_date"] > last_eod_date]
+            closed_pos_df = closed_pos_df[closed_pos_df["close_date"] > last_eod_date]
+        if len(trans_df) == 0:
+            return
         oldest_trans_date = trans_df["trans_date"].min()
         newest_trans_date = trans_df["trans_date"].max()
 
@@ -230,63 +556,67 @@ class Position(models.Model):
             raise ValueError(str(inv_acc) + ": earliest transaction is on " + str(oldest_trans_date) +
                              ". This is before the account create_date of " + str(inv_acc.create_date))
 
-        # always start at create date. earliest transaction in account history may be after the create date
-        cur_date = inv_acc.create_date
-        prev_date = PyUtil.change_dt_date(cur_date, biz_days=-1)
-
-        # get all positions for account
-        pos_df = django_pandas.io.read_frame(Position.objects.filter(investment_account=inv_acc), verbose=False)
-        sec_dict = SecurityMaster.objects.field_to_security_dict(
-            "pk", pos_df["security"].drop_duplicates().dropna().astype("int64").tolist())
-        pos_df["security"] = pos_df["security"].map(sec_dict)
-        # positions with save == True are positions that will be saved to database. these could be new positions
-        # or existing positions that are being updated (e.g. cost basis for short positions after they are closed)
-        pos_df["save"] = False
-        # create a fake position for day before create date as a starting point
-        pos_df = PdUtil.ins_row_at_end(
-            pos_df, [None, inv_acc.id, prev_date, core_security, Decimal(0), Decimal(1), Decimal(0), None, Decimal(1),
-                     Decimal(0), Decimal(1), Decimal(0), Decimal(1), Decimal(0), False])
-
-        # remove transactions where positions already exist for transaction's date
-        trans_df = trans_df[~trans_df["trans_date"].isin(pos_df["eod_date"].drop_duplicates())]
-
+        # closed positions by close date and security. closed positions are removed once they are matched to a lot
+        date_sec_cp_dict = {}
+        for cp_row in closed_pos_df.itertuples(index=False):
+            date_sec_cp_dict.setdefault((cp_row.close_date, cp_row.security), []).append(cp_row)
+
+        # transfer security file rows by transfer date, account id and ticker
+        date_acc_ticker_ts_dict = {}
+        if ts_df is not None:
+            for ts_row in ts_df.itertuples(index=False):
+                date_acc_ticker_ts_dict.setdefault((ts_row.trans_date, ts_row.account_id, ts_row.ticker),
+                                                   []).append(ts_row)
+
+        if merger_dict is None:
+            merger_dict = Position._merger_dict(trans_df)
+
+        if last_eod_date is None:
+            # start at create date. earliest transaction in account history may be after the create date
+            cur_date = inv_acc.create_date
+            exist_date_set = (PositionInterval if intervals else Position).objects.eod_date_set(inv_acc)
+            # empty core position as a starting point
+            lot_book = LotBook(core_security, dp_dict)
+            lot_book.add_core(Decimal(0))
+        else:
+            # resume from the last end of day snapshot. only the positions on that date are needed
+            cur_date = PyUtil.change_dt_date(last_eod_date, biz_days=1)
+            exist_date_set = set()
+            lot_book = Position._lot_book_from_positions(inv_acc, last_eod_date, core_security, dp_dict, intervals)
+
+        # transactions by date. transactions on dates where positions already exist are not applied
+        # sort by mergers then distribution then all other transactions. sort is stable
+        date_trans_dict = {}
+        for row in trans_df.itertuples(index=False):
+            if row.trans_date not in exist_date_set:
+                date_trans_dict.setdefault(row.trans_date, []).append(row)
+        for trans_list in date_trans_dict.values():
+            trans_list.sort(key=lambda x: 0 if x.trans_type == TransactionType.CORP_ACT.value and
+                            x.action_type in (ActionType.MERGER_NEW.value, ActionType.MERGER_OLD.value)
+                            else 1 if x.trans_type == TransactionType.CORP_ACT.value and x.action_type in
+                            (ActionType.STOCK_SPLIT.value, ActionType.STOCK_CONS.value, ActionType.STOCK_DIV.value)
+                            else 2)
+
+        # positions of the previous date are only kept to find changes. a new account has no previous positions
+        prev_row_counter = None if not changes_only else Counter() if last_eod_date is None \
+            else Counter(lot_book.snapshot())
+        seed_date = None
         while cur_date <= newest_trans_date:
-            if cur_date in pos_df["eod_date"]:
-                prev_date, cur_date = cur_date, PyUtil.change_dt_date(cur_date, biz_days=1)
+            if cur_date in exist_date_set:
+                seed_date, cur_date = cur_date, PyUtil.change_dt_date(cur_date, biz_days=1)
                 continue
-
-            # get transactions and starting positions for cur_date
-            # use .copy() to get rid of pandas SettingWithCopyWarning
-            cur_trans_df = trans_df[trans_df["trans_date"] == cur_date].copy()
-            # sort by mergers then distribution then all other transactions
-            cur_trans_df["sort"] = cur_trans_df.apply(
-                lambda row: 0 if row["trans_type"] == TransactionType.CORP_ACT.value and
-                                 row["action_type"] in (ActionType.MERGER_NEW.value, ActionType.MERGER_OLD.value)
-                else 1 if row["trans_type"] == TransactionType.CORP_ACT.value and row["action_type"] in
-                          (ActionType.STOCK_SPLIT.value, ActionType.STOCK_CONS.value, ActionType.STOCK_DIV.value)
-                else 2, axis=1)
-            cur_trans_df = cur_trans_df.sort_values(by="sort").drop(columns=["sort"])
-
-            cur_pos_df = pos_df[pos_df["eod_date"] == prev_date].copy()
-            cur_pos_df[["id", "eod_date", "save"]] = [None, cur_date, True]
+            if seed_date is not None:
+                # continue from the existing positions on the previous date
+                lot_book = Position._lot_book_from_positions(inv_acc, seed_date, core_security, dp_dict, intervals)
+                if changes_only:
+                    prev_row_counter = Counter(lot_book.snapshot())
+                seed_date = None
+
+            cur_trans_list = date_trans_dict.get(cur_date, [])
             sec_sold_list = []
             sec_split_list = []
             sec_covered_list = []
 
-            def add_pos(sec1, qty1, eodp1, mv1, ed1, ep1, et1, epn1, etn1, cbp1, cbt1):
-                nonlocal cur_pos_df
-
-                # TODO remove this line once market_value is set correctly
-                mv1 = max(mv1, Decimal(-123456789))
-
-                cur_pos_df = PdUtil.ins_row_at_end(
-                    cur_pos_df, [None, inv_acc.id, cur_date, sec1, qty1, eodp1, mv1, ed1, ep1, et1, epn1, etn1, cbp1,
-                                 cbt1, True])
-
-            def add_core_sec_pos(amt1):
-                add_pos(core_security, amt1, Decimal(1), amt1, None, Decimal(1), amt1, Decimal(1), amt1, Decimal(1),
-                        amt1)
-
             # TODO will also need to change any options on the split stock
             def process_split(trans_sec_1):
                 # there may be multiple split transactions on the same security. not clear how to match each
@@ -295,38 +625,26 @@ class Position(models.Model):
                 # positions quantity and cost_basis_price
                 if trans_sec_1 not in sec_split_list:
                     sec_split_list.append(trans_sec_1)
-
-                    split_rows = cur_pos_df["security"] == trans_sec_1
-                    sec_qty = cur_pos_df.loc[split_rows, "quantity"].sum()
-                    split_qty = cur_trans_df.loc[
-                        (cur_trans_df["trans_type"] == TransactionType.CORP_ACT.value) &
-                        (cur_trans_df["action_type"] == ActionType.STOCK_SPLIT.value) &
-                        (cur_trans_df["security"] == trans_sec_1), "quantity"].sum()
-                    split_ratio = split_qty / sec_qty + 1
-                    cur_pos_df.loc[split_rows, "quantity"] = (cur_pos_df.loc[split_rows, "quantity"] * split_ratio)\
-                        .map(lambda x: round(x, dp_dict["quantity"]))
-                    for col in ["enter_price", "enter_price_net", "cost_basis_price"]:
-                        cur_pos_df.loc[split_rows, col] = (cur_pos_df.loc[split_rows, col] / split_ratio)\
-                            .map(lambda x: round(x, dp_dict[col]))
+                    lot_book.split(trans_sec_1, sum(
+                        (x.quantity for x in cur_trans_list if x.trans_type == TransactionType.CORP_ACT.value and
+                         x.action_type == ActionType.STOCK_SPLIT.value and x.security == trans_sec_1), Decimal(0)))
 
             def process_buy(trans_sec_1, trans_qty_1, trans_price_1, trans_amt_net_1):
-                # create the position. this is an actual lot if the security uses lots otherwise it is a
-                # dummy lot that will be aggregated later
+                # create the position. this is an actual lot if the security uses lots otherwise it is added to the
+                # aggregate position
                 # trans_price_1 is before commission and fees. trans_amt_net_1 is after commission and fees
                 # cost_basis_price/total are after commission and fees
                 trans_amt_net_1 = abs(trans_amt_net_1)
                 contract_size_1 = 1 if trans_sec_1.contract_size is None else trans_sec_1.contract_size
-                eod_price_1 = Decimal(1) if trans_sec_1 == core_security else Decimal("-12345.6789")
                 enter_price_net_1 = round(trans_amt_net_1 / trans_qty_1 / contract_size_1, dp_dict["enter_price_net"])
 
-                add_pos(trans_sec_1, trans_qty_1, eod_price_1,
-                        round(trans_qty_1 * eod_price_1 * contract_size_1, dp_dict["market_value"]),
-                        cur_date if trans_sec_1.has_fidelity_lots else None, trans_price_1,
-                        round(trans_qty_1 * trans_price_1 * contract_size_1, dp_dict["enter_total"]),
-                        enter_price_net_1, trans_amt_net_1, enter_price_net_1, trans_amt_net_1)
+                lot_book.add_lot(trans_sec_1, trans_qty_1, cur_date if trans_sec_1.has_fidelity_lots else None,
+                                 trans_price_1, round(trans_qty_1 * trans_price_1 * contract_size_1,
+                                                      dp_dict["enter_total"]),
+                                 enter_price_net_1, trans_amt_net_1, enter_price_net_1, trans_amt_net_1)
 
                 # remove cash from core position
-                add_core_sec_pos(-trans_amt_net_1)
+                lot_book.add_core(-trans_amt_net_1)
 
             def process_sell(trans_sec_1, trans_amt_net_1):
                 # there may be multiple sell transactions on the same security. not clear how to match each
@@ -335,190 +653,133 @@ class Position(models.Model):
                 # this also covers the case where there are more closed positions than sell transactions
 
                 # add cash to core position
-                add_core_sec_pos(abs(trans_amt_net_1))
+                lot_book.add_core(abs(trans_amt_net_1))
 
                 if trans_sec_1 in sec_sold_list:
                     return
                 sec_sold_list.append(trans_sec_1)
 
-                cur_cp_df_1 = closed_pos_df[(closed_pos_df["close_date"] == cur_date) &
-                                            (closed_pos_df["security"] == trans_sec_1) &
-                                            (closed_pos_df["processed"] == False)]
-                for cp_ind, cp_row in cur_cp_df_1.iterrows():
-                    for pos_ind, pos_row in cur_pos_df.iterrows():
-                        # cost_basis_price in position is from the original transaction (before wash sale adjustment)
-                        # but cost_basis_price in closed position is after wash sale adjustment. cost_basis_price_unadj
-                        # in closed position is before wash sale adjustment so it will match original transaction cost
-                        # basis price
-                        # partial shares cost basis price are not matching within 0.001 due to rounding issues so
-                        # allow for greater tolerance for partial shares only
-                        if pos_row["security"] == cp_row["security"] and pos_row["enter_date"] == cp_row["enter_date"]\
-                                and pos_row["cost_basis_price"] is not None:
-                            diff = abs(pos_row["cost_basis_price"] - cp_row["cost_basis_price_unadj"])
-                            if diff < Decimal("0.001") or (cp_row["quantity"] < Decimal(1) and diff < Decimal("0.02")):
-                                qty, cbt = cp_row[["quantity", "cost_basis_total_unadj"]]
-                                # position enter_total is before commission and fees but all closed position fields are
-                                # after commission and fees. use ratio of quantity sold to quantity held before sale to
-                                # get enter_total after sale
-                                cur_pos_df.loc[pos_ind, "enter_total"] -= \
-                                    round(pos_row["enter_total"] * qty/pos_row["quantity"], dp_dict["enter_total"])
-                                # for long positions, enter_total_net and cost_basis_total are the same
-                                cur_pos_df.loc[pos_ind, ["quantity", "enter_total_net", "cost_basis_total"]] -= \
-                                    (qty, cbt, cbt)
-                                closed_pos_df.loc[cp_ind, "processed"] = True
-                                break
+                unmatched_cp_list = []
+                for cp_row in date_sec_cp_dict.get((cur_date, trans_sec_1), []):
+                    # cost_basis_price in position is from the original transaction (before wash sale adjustment)
+                    # but cost_basis_price in closed position is after wash sale adjustment. cost_basis_price_unadj
+                    # in closed position is before wash sale adjustment so it will match original transaction cost
+                    # basis price
+                    if not lot_book.close_long(cp_row.security, cp_row.enter_date, cp_row.cost_basis_price_unadj,
+                                               cp_row.quantity, cp_row.cost_basis_total_unadj):
+                        unmatched_cp_list.append(cp_row)
+                date_sec_cp_dict[(cur_date, trans_sec_1)] = unmatched_cp_list
 
             def process_sell_short(trans_sec_1, trans_qty_1, trans_price_1, trans_amt_net_1):
-                # create the position. this is an actual lot if the security uses lots otherwise it is a
-                # dummy lot that will be aggregated later
+                # create the position. this is an actual lot if the security uses lots otherwise it is added to the
+                # aggregate position
                 # cost_basis_price and cost_basis_total are None because the values aren't known until the
                 # position is closed
                 contract_size_1 = 1 if trans_sec_1.contract_size is None else trans_sec_1.contract_size
-                eod_price_1 = Decimal(1) if trans_sec_1 == core_security else Decimal("-12345.6789")
                 enter_price_net_1 = round(trans_amt_net_1 / abs(trans_qty_1) / contract_size_1,
                                           dp_dict["enter_price_net"])
-                add_pos(trans_sec_1, trans_qty_1, eod_price_1,
-                        round(abs(trans_qty_1) * eod_price_1 * contract_size_1, dp_dict["market_value"]),
-                        cur_date if trans_sec_1.has_fidelity_lots else None, trans_price_1,
-                        round(abs(trans_qty_1) * trans_price_1 * contract_size_1, dp_dict["enter_total"]),
-                        enter_price_net_1, trans_amt_net_1, None, None)
+                lot_book.add_lot(trans_sec_1, trans_qty_1, cur_date if trans_sec_1.has_fidelity_lots else None,
+                                 trans_price_1, round(abs(trans_qty_1) * trans_price_1 * contract_size_1,
+                                                      dp_dict["enter_total"]),
+                                 enter_price_net_1, trans_amt_net_1, None, None)
 
                 # add cash to core position
-                add_core_sec_pos(trans_amt_net_1)
+                lot_book.add_core(trans_amt_net_1)
 
             def process_buy_cover(trans_sec_1, trans_amt_net_1):
                 # remove cash from core position
-                add_core_sec_pos(trans_amt_net_1)
+                lot_book.add_core(trans_amt_net_1)
 
                 if trans_sec_1 in sec_covered_list:
                     return
                 sec_covered_list.append(trans_sec_1)
 
-                cur_cp_df_1 = closed_pos_df[(closed_pos_df["close_date"] == cur_date) &
-                                            (closed_pos_df["security"] == trans_sec_1) &
-                                            (closed_pos_df["processed"] == False)]
-                for cp_ind, cp_row in cur_cp_df_1.iterrows():
-                    for pos_ind, pos_row in cur_pos_df.iterrows():
-                        # cost_basis_price in position is from the original transaction (before wash sale adjustment)
-                        # but cost_basis_price in closed position is after wash sale adjustment. cost_basis_price_unadj
-                        # in closed position is before wash sale adjustment so it will match original transaction cost
-                        # basis price
-
-                        if pos_row["security"] == cp_row["security"] and pos_row["enter_date"] == cp_row["enter_date"] \
-                                and abs(pos_row["enter_price_net"] - cp_row["enter_price_net"]) < \
-                                Decimal("0.001"):
-                            qty = cp_row["quantity"]
-                            cur_pos_df.loc[pos_ind, "quantity"] += qty
-                            # position enter_total is before commission and fees but all closed position fields are
-                            # after commission and fees. use ratio of quantity sold to quantity held before sale to get
-                            # enter_total after sale
-                            cur_pos_df.loc[pos_ind, "enter_total"] -= \
-                                round(pos_row["enter_total"] * qty / abs(pos_row["quantity"]), dp_dict["enter_total"])
-                            cur_pos_df.loc[pos_ind, "enter_total_net"] -= cp_row["proceeds_total"]
-                            closed_pos_df.loc[cp_ind, "processed"] = True
-                            # TODO update cost_basis_price and cost_basis_total for current and previous positions
-                            # TODO if not all quantity of the position is sold, will need to keep the cost basis values
-                            # TODO as None for the non sold quantity and create a new lot for the sold quantity with
-                            # TODO closed cost basis values. save needs to be set to True on previous positions
-                            break
+                unmatched_cp_list = []
+                for cp_row in date_sec_cp_dict.get((cur_date, trans_sec_1), []):
+                    if not lot_book.close_short(cp_row.security, cp_row.enter_date, cp_row.enter_price_net,
+                                                cp_row.quantity, cp_row.proceeds_total):
+                        unmatched_cp_list.append(cp_row)
+                date_sec_cp_dict[(cur_date, trans_sec_1)] = unmatched_cp_list
 
             def process_transfer_security(sec_1, qty_1, cost_basis_price_1, cost_basis_total_1,
                                           enter_date_1):
                 # cost_basis_price_1 and cost_basis_total_1 are cost basis values after commission and fees. values
                 # before commission and fees are not provided during transfer
-                contract_size_1 = 1 if sec_1.contract_size is None else sec_1.contract_size
-                eod_price_1 = Decimal(1) if sec_1 == core_security else Decimal("-12345.6789")
-                add_pos(sec_1, qty_1, eod_price_1, round(qty_1 * eod_price_1 * contract_size_1,dp_dict["market_value"]),
-                        enter_date_1 if sec_1.has_fidelity_lots else None, cost_basis_price_1, cost_basis_total_1,
-                        cost_basis_price_1, cost_basis_total_1, cost_basis_price_1, cost_basis_total_1)
+                lot_book.add_lot(sec_1, qty_1, enter_date_1 if sec_1.has_fidelity_lots else None, cost_basis_price_1,
+                                 cost_basis_total_1, cost_basis_price_1, cost_basis_total_1, cost_basis_price_1,
+                                 cost_basis_total_1)
 
             def process_merger(trans_sec_1, trans_date_1):
-                nonlocal cur_pos_df
-                th = TickerHistory.objects.get(security=trans_sec_1, change_date=trans_date_1,
-                                               change_type=ChangeType.MERGER)
-                ticker_srs = cur_pos_df["security"].map(lambda x: x.ticker)
-                cur_pos_df.loc[ticker_srs == th.old_ticker, "security"] = trans_sec_1
-
-            # iterate transactions and change cur_pos_df as you go
-            for ind, row in cur_trans_df.iterrows():
-                if row["trans_type"] == TransactionType.CORP_ACT.value:
-                    if row["action_type"] == ActionType.DIV.value:
-                        add_core_sec_pos(row["amount_net"])
-                    elif row["action_type"] == ActionType.MERGER_NEW:
-                        process_merger(row["security"], row["trans_date"])
-                    elif row["action_type"] == ActionType.MERGER_OLD:
+                th = merger_dict.get((trans_sec_1.pk, trans_date_1))
+                if th is None:
+                    raise ObjectDoesNotExist(trans_sec_1.ticker + " does not have " + ChangeType.MERGER.value +
+                                             " ticker history on " + str(trans_date_1))
+                lot_book.merge(th.old_ticker, trans_sec_1)
+
+            # iterate transactions and change lot_book as you go
+            for row in cur_trans_list:
+                if row.trans_type == TransactionType.CORP_ACT.value:
+                    if row.action_type == ActionType.DIV.value:
+                        lot_book.add_core(row.amount_net)
+                    elif row.action_type == ActionType.MERGER_NEW:
+                        process_merger(row.security, row.trans_date)
+                    elif row.action_type == ActionType.MERGER_OLD:
                         # MERGER_NEW will handle the changes around mergers
                         pass
-                    elif row["action_type"] == ActionType.STOCK_SPLIT.value:
-                        process_split(row["security"])
+                    elif row.action_type == ActionType.STOCK_SPLIT.value:
+                        process_split(row.security)
                     else:
-                        raise ValueError(row["action_type"] + " not implemented for " + TransactionType.CORP_ACT.value +
+                        raise ValueError(row.action_type + " not implemented for " + TransactionType.CORP_ACT.value +
                                          " transaction")
-                elif row["trans_type"] == TransactionType.OTHER.value:
-                    if row["action_type"] == ActionType.OPT_EXP:
-                        # amount_net is 0 so a core position of 0 will be created.
-                        if row["quantity"] < 0:
-                            process_sell(row["security"], row["amount_net"])
+                elif row.trans_type == TransactionType.OTHER.value:
+                    if row.action_type == ActionType.OPT_EXP:
+                        # amount_net is 0 so 0 is added to the core position
+                        if row.quantity < 0:
+                            process_sell(row.security, row.amount_net)
                         else:
-                            process_buy_cover(row["security"], row["amount_net"])
-                    elif row["action_type"] == ActionType.LOAN:
+                            process_buy_cover(row.security, row.amount_net)
+                    elif row.action_type == ActionType.LOAN:
                         # these have no effect on positions
                         pass
                     else:
-                        raise ValueError(row["action_type"] + " not implemented for " + TransactionType.OTHER.value +
+                        raise ValueError(row.action_type + " not implemented for " + TransactionType.OTHER.value +
                                          " transaction")
-                elif row["trans_type"] == TransactionType.TRADE.value:
-                    if row["action_type"] == ActionType.BUY.value:
-                        process_buy(row["security"], row["quantity"], row["price"], row["amount_net"])
-                    elif row["action_type"] == ActionType.SELL.value:
-                        process_sell(row["security"], row["amount_net"])
-                    elif row["action_type"] == ActionType.SELL_SHORT.value:
-                        process_sell_short(row["security"], row["quantity"], row["price"], row["amount_net"])
-                    elif row["action_type"] == ActionType.BUY_COVER.value:
-                        process_buy_cover(row["security"], row["amount_net"])
+                elif row.trans_type == TransactionType.TRADE.value:
+                    if row.action_type == ActionType.BUY.value:
+                        process_buy(row.security, row.quantity, row.price, row.amount_net)
+                    elif row.action_type == ActionType.SELL.value:
+                        process_sell(row.security, row.amount_net)
+                    elif row.action_type == ActionType.SELL_SHORT.value:
+                        process_sell_short(row.security, row.quantity, row.price, row.amount_net)
+                    elif row.action_type == ActionType.BUY_COVER.value:
+                        process_buy_cover(row.security, row.amount_net)
                     else:
-                        raise ValueError(row["action_type"] + " not implemented for " + TransactionType.TRADE.value +
+                        raise ValueError(row.action_type + " not implemented for " + TransactionType.TRADE.value +
                                          " transaction")
-                elif row["trans_type"] == TransactionType.TRANSFER.value:
-                    if pd.isnull(row["security"]):
+                elif row.trans_type == TransactionType.TRANSFER.value:
+                    if pd.isnull(row.security):
                         # cash transfers go straight to core security at price = cost_basis_price = 1 and
                         # quantity = cost_basis_total = amount_net
-                        add_core_sec_pos(row["amount_net"])
+                        lot_book.add_core(row.amount_net)
                     else:
-                        sec_ts_df = ts_df[
-                            (ts_df["trans_date"] == row["trans_date"]) & (ts_df["account_id"] == inv_acc.account_id) &
-                            (ts_df["ticker"] == row["security"].ticker)]
-                        for ts_ind, ts_row in sec_ts_df.iterrows():
-                            process_transfer_security(row["security"], ts_row["quantity"], ts_row["cost_basis_price"],
-                                                      ts_row["cost_basis_total"], ts_row["enter_date"])
-
-            # aggregate positions by lot
-            no_lot_df, lot_df = PdUtil.split_df_rows(cur_pos_df, cur_pos_df["enter_date"].isnull())
-            no_lot_df = no_lot_df.groupby(
-                by=["id", "investment_account", "eod_date", "security", "enter_date"], as_index=False, dropna=False)\
-                .agg({"quantity": "sum", "eod_price": "first", "market_value": "sum", "enter_price": "first",
-                      "enter_total": "sum", "enter_price_net": "first", "enter_total_net": "sum",
-                      "cost_basis_price": "first", "cost_basis_total": "sum", "save": "first"})
-            lot_df = lot_df[lot_df["quantity"] != Decimal(0)]
-            cur_pos_df = pd.concat([no_lot_df, lot_df], ignore_index=True)
-
-            # add new positions to pos_df. they will be used on the next day
-            pos_df = pd.concat([pos_df, cur_pos_df], ignore_index=True)
-
-            prev_date, cur_date = cur_date, PyUtil.change_dt_date(cur_date, biz_days=1)
-
-        # TODO eod_price and market_value (at least for stocks, probably wont have option data so use dummy value)
-        # TODO set eod price and calculate eod market value here for now
-        pos_df["eod_price"] = Decimal("-12345.6789")
-        pos_df.loc[pos_df["security"] == core_security, "eod_price"] = 1
-        pos_df["market_value"] = pos_df.apply(
-            lambda row: round((Decimal(1) if row["security"].contract_size is None else row["security"].contract_size) *
-                              row["quantity"] * row["eod_price"], dp_dict["market_value"]), axis=1)
-
-        pos_df = pos_df[pos_df["save"] == True]
-        pos_df["enter_date"] = pos_df["enter_date"].replace({np.nan: None})
-
-        return pos_df
+                        for ts_row in date_acc_ticker_ts_dict.get(
+                                (row.trans_date, inv_acc.account_id, row.security.ticker), []):
+                            process_transfer_security(row.security, ts_row.quantity, ts_row.cost_basis_price,
+                                                      ts_row.cost_basis_total, ts_row.enter_date)
+
+            # end of day positions. identical positions are counted so duplicate lots are compared correctly
+            lot_list = lot_book.snapshot()
+            if changes_only:
+                row_counter = Counter(lot_list)
+                ended_list = list((prev_row_counter - row_counter).elements())
+                lot_list = list((row_counter - prev_row_counter).elements())
+                prev_row_counter = row_counter
+            else:
+                ended_list = []
+            yield (cur_date, [(inv_acc.pk, cur_date) + lot for lot in lot_list],
+                   [(inv_acc.pk, cur_date) + lot for lot in ended_list])
+
+            cur_date = PyUtil.change_dt_date(cur_date, biz_days=1)
 
     @classmethod
     def load_positions_from_fidelity_file(cls, file):
@@ -689,3 +950,325 @@ class Position(models.Model):
             return cls.load_positions_from_fidelity_file(file)
         else:
             raise NotImplementedError("broker not set in load_positions_from_file()")
+
+    @classmethod
+    def mark_to_market(cls, investment_accounts=None, start_date=None, end_date=None, batch_size=5000):
+        """ Revalue existing positions from stored close prices without regenerating them
+
+        eod_price and market_value are calculated the same way as generated positions (see DailyPrice). only positions
+        where either value changes are updated. updates are saved in a single atomic transaction
+
+        Args:
+            investment_accounts (Optional[list[InvestmentAccount]]): only positions for these accounts. Default None for
+                all accounts
+            start_date (Optional[datetime.date]): only positions on or after this date. Default None for no limit
+            end_date (Optional[datetime.date]): only positions on or before this date. Default None for no limit
+            batch_size (int): number of positions per bulk_update query. Default 5000
+
+        Returns:
+            int: number of positions updated
+
+        Raises:
+            DatabaseError: if atomic transaction to save positions fails
+            ObjectDoesNotExist: if SPAXX security does not exist
+        """
+        pos_qs = Position.objects.all()
+        if investment_accounts is not None:
+            pos_qs = pos_qs.filter(investment_account__in=investment_accounts)
+        if start_date is not None:
+            pos_qs = pos_qs.filter(eod_date__gte=start_date)
+        if end_date is not None:
+            pos_qs = pos_qs.filter(eod_date__lte=end_date)
+
+        val_df = pd.DataFrame.from_records(
+            list(pos_qs.order_by("pk").values_list("pk", "security", "security__contract_size", "eod_date", "quantity",
+                                                   "eod_price", "market_value")),
+            columns=["pk", "security", "contract_size", "eod_date", "quantity", "eod_price", "market_value"])
+        if len(val_df) == 0:
+            return 0
+
+        dp_dict = FpUtil.decimal_places_dict(Position)
+        eod_price_arr, mv_arr = cls._eod_value_arrays(val_df, SecurityMaster.objects.get(ticker="SPAXX"), dp_dict)
+        chg_arr = (eod_price_arr != FpUtil.to_scaled(val_df["eod_price"], dp_dict["eod_price"])) | \
+            (mv_arr != FpUtil.to_scaled(val_df["market_value"], dp_dict["market_value"]))
+
+        pos_list = [Position(pk=pk, eod_price=eod_price, market_value=market_value)
+                    for pk, eod_price, market_value in zip(
+                        val_df["pk"].to_numpy()[chg_arr].tolist(),
+                        FpUtil.from_scaled(eod_price_arr[chg_arr], dp_dict["eod_price"]),
+                        FpUtil.from_scaled(mv_arr[chg_arr], dp_dict["market_value"]))]
+        with transaction.atomic():
+            Position.objects.bulk_update(pos_list, ["eod_price", "market_value"], batch_size=batch_size)
+        logger.info("Revalued " + str(len(pos_list)) + " of " + str(len(val_df)) + " positions")
+
+        return len(pos_list)
+
+    @classmethod
+    def position_df(cls, row_list, core_security, dp_dict):
+        """ Create DataFrame of generated positions with end of day values
+
+        Args:
+            row_list (list[tuple]): positions from iter_position_history_by_account()
+            core_security (SecurityMaster):
+            dp_dict (dict[str, int]): Position decimal field name (keys) to decimal places (values)
+
+        Returns:
+            pd.DataFrame: investment_account (pk), eod_date and Position field columns (except id). eod_price and
+                market_value are calculated from stored close prices (see _eod_value_arrays())
+        """
+        pos_df = pd.DataFrame(row_list, columns=["investment_account", "eod_date"] + list(Lot.FIELDS))
+        cls._insert_eod_values(pos_df, core_security, dp_dict)
+        return pos_df
+
+    @classmethod
+    def _bulk_save_positions(cls, pos_df, inv_acc_dict, broker, batch_size, progress_func):
+        """ Validate and save positions with bulk_create in chunks
+
+        Args:
+            pos_df (pd.DataFrame): positions sorted by eod_date. has a ticker column
+            inv_acc_dict (dict[int, InvestmentAccount]): investment account pk (keys) to investment account (values)
+            broker (Broker): broker of all investment accounts in pos_df
+            batch_size (int): minimum number of positions per chunk
+            progress_func (Optional[Callable[[int, int], None]]): see generate_position_history()
+
+        Returns:
+            list[Position]: saved positions in pos_df order
+
+        Raises:
+            DatabaseError: if a chunk fails to save
+            ValidationError: if a position in a security broken into lots does not have an enter date
+        """
+        if broker == Broker.FIDELITY:
+            lot_sec_set = {sec for sec in pos_df["security"].drop_duplicates() if sec.has_fidelity_lots}
+            no_ed_srs = pos_df["security"].isin(lot_sec_set) & pos_df["enter_date"].isnull()
+            if no_ed_srs.any():
+                raise ValidationError(str(sorted(pos_df.loc[no_ed_srs, "ticker"].drop_duplicates().tolist())) +
+                                      " are broken into lots by FIDELITY so positions must have an enter date.")
+
+        pos_list = [Position.objects.full_constructor(
+            inv_acc_dict[row.investment_account], row.eod_date, row.security, row.quantity, row.eod_price,
+            row.market_value, row.enter_date, row.enter_price, row.enter_total, row.enter_price_net,
+            row.enter_total_net, row.cost_basis_price, row.cost_basis_total, create=False)
+            for row in pos_df.itertuples(index=False)]
+
+        eod_date_list = pos_df["eod_date"].tolist()
+        start = 0
+        while start < len(pos_list):
+            # extend the chunk through the rest of its last end of day date
+            end = min(start + batch_size, len(pos_list))
+            while end < len(pos_list) and eod_date_list[end] == eod_date_list[end - 1]:
+                end += 1
+            with transaction.atomic():
+                Position.objects.bulk_create(pos_list[start:end], batch_size=batch_size)
+            logger.info("Saved " + str(end) + " of " + str(len(pos_list)) + " positions through " +
+                        str(eod_date_list[end - 1]))
+            if progress_func is not None:
+                progress_func(end, len(pos_list))
+            start = end
+
+        return pos_list
+
+    @classmethod
+    def _eod_value_arrays(cls, val_df, core_security, dp_dict):
+        """ Calculate eod_price and market_value from stored close prices with scaled integers
+
+        Prices are matched in one merge on security and end of day date. A missing close price (e.g. market holiday or
+        missing data) is forward filled from the latest close price before the end of day date. The core security has
+        price 1. Securities without a close price on or before the end of day date have price -12345.6789.
+        market_value is quantity * contract size (1 if not set) * eod_price (see util.fixedpointutil)
+
+        Args:
+            val_df (pd.DataFrame): columns security (pk), contract_size (int or None), eod_date (datetime.date),
+                quantity (Decimal)
+            core_security (SecurityMaster):
+            dp_dict (dict[str, int]): Position decimal field name (keys) to decimal places (values)
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: int64 arrays of eod_price scaled by 10 ** dp_dict["eod_price"] and
+                market_value scaled by 10 ** dp_dict["market_value"] in val_df order
+        """
+        price_dp = dp_dict["eod_price"]
+        sec_arr = val_df["security"].to_numpy(dtype=np.int64)
+        core_arr = sec_arr == core_security.pk
+        eod_price_arr = np.where(core_arr, 10 ** price_dp, FpUtil.to_scaled([Decimal("-12345.6789")], price_dp)[0])
+
+        if not core_arr.all():
+            eod_date_srs = pd.to_datetime(val_df["eod_date"])
+            price_df = DailyPrice.objects.close_price_df(np.unique(sec_arr[~core_arr]).tolist(),
+                                                         eod_date_srs.min().date(), eod_date_srs.max().date())
+            if len(price_df) > 0:
+                price_df["close"] = FpUtil.to_scaled(price_df["close"], price_dp)
+                left_df = pd.DataFrame({"security": sec_arr, "eod_date": eod_date_srs.to_numpy(),
+                                        "row": np.arange(len(sec_arr))}).sort_values("eod_date", kind="stable")
+                merge_df = pd.merge_asof(left_df, price_df, left_on="eod_date", right_on="price_date", by="security",
+                                         direction="backward")
+                merge_df = merge_df[merge_df["close"].notna().to_numpy() & ~core_arr[merge_df["row"].to_numpy()]]
+                eod_price_arr[merge_df["row"].to_numpy()] = merge_df["close"].to_numpy(dtype=np.int64)
+
+        cs_arr = val_df["contract_size"].fillna(1).to_numpy(dtype=np.int64)
+        mv_arr = FpUtil.mul(FpUtil.to_scaled(val_df["quantity"], dp_dict["quantity"]) * cs_arr, dp_dict["quantity"],
+                            eod_price_arr, price_dp, dp_dict["market_value"])
+        return eod_price_arr, mv_arr
+
+    @classmethod
+    def _insert_eod_values(cls, pos_df, core_security, dp_dict):
+        """ Insert eod_price and market_value columns after the quantity column of pos_df
+
+        See _eod_value_arrays()
+        """
+        sec_code_arr, sec_uniques = pd.factorize(pos_df["security"])
+        val_df = pd.DataFrame({
+            "security": np.array([sec.pk for sec in sec_uniques], dtype=np.int64)[sec_code_arr],
+            "contract_size": pd.array([sec.contract_size for sec in sec_uniques], dtype="Int64")[sec_code_arr],
+            "eod_date": pos_df["eod_date"].to_numpy(), "quantity": pos_df["quantity"].to_numpy()})
+        eod_price_arr, mv_arr = cls._eod_value_arrays(val_df, core_security, dp_dict)
+        pos_df.insert(pos_df.columns.get_loc("quantity") + 1, "eod_price",
+                      FpUtil.from_scaled(eod_price_arr, dp_dict["eod_price"]))
+        pos_df.insert(pos_df.columns.get_loc("eod_price") + 1, "market_value",
+                      FpUtil.from_scaled(mv_arr, dp_dict["market_value"]))
+
+    @classmethod
+    def _lot_book_from_positions(cls, inv_acc, eod_date, core_security, dp_dict, intervals=False):
+        """ Create LotBook with the positions (or position intervals) of inv_acc on eod_date """
+        lot_book = LotBook(core_security, dp_dict)
+        if intervals:
+            pos_qs = PositionInterval.objects.valid_on(inv_acc, eod_date).order_by(
+                "security__ticker", "enter_date", "pk")
+        else:
+            pos_qs = Position.objects.filter(investment_account=inv_acc, eod_date=eod_date).order_by("pk")
+        for pos in pos_qs.select_related("security"):
+            lot_book.add_lot(pos.security, pos.quantity, pos.enter_date, pos.enter_price, pos.enter_total,
+                             pos.enter_price_net, pos.enter_total_net, pos.cost_basis_price, pos.cost_basis_total)
+        return lot_book
+
+    @classmethod
+    def _merger_dict(cls, trans_df):
+        """ Create dict of merger ticker history for the merger transactions in trans_df
+
+        Args:
+            trans_df (pd.DataFrame): transactions. security column has SecurityMaster instances
+
+        Returns:
+            dict[tuple[int, datetime.date], TickerHistory]: (security pk, change date) (keys) to merger ticker history
+                (values)
+        """
+        merger_srs = (trans_df["trans_type"] == TransactionType.CORP_ACT.value) & \
+            (trans_df["action_type"] == ActionType.MERGER_NEW.value)
+        if not merger_srs.any():
+            return {}
+        sec_pk_list = [sec.pk for sec in trans_df.loc[merger_srs, "security"].drop_duplicates()]
+        return {(th.security_id, th.change_date): th for th in TickerHistory.objects.filter(
+            security__in=sec_pk_list, change_type=ChangeType.MERGER)}
+
+    @classmethod
+    def _save_intervals(cls, pos_df, inv_acc_dict, dp_dict):
+        """ Save generated positions as PositionInterval
+
+        Positions are compared at database precision. An interval is extended while the same position exists on the
+        next business day. Existing intervals that end on the business day before an account's first generated date
+        are extended the same way.
+
+        Args:
+            pos_df (pd.DataFrame): positions sorted by eod_date. has a ticker column
+            inv_acc_dict (dict[int, InvestmentAccount]): investment account pk (keys) to investment account (values)
+            dp_dict (dict[str, int]): Position decimal field name (keys) to decimal places (values)
+
+        Returns:
+            list[PositionInterval]: intervals created or extended, sorted by valid from date, account, security ticker,
+                enter date
+
+        Raises:
+            DatabaseError: if atomic transaction to save intervals fails
+        """
+        state_col_list = ["quantity", "enter_price", "enter_total", "enter_price_net", "enter_total_net",
+                          "cost_basis_price", "cost_basis_total"]
+        prev_biz_day_dict = {}
+
+        def prev_biz_day(date):
+            if date not in prev_biz_day_dict:
+                prev_biz_day_dict[date] = PyUtil.change_dt_date(date, biz_days=-1)
+            return prev_biz_day_dict[date]
+
+        def state_key(acc_pk, security, enter_date, val_list):
+            return (acc_pk, security.pk, enter_date) + tuple(val_list)
+
+        # state key (keys) to intervals with that state (values). duplicate lots have the same state key
+        open_dict = {}
+        for acc_pk, first_date in pos_df.groupby("investment_account")["eod_date"].min().items():
+            for pi in PositionInterval.objects.filter(investment_account=acc_pk, valid_to=prev_biz_day(first_date))\
+                    .select_related("security"):
+                open_dict.setdefault(state_key(acc_pk, pi.security, pi.enter_date, [getattr(pi, col) for col in
+                                                                                    state_col_list]), []).append(pi)
+
+        new_pi_list = []
+        extended_pi_dict = {}
+        for row in pos_df.itertuples(index=False):
+            val_list = [None if getattr(row, col) is None else round(getattr(row, col), dp_dict[col])
+                        for col in state_col_list]
+            key = state_key(row.investment_account, row.security, row.enter_date, val_list)
+            pi_list = open_dict.setdefault(key, [])
+            pi = next((pi for pi in pi_list if pi.valid_to == prev_biz_day(row.eod_date)), None)
+            if pi is None:
+                pi = PositionInterval(investment_account=inv_acc_dict[row.investment_account], security=row.security,
+                                      valid_from=row.eod_date, valid_to=row.eod_date, enter_date=row.enter_date,
+                                      **dict(zip(state_col_list, val_list)))
+                pi_list.append(pi)
+                new_pi_list.append(pi)
+            else:
+                pi.valid_to = row.eod_date
+                if pi.pk is not None:
+                    extended_pi_dict[pi.pk] = pi
+
+        with transaction.atomic():
+            PositionInterval.objects.bulk_update(list(extended_pi_dict.values()), ["valid_to"])
+            PositionInterval.objects.bulk_create(new_pi_list)
+
+        return sorted(list(extended_pi_dict.values()) + new_pi_list, key=lambda x: (
+            x.valid_from, x.investment_account.pk, x.security.ticker, x.enter_date is None,
+            x.enter_date or x.valid_from))
+
+
+class PositionInterval(models.Model):
+    """ Position Interval Model
+
+    Position by lot that is unchanged from valid_from through valid_to. Equivalent to one Position for each business day
+    from valid_from through valid_to (see PositionIntervalManager.expand()). eod_price and market_value change daily so
+    they are not stored.
+
+    Attributes:
+        investment_account (InvestmentAccount):
+        security (SecurityMaster):
+        valid_from (datetime.date): first end of day date of this position
+        valid_to (datetime.date): last end of day date of this position (inclusive)
+        see Position class docstring for all other attributes
+    """
+
+    investment_account = models.ForeignKey(InvestmentAccount, models.PROTECT)
+    security = models.ForeignKey(SecurityMaster, models.PROTECT)
+    valid_from = models.DateField()
+    valid_to = models.DateField()
+    quantity = models.DecimalField(max_digits=12, decimal_places=4)
+    enter_date = models.DateField(blank=True, null=True, help_text="Required if broker breaks position into lots.")
+    enter_price = models.DecimalField(max_digits=9, decimal_places=4)
+    enter_total = models.DecimalField(max_digits=12, decimal_places=2)
+    enter_price_net = models.DecimalField(max_digits=9, decimal_places=4)
+    enter_total_net = models.DecimalField(max_digits=12, decimal_places=2)
+    cost_basis_price = models.DecimalField(max_digits=9, decimal_places=4, blank=True, null=True)
+    cost_basis_total = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+
+    objects = PositionIntervalManager()
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(check=models.Q(valid_from__lte=models.F("valid_to")),
+                                   name="check_%(app_label)s_%(class)s_valid_from_valid_to")]
+        indexes = [models.Index(fields=["investment_account", "valid_to", "valid_from"])]
+
+    def __repr__(self):
+        return repr(self.investment_account) + ", " + repr(self.security) + ", " + repr(self.quantity) + ", " + \
+            repr(self.enter_date) + ", " + repr(self.valid_from) + ", " + repr(self.valid_to)
+
+    def __str__(self):
+        return self.investment_account.broker + ", " + self.investment_account.account_name + ", " + \
+            self.security.ticker + ", " + str(self.quantity) + ", " + str(self.enter_date) + ", " + \
+            str(self.valid_from) + " - " + str(self.valid_to)
@@ -4,10 +4,39 @@ import datetime
 
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import RegexValidator, ValidationError
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
 from django.utils.translation import gettext_lazy
 
 
+class MyIdSequenceManager(models.Manager):
+
+    def reserve(self, asset_class, count):
+        """ Reserve a block of count my_id numbers for asset_class
+
+        The counter row is locked with select_for_update and advanced by count so concurrent callers get separate
+        blocks. A missing counter row is created starting at the largest my_id number of the asset class.
+
+        Args:
+            asset_class (AssetClass):
+            count (int): number of my_id numbers to reserve
+
+        Returns:
+            int: first reserved number. numbers first through first + count - 1 are reserved
+        """
+        with transaction.atomic():
+            seq = self.select_for_update().filter(asset_class=asset_class).first()
+            if seq is None:
+                max_my_id = SecurityMaster.objects.filter(asset_class=asset_class).aggregate(
+                    models.Max("my_id"))["my_id__max"]
+                seq = self.select_for_update().get_or_create(
+                    asset_class=asset_class, defaults={"last_value": 0 if max_my_id is None else int(max_my_id[3:])})[0]
+            first = seq.last_value + 1
+            if count > 0:
+                seq.last_value += count
+                seq.save(update_fields=["last_value"])
+        return first
+
+
 class SecurityMasterDataManager(models.Manager):
 
     def change_ticker(self, old_ticker, new_ticker):
@@ -82,6 +111,51 @@ class SecurityMasterDataManager(models.Manager):
         except ObjectDoesNotExist:
             return self.create_default(ticker, has_fidelity_lots=has_fidelity_lots)
 
+    def get_or_create_defaults(self, tickers, has_fidelity_lots=True, sec_dict=None):
+        """ Get SecurityMaster objects for tickers or create defaults in bulk
+
+        Bulk version of get_or_create_default(). Existing objects are fetched with one query and all missing defaults
+        are created with one bulk_create using a block of consecutive AssetClass.NOT_SET my_ids. sec_dict is a cache
+        that can be kept for the duration of an import so each ticker is resolved once.
+
+        Args:
+            tickers (Iterable[str]): security tickers. duplicates are ignored
+            has_fidelity_lots (Union[boolean, dict[str, boolean]]): See create_default(). one value for all created
+                objects or ticker to value. Default True
+            sec_dict (Optional[dict[str, SecurityMaster]]): ticker to SecurityMaster object cache. tickers in sec_dict
+                are not looked up. updated with the objects for tickers. Default None for a new cache
+
+        Returns:
+            tuple[dict[str, SecurityMaster], list[SecurityMaster]]: sec_dict, default objects created in the order of
+                their tickers in tickers
+        """
+        sec_dict = {} if sec_dict is None else sec_dict
+        tickers = [t for t in dict.fromkeys(tickers) if t not in sec_dict]
+        sec_dict.update(self.field_to_security_dict("ticker", tickers))
+        missing_list = [t for t in tickers if t not in sec_dict]
+        if not missing_list:
+            return sec_dict, []
+
+        my_ids = SecurityMaster.generate_my_ids(AssetClass.NOT_SET, len(missing_list))
+        sec_ns_list = [SecurityMaster(
+            my_id=my_id, ticker=t, asset_class=AssetClass.NOT_SET, asset_subclass=AssetSubClass.NOT_SET,
+            has_fidelity_lots=has_fidelity_lots[t] if isinstance(has_fidelity_lots, dict) else has_fidelity_lots)
+            for my_id, t in zip(my_ids, missing_list)]
+        try:
+            with transaction.atomic():
+                self.bulk_create(sec_ns_list)
+        except IntegrityError:
+            # another process created some of the tickers or my_ids. create one at a time
+            sec_ns_list = [self.get_or_create_default(sec.ticker, has_fidelity_lots=sec.has_fidelity_lots)
+                           for sec in sec_ns_list]
+        else:
+            if not connections[self.db].features.can_return_rows_from_bulk_insert:
+                # primary keys are not set on created objects
+                created_dict = self.field_to_security_dict("ticker", missing_list)
+                sec_ns_list = [created_dict[t] for t in missing_list]
+        sec_dict.update({sec.ticker: sec for sec in sec_ns_list})
+        return sec_dict, sec_ns_list
+
     def field_to_security_dict(self, key_field, keys):
         """ Create dict of key_field to security with that key_field value
 
@@ -305,7 +379,11 @@ class SecurityMaster(models.Model):
         self._validate_my_id_full()
         self._validate_asset_sub_class_for_asset_class()
         self._validate_option_data()
-        return super().save(*args, **kwargs)
+        ret = super().save(*args, **kwargs)
+        # keep the my_id counter ahead of my_ids that were set directly
+        MyIdSequence.objects.filter(asset_class=self.asset_class, last_value__lt=int(self.my_id[3:])).update(
+            last_value=int(self.my_id[3:]))
+        return ret
 
     def _validate_asset_sub_class_for_asset_class(self):
         if AssetClass(self.asset_class) != AssetSubClass.get_class(AssetSubClass(self.asset_subclass)):
@@ -331,8 +409,8 @@ class SecurityMaster(models.Model):
     def generate_my_id(cls, asset_class):
         """ Generate next available my_id for this asset class
 
-        The letters after the _ are all digits. Find the max of these and add 1 to it. If no securities for asset class
-        found, the digits are set to "0000001"
+        The letters after the _ are all digits. The next number is taken from the asset class MyIdSequence counter,
+        which starts after the max of these. If no securities for asset class found, the digits are set to "0000001"
 
         Args:
             asset_class (AssetClass): generate next available my_id for this asset class
@@ -340,10 +418,25 @@ class SecurityMaster(models.Model):
         Returns:
             str: next available my_id for this asset class
         """
-        max_my_id = SecurityMaster.objects.filter(asset_class=asset_class).aggregate(models.Max("my_id"))["my_id__max"]
-        if max_my_id is None:
-            max_my_id = AssetClass.get_my_id_prefix(asset_class) + "0000000"
-        return AssetClass.get_my_id_prefix(asset_class) + str(int(max_my_id[3:]) + 1).zfill(7)
+        return SecurityMaster.generate_my_ids(asset_class, 1)[0]
+
+    @classmethod
+    def generate_my_ids(cls, asset_class, count):
+        """ Generate the next count available my_ids for this asset class
+
+        The block is reserved with one MyIdSequence update so concurrent callers never get the same my_id. See
+        generate_my_id()
+
+        Args:
+            asset_class (AssetClass): generate next available my_ids for this asset class
+            count (int): number of my_ids
+
+        Returns:
+            list[str]: consecutive my_ids starting at the next available my_id for this asset class
+        """
+        prefix = AssetClass.get_my_id_prefix(asset_class)
+        first = MyIdSequence.objects.reserve(asset_class, count)
+        return [prefix + str(num).zfill(7) for num in range(first, first + count)]
 
     @classmethod
     def get_option_data_from_ticker(cls, ticker):
@@ -394,6 +487,25 @@ class SecurityMaster(models.Model):
                                "all characters after '_' must be digits 0-9.")(my_id)
 
 
+class MyIdSequence(models.Model):
+    """ my_id Sequence
+
+    Per asset class counter of the last my_id number given out by SecurityMaster.generate_my_id(). Replaces a max
+    aggregate over SecurityMaster for each new my_id and keeps concurrent imports from getting the same my_id
+
+    Attributes:
+        asset_class (AssetClass):
+        last_value (int): last reserved my_id number of the asset class
+    """
+    asset_class = models.CharField(max_length=20, choices=SecurityMaster.AssetClass.choices, unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    objects = MyIdSequenceManager()
+
+    def __str__(self):
+        return self.asset_class + ", " + str(self.last_value)
+
+
 class TickerHistory(models.Model):
     """ Ticker History
 
@@ -1,5 +1,3 @@
-import datetime
-from decimal import Decimal
 from typing import Optional, Union
 
 import numpy as np
@@ -11,6 +9,8 @@ import pandas as pd
 
 from ..models.investmentaccount import Broker, InvestmentAccount
 from ..models.securitymaster import ChangeType, SecurityMaster, TickerHistory
+import util.fixedpointutil as FpUtil
+import util.pandasutil as PdUtil
 
 
 class Transaction(models.Model):
@@ -28,8 +28,14 @@ class Transaction(models.Model):
         amount_net (Decimal): transaction amount (after commission and fees)
         commission (Decimal):
         fees (Decimal):
+        content_hash (Optional[str]): sha256 hex digest of the row content for transactions loaded from a file. used to
+            skip transactions that were already loaded. None for transactions not loaded from a file
+        upload_job (Optional[UploadJob]): job that loaded the transaction. None if not loaded by an upload job
 
     """
+    class Meta:
+        indexes = [models.Index(fields=["investment_account", "trans_date"])]
+
     class ActionType(models.TextChoices):
         BUY = "BUY", gettext_lazy("Buy")
         BUY_COVER = "BUY_COVER", gettext_lazy("Buy Cover")
@@ -107,6 +113,37 @@ class Transaction(models.Model):
     amount_net = models.DecimalField(max_digits=12, decimal_places=2)
     commission = models.DecimalField(max_digits=6, decimal_places=2)
     fees = models.DecimalField(max_digits=6, decimal_places=2)
+    content_hash = models.CharField(max_length=64, unique=True, blank=True, null=True, editable=False)
+    upload_job = models.ForeignKey("UploadJob", models.SET_NULL, blank=True, null=True, editable=False)
+
+    # Fidelity history description rules in match order (the first matching rule is used). (match, pattern,
+    # TransactionType, ActionType) where match is one of "exact", "prefix", "suffix". DISTRIBUTION is a STOCK_SPLIT if
+    # quantity is positive and a STOCK_CONS if quantity is negative
+    FIDELITY_DESCRIPTION_RULES = (
+        ("exact", "DIVIDEND RECEIVED", TransactionType.CORP_ACT, ActionType.DIV),
+        ("suffix", "MARK TO MARKET ADJ", TransactionType.OTHER, ActionType.LOAN),
+        ("prefix", "YOU LOANED", TransactionType.OTHER, ActionType.LOAN),
+        ("prefix", "LOAN RETURNED", TransactionType.OTHER, ActionType.LOAN),
+        ("prefix", "REINVESTMENT", TransactionType.TRADE, ActionType.BUY),
+        ("exact", "YOU BOUGHT", TransactionType.TRADE, ActionType.BUY),
+        ("prefix", "CONTRIB", TransactionType.TRANSFER, ActionType.TRANSFER),
+        ("prefix", "MONEY LINE", TransactionType.TRANSFER, ActionType.TRANSFER),
+        ("prefix", "ROLLOVER CASH", TransactionType.TRANSFER, ActionType.TRANSFER),
+        ("prefix", "TRANSFER OF ASSETS", TransactionType.TRANSFER, ActionType.TRANSFER),
+        ("prefix", "TRANSFERRED TO", TransactionType.TRANSFER, ActionType.TRANSFER),
+        ("prefix", "WIRE TRANS", TransactionType.TRANSFER, ActionType.TRANSFER),
+        ("exact", "RECEIVED FROM YOU", TransactionType.TRANSFER, ActionType.TRANSFER),
+        ("exact", "INTEREST", TransactionType.INTEREST, ActionType.INT_PMT),
+        ("exact", "YOU SOLD", TransactionType.TRADE, ActionType.SELL),
+        ("exact", "YOU SOLD OPENING TRANSACTION", TransactionType.TRADE, ActionType.SELL_SHORT),
+        ("prefix", "EXPIRED CALL", TransactionType.OTHER, ActionType.OPT_EXP),
+        ("prefix", "EXPIRED PUT", TransactionType.OTHER, ActionType.OPT_EXP),
+        ("exact", "YOU BOUGHT CLOSING TRANSACTION", TransactionType.TRADE, ActionType.BUY_COVER),
+        ("exact", "FEE CHARGED", TransactionType.OTHER, ActionType.FEE),
+        ("exact", "DISTRIBUTION", TransactionType.CORP_ACT, ActionType.STOCK_SPLIT),
+        ("prefix", "MERGER MER FROM", TransactionType.CORP_ACT, ActionType.MERGER_NEW),
+        ("prefix", "MERGER MER", TransactionType.CORP_ACT, ActionType.MERGER_OLD),
+    )
 
     def __repr__(self):
         return repr(self.investment_account) + ", " + repr(self.trans_date) + ", " + repr(self.trans_type) + ", " + \
@@ -138,80 +175,63 @@ class Transaction(models.Model):
             raise ValidationError("A security must be selected for transaction type: " + str(self.trans_type))
 
     @classmethod
-    def load_transactions_from_fidelity_file(cls, file):
+    def content_hash_srs(cls, trans_df):
+        """ Create content hashes of transactions
+
+        Security is not included so a ticker change does not change the hash. Identical transactions are numbered in
+        order (see PdUtil.row_hashes()) so each gets a different hash.
+
+        Args:
+            trans_df (pd.DataFrame): columns investment_account (pk), trans_date (datetime.date), trans_type,
+                action_type, description, quantity, price, amount_net, commission, fees. decimal field columns are
+                scaled ints by field decimal places (None if null)
+
+        Returns:
+            pd.Series: sha256 hex digests (str) with trans_df index
+        """
+        return PdUtil.row_hashes(trans_df[[
+            "investment_account", "trans_date", "trans_type", "action_type", "description", "quantity", "price",
+            "amount_net", "commission", "fees"]])
+
+    @classmethod
+    def load_transactions_from_fidelity_file(cls, file, bulk=False, batch_size=5000, progress_func=None):
         """ Open Fidelity file and create and return transactions
 
         File must be csv from Fidelity Active Trader Pro -> Accounts -> History. Columns must be: Date, Account,
         Symbol, Description, Currency, Quantity, Price, Amount, Commission, Fees, Type.
-        Transactions in the file will not be created if there already exists transactions with the same investment
-        account and transaction date. This is to prevent the same transaction being saved more than once.
+        Each row's content is hashed (see content_hash_srs()). Rows with a content hash that is already saved are not
+        created, so files with overlapping dates can be loaded and a partially loaded date is completed by loading it
+        again. Files are expected to have all transactions of each date in the file (Fidelity history is exported by
+        date range) since identical transactions on a date are told apart by their order.
+        Bulk mode: the rules checked by save() are checked for all new transactions at once before any securities are
+            created, then merger ticker history records are saved with bulk_create and transactions are saved with
+            bulk_create, one atomic transaction per batch of batch_size. if a batch fails, earlier batches stay saved
+            and the file can be loaded again to save the rest.
 
         Args:
             file (Union[str, django.core.files.base.File]): name of file in media directory /files/input/transactions/
                 or a File object. file is expected to be csv
+            bulk (boolean): True to validate all transactions at once and save with bulk_create. Default False to save
+                transactions one at a time
+            batch_size (int): number of transactions per batch in bulk mode. Default 5000
+            progress_func (Optional[Callable[[int, int], None]]): called in bulk mode after each batch is saved with the
+                number of transactions saved so far and the total number to save. Default None
 
         Returns:
             tuple[list[Transaction], list[SecurityMaster], set[tuple[InvestmentAccount, datetime.date]]]:
-                Transaction instances with investment account / transaction date combinations that have no records are
-                saved to the database, SecurityMaster list contains securities that did not exist but were created and
-                set to default, set of investment account / transaction date combinations that have records in the
-                database already (we dont want to create multiple copies of the same transaction)
+                Transaction instances with new content hashes are saved to the database, SecurityMaster list contains
+                securities that did not exist but were created and set to default, set of investment account /
+                transaction date combinations with transactions that were saved already and were not created again
 
         Raises:
-            DatabaseError: if atomic transaction to save all transactions fails
+            DatabaseError: if saving transactions fails. all transactions are saved in one atomic transaction unless
+                bulk is True
             ObjectDoesNotExist: if investment account not found
+            ValidationError: if a transaction action type does not match its transaction type, if a transaction does
+                not have a security and its transaction type requires one
             ValueError: if a DISTRIBUTION transaction quantity is 0, if unable to match transaction description with
                 a TransactionType and ActionType, transactions have trans_date before account create date
         """
-        def get_trans_act_type(desc_str, qty):
-            # arranged roughly from most likely to least likely transaction/action types
-            if desc_str == "DIVIDEND RECEIVED":
-                return TransactionType.CORP_ACT, ActionType.DIV
-            elif desc_str[-18:] == "MARK TO MARKET ADJ" or desc_str[:10] == "YOU LOANED" or \
-                    desc_str[:13] == "LOAN RETURNED":
-                return TransactionType.OTHER, ActionType.LOAN
-            elif desc_str[:12] == "REINVESTMENT" or desc_str == "YOU BOUGHT":
-                return TransactionType.TRADE, ActionType.BUY
-            elif desc_str[:7] == "CONTRIB" or desc_str[:10] == "MONEY LINE" or desc_str[:13] == "ROLLOVER CASH" or \
-                    desc_str[:18] == "TRANSFER OF ASSETS" or desc_str[:14] == "TRANSFERRED TO" or \
-                    desc_str[:10] == "WIRE TRANS" or desc_str == "RECEIVED FROM YOU":
-                return TransactionType.TRANSFER, ActionType.TRANSFER
-            elif desc_str == "INTEREST":
-                return TransactionType.INTEREST, ActionType.INT_PMT
-            elif desc_str == "YOU SOLD":
-                return TransactionType.TRADE, ActionType.SELL
-            elif desc_str == "YOU SOLD OPENING TRANSACTION":
-                return TransactionType.TRADE, ActionType.SELL_SHORT
-            elif desc_str[:12] == "EXPIRED CALL" or desc_str[:11] == "EXPIRED PUT":
-                return TransactionType.OTHER, ActionType.OPT_EXP
-            elif desc_str == "YOU BOUGHT CLOSING TRANSACTION":
-                return TransactionType.TRADE, ActionType.BUY_COVER
-            elif desc_str == "FEE CHARGED":
-                return TransactionType.OTHER, ActionType.FEE
-            elif desc_str == "DISTRIBUTION":
-                if Decimal.is_zero(qty):
-                    raise ValueError("Quantity is 0 for DISTRIBUTION transaction. How to handle this?")
-                return TransactionType.CORP_ACT, (ActionType.STOCK_SPLIT if qty > Decimal(0) else ActionType.STOCK_CONS)
-            elif desc_str[:10] == "MERGER MER":
-                return TransactionType.CORP_ACT, \
-                    ActionType.MERGER_NEW if desc_str[11:15] == "FROM" else ActionType.MERGER_OLD
-            else:
-                raise ValueError("Unable to match description: '" + desc_str +
-                                 "' with a transaction type and action type")
-
-        dp_dict = {}
-        for f in Transaction._meta.get_fields():
-            if f.name == "quantity":
-                dp_dict["Quantity"] = f.decimal_places
-            elif f.name == "price":
-                dp_dict["Price"] = f.decimal_places
-            elif f.name == "amount_net":
-                dp_dict["Amount"] = f.decimal_places
-            elif f.name == "commission":
-                dp_dict["Commission"] = f.decimal_places
-            elif f.name == "fees":
-                dp_dict["Fees"] = f.decimal_places
-
         df = pd.read_csv(file, names=list(range(11)))
         df.columns = df.loc[5]
         df = df[6:-1]
@@ -219,21 +239,27 @@ class Transaction(models.Model):
         df.insert(1, "Account ID", df["Account"].fillna("1").str.split(" ").str[-1])
         df["Account ID"] = df["Account ID"].map(lambda x: x[1:-1] if x[0] == "(" and x[-1] == ")" else np.nan)
         df["Symbol"] = df["Symbol"].replace({np.nan: None})
-        for col in ["Quantity", "Price", "Amount", "Commission", "Fees"]:
-            df[col] = df[col].str.replace("[$,]", "", regex=True).map(lambda x: round(Decimal(x), dp_dict[col]))
-        # must do this after Quantity is converted to a Decimal
-        df[["Transaction Type", "Action Type"]] = df.apply(
-            lambda row: get_trans_act_type(row["Description"], row["Quantity"]), axis=1,
-            result_type="expand")
+        dp_dict = FpUtil.decimal_places_dict(Transaction)
+        scaled_dict = {}
+        for col, field in [("Quantity", "quantity"), ("Price", "price"), ("Amount", "amount_net"),
+                           ("Commission", "commission"), ("Fees", "fees")]:
+            scaled_dict[col] = FpUtil.str_to_scaled(
+                df[col].str.replace("$", "", regex=False).str.replace(",", "", regex=False), dp_dict[field])
+            # only create a Decimal for each unique value. commission, fees and quantity are mostly repeated values
+            code_arr, uniq_arr = pd.factorize(scaled_dict[col])
+            df[col] = np.array(FpUtil.from_scaled(uniq_arr, dp_dict[field]), dtype=object)[code_arr]
+
+        df[["Transaction Type", "Action Type"]] = Transaction._fidelity_trans_act_type_df(df["Description"],
+                                                                                          scaled_dict["Quantity"])
         # the transaction date for option expiration is at least a day after the option actually expires. set the
         # transaction date to the date in the description
         oe_rows = (df["Transaction Type"] == TransactionType.OTHER.value) & (df["Action Type"] == ActionType.OPT_EXP)
-        df.loc[oe_rows, "Date"] = df.loc[oe_rows, "Description"].str.split(" ").map(
-            lambda x: datetime.datetime.strptime(x[-4] + "-" + x[-3] + "-20" + x[-2], "%b-%d-%Y").date())
+        oe_word_srs = df.loc[oe_rows, "Description"].str.split(" ")
+        df.loc[oe_rows, "Date"] = pd.to_datetime(
+            oe_word_srs.str[-4] + "-" + oe_word_srs.str[-3] + "-20" + oe_word_srs.str[-2], format="%b-%d-%Y").dt.date
 
         acc_dict = InvestmentAccount.objects.field_to_account_dict(
             "account_id", df["Account ID"].drop_duplicates().tolist(), Broker.FIDELITY)
-        sec_dict = SecurityMaster.objects.field_to_security_dict("ticker", df["Symbol"].drop_duplicates().tolist())
 
         for acc_id, acc in acc_dict.items():
             oldest_trans_date = df.loc[df["Account ID"] == acc_id, "Date"].min()
@@ -241,81 +267,103 @@ class Transaction(models.Model):
                 raise ValueError(str(acc) + ": earliest transaction is on " + str(oldest_trans_date) +
                                  ". This is before the account create_date of " + str(acc.create_date))
 
-        # investment account and date combinations that have transaction(s) saved already
-        rem_acc_dates = list(Transaction.objects.values("investment_account", "trans_date").distinct())
-        rem_acc_dates = [(d["investment_account"], d["trans_date"]) for d in rem_acc_dates]
-
-        sec_ns_list = []
+        missing_acc_rows = ~df["Account ID"].isin(acc_dict.keys())
+        if missing_acc_rows.any():
+            raise ObjectDoesNotExist("Account ID: " + str(df.loc[missing_acc_rows, "Account ID"].iloc[0]) +
+                                     " does not exist as a " + str(Broker.FIDELITY) + " account")
+
+        df["Content Hash"] = Transaction.content_hash_srs(pd.DataFrame({
+            "investment_account": df["Account ID"].map({acc_id: acc.pk for acc_id, acc in acc_dict.items()}),
+            "trans_date": df["Date"], "trans_type": df["Transaction Type"], "action_type": df["Action Type"],
+            "description": df["Description"], "quantity": scaled_dict["Quantity"], "price": scaled_dict["Price"],
+            "amount_net": scaled_dict["Amount"], "commission": scaled_dict["Commission"],
+            "fees": scaled_dict["Fees"]}, index=df.index))
+        # one lookup of saved hashes limited to the accounts and dates in the file
+        exist_hash_set = set(Transaction.objects.filter(
+            investment_account__in=list(acc_dict.values()), trans_date__gte=df["Date"].min(),
+            trans_date__lte=df["Date"].max(), content_hash__isnull=False).values_list("content_hash", flat=True))
+        exist_rows = df["Content Hash"].isin(exist_hash_set)
+        exist_inv_acc_dates_set = {(acc_dict[acc_id], trans_date) for acc_id, trans_date in
+                                   df.loc[exist_rows, ["Account ID", "Date"]].drop_duplicates().itertuples(index=False)}
+        df = df[~exist_rows]
+
+        if bulk:
+            Transaction.validate_df(df[["Transaction Type", "Action Type", "Symbol"]].set_axis(
+                ["trans_type", "action_type", "security"], axis=1))
+
+        sec_dict, sec_ns_list = SecurityMaster.objects.get_or_create_defaults(
+            df["Symbol"].dropna().drop_duplicates().tolist())
         trans_list = []
-        exist_inv_acc_dates_set = set()
-        for ind, row in df.iterrows():
-            try:
-                inv_acc = acc_dict[row["Account ID"]]
-            except KeyError:
-                raise ObjectDoesNotExist("Account ID: " + row["Account ID"] + " does not exist as a " +
-                                         str(Broker.FIDELITY) + " account")
-
-            # don't keep transaction if its investment account and date combo has saved transaction(s)
-            if (inv_acc.pk, row["Date"]) in rem_acc_dates:
-                exist_inv_acc_dates_set.add((inv_acc, row["Date"]))
-                continue
-
-            if row["Symbol"] is None:
-                security = None
-            else:
-                security = sec_dict.get(row["Symbol"], None)
-                if security is None:
-                    security = SecurityMaster.objects.get_or_create_default(row["Symbol"])
-                    sec_ns_list.append(security)
-                    sec_dict[row["Symbol"]] = security
+        th_list = []
+        for acc_id, trans_date, trans_type, action_type, desc, symbol, qty, price, amount, commission, fees, \
+                content_hash in df[["Account ID", "Date", "Transaction Type", "Action Type", "Description", "Symbol",
+                                    "Quantity", "Price", "Amount", "Commission", "Fees", "Content Hash"]].itertuples(
+                index=False, name=None):
+            security = None if symbol is None else sec_dict[symbol]
 
             # create a ticker history record for mergers
-            if row["Action Type"] == ActionType.MERGER_NEW.value:
-                old_ticker = row["Description"][16: row["Description"].find("#")]
-                try:
-                    TickerHistory.objects.create(security=security, new_ticker=row["Symbol"], old_ticker=old_ticker,
-                                                 change_date=row["Date"], change_type=ChangeType.MERGER)
-                except IntegrityError:
-                    # ok to pass. this ticker history record was already created
-                    pass
+            if action_type == ActionType.MERGER_NEW.value:
+                th = TickerHistory(security=security, new_ticker=symbol, old_ticker=desc[16: desc.find("#")],
+                                   change_date=trans_date, change_type=ChangeType.MERGER)
+                if bulk:
+                    th_list.append(th)
+                else:
+                    try:
+                        th.save()
+                    except IntegrityError:
+                        # ok to pass. this ticker history record was already created
+                        pass
 
             trans_list.append(Transaction(
-                investment_account=inv_acc, trans_date=row["Date"], trans_type=row["Transaction Type"],
-                action_type=row["Action Type"], description=row["Description"], security=security,
-                quantity=row["Quantity"], price=row["Price"], amount_net=row["Amount"], commission=row["Commission"],
-                fees=row["Fees"]))
-
-        with transaction.atomic():
-            for t in trans_list:
-                t.save()
+                investment_account=acc_dict[acc_id], trans_date=trans_date, trans_type=trans_type,
+                action_type=action_type, description=desc, security=security, quantity=qty, price=price,
+                amount_net=amount, commission=commission, fees=fees, content_hash=content_hash))
+
+        if bulk:
+            # ticker history records that were already created are skipped
+            TickerHistory.objects.bulk_create(th_list, ignore_conflicts=True)
+            for start in range(0, len(trans_list), batch_size):
+                with transaction.atomic():
+                    Transaction.objects.bulk_create(trans_list[start:start + batch_size])
+                if progress_func is not None:
+                    progress_func(min(start + batch_size, len(trans_list)), len(trans_list))
+        else:
+            with transaction.atomic():
+                for t in trans_list:
+                    t.save()
 
         return trans_list, sec_ns_list, exist_inv_acc_dates_set
 
     @classmethod
-    def load_transactions_from_file(cls, broker, file):
+    def load_transactions_from_file(cls, broker, file, bulk=False, batch_size=5000, progress_func=None):
         """ Open file and create and return transactions
 
         If a ticker/symbol is not found, a default SecurityMaster object for that ticker/symbol will be created
-        Transactions in the file will not be created if there already exists transactions with the same investment
-        account and transaction date. This is to prevent the same transaction being saved more than once.
+        Transactions in the file will not be created if they were saved already (same content hash). This is to
+        prevent the same transaction being saved more than once.
 
         Args:
             broker (Broker): load transactions from this broker
             file (Union[str, django.core.files.base.File]): name of file in media directory /files/input/transactions/
                 or a File object.
+            bulk (boolean): True to validate all transactions at once and save with bulk_create. Default False to save
+                transactions one at a time
+            batch_size (int): number of transactions per batch in bulk mode. Default 5000
+            progress_func (Optional[Callable[[int, int], None]]): called in bulk mode after each batch is saved with the
+                number of transactions saved so far and the total number to save. Default None
 
         Returns:
             tuple[list[Transaction], list[SecurityMaster], set[tuple[InvestmentAccount, datetime.date]]]:
-                Transaction instances with investment account / transaction date combinations that have no records are
-                saved to the database, SecurityMaster list contains securities that did not exist but were created and
-                set to default, set of investment account / transaction date combinations that have records in the
-                database already (we dont want to create multiple copies of the same transaction)
+                Transaction instances with new content hashes are saved to the database, SecurityMaster list contains
+                securities that did not exist but were created and set to default, set of investment account /
+                transaction date combinations with transactions that were saved already and were not created again
 
         Raises:
             DatabaseError: if a function called from this function raises a DatabaseError
             NotImplementedError: if broker not set in this function, if a function called from this function raises a
                 NotImplementedError
             ObjectDoesNotExist: if a function called from this function raises a ObjectDoesNotExist
+            ValidationError: if a function called from this function raises a ValidationError
             ValueError: if a function called from this function raises a ValueError
 
         See Also:
@@ -325,10 +373,78 @@ class Transaction(models.Model):
             file = settings.MEDIA_ROOT + "/files/input/transactions/" + file
 
         if broker == Broker.FIDELITY:
-            return cls.load_transactions_from_fidelity_file(file)
+            return cls.load_transactions_from_fidelity_file(file, bulk=bulk, batch_size=batch_size,
+                                                            progress_func=progress_func)
         else:
             raise NotImplementedError("broker not set in load_transactions_from_file()")
 
+    @classmethod
+    def validate_df(cls, trans_df):
+        """ Check the rules checked by save() for all transactions at once
+
+        Args:
+            trans_df (pd.DataFrame): columns trans_type, action_type, security (None if no security)
+
+        Raises:
+            ValidationError: for the first transaction with an action type that does not match its transaction type or
+                without a security when its transaction type requires one. same messages as save()
+        """
+        req_trans_type_srs = trans_df["action_type"].map(
+            {at: ActionType.get_transaction_type(at) for at in trans_df["action_type"].drop_duplicates()})
+        bad_rows = req_trans_type_srs != trans_df["trans_type"]
+        if bad_rows.any():
+            raise ValidationError("Action type: " + str(trans_df.loc[bad_rows, "action_type"].iloc[0]) +
+                                  " must have transaction type: " + str(req_trans_type_srs[bad_rows].iloc[0]))
+
+        bad_rows = trans_df["security"].isnull() & trans_df["trans_type"].map(TransactionType.is_security_required)
+        if bad_rows.any():
+            raise ValidationError("A security must be selected for transaction type: " +
+                                  str(trans_df.loc[bad_rows, "trans_type"].iloc[0]))
+
+    @classmethod
+    def _fidelity_trans_act_type_df(cls, desc_srs, qty_arr):
+        """ Match Fidelity history descriptions with a TransactionType and ActionType
+
+        All rules in FIDELITY_DESCRIPTION_RULES are evaluated as vectorized string masks over the unique descriptions.
+        np.select() picks the first matching rule for each unique description
+
+        Args:
+            desc_srs (pd.Series): descriptions
+            qty_arr (np.ndarray): int64 array of quantities (any scale) in desc_srs order
+
+        Returns:
+            pd.DataFrame: columns Transaction Type, Action Type with desc_srs index
+
+        Raises:
+            ValueError: if a DISTRIBUTION transaction quantity is 0, if unable to match a description with a
+                TransactionType and ActionType
+        """
+        # descriptions repeat heavily so rules are only evaluated once per unique description
+        code_arr, uniq_srs = pd.factorize(desc_srs.fillna(""))
+        uniq_srs = pd.Series(uniq_srs, dtype=object)
+        mask_list = []
+        for match, pattern, trans_type, action_type in cls.FIDELITY_DESCRIPTION_RULES:
+            if match == "exact":
+                mask_list.append((uniq_srs == pattern).to_numpy())
+            elif match == "prefix":
+                mask_list.append(uniq_srs.str.startswith(pattern).to_numpy(dtype=bool))
+            else:
+                mask_list.append(uniq_srs.str.endswith(pattern).to_numpy(dtype=bool))
+        rule_ind_arr = np.select(mask_list, np.arange(len(mask_list)), default=-1)[code_arr]
+
+        if (rule_ind_arr == -1).any():
+            raise ValueError("Unable to match description: '" + str(desc_srs[rule_ind_arr == -1].iloc[0]) +
+                             "' with a transaction type and action type")
+
+        trans_type_arr = np.array([rule[2] for rule in cls.FIDELITY_DESCRIPTION_RULES], dtype=object)[rule_ind_arr]
+        action_type_arr = np.array([rule[3] for rule in cls.FIDELITY_DESCRIPTION_RULES], dtype=object)[rule_ind_arr]
+        dist_arr = action_type_arr == ActionType.STOCK_SPLIT
+        if (dist_arr & (qty_arr == 0)).any():
+            raise ValueError("Quantity is 0 for DISTRIBUTION transaction. How to handle this?")
+        action_type_arr[dist_arr & (qty_arr < 0)] = ActionType.STOCK_CONS
+
+        return pd.DataFrame({"Transaction Type": trans_type_arr, "Action Type": action_type_arr}, index=desc_srs.index)
+
 
 ActionType = Transaction.ActionType
 TransactionType = Transaction.TransactionType
@@ -0,0 +1,298 @@
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import threading
+
+from django.core.files.storage import FileSystemStorage
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+
+from .closedposition import ClosedPosition
+from .investmentaccount import Broker
+from .transaction import Transaction
+
+
+class UploadJobManager(models.Manager):
+
+    def create_job(self, job_type, broker, filename):
+        """ Create a queued upload job for a file saved in the job type's media input directory
+
+        Args:
+            job_type (UploadJob.JobType):
+            broker (Broker):
+            filename (str): name of file in media directory /files/input/transactions/ or /files/input/closedpositions/
+
+        Returns:
+            UploadJob: created job
+        """
+        return self.create(job_type=job_type, broker=broker, filename=filename)
+
+
+class UploadJob(models.Model):
+    """ Upload Job Model
+
+    Loads a broker file in a background thread so large files don't block the web request that uploaded them. The
+    request saves the file, creates the job and submits it. Progress and the result are read from the job record.
+    A running job updates heartbeat_time every heartbeat_seconds. Jobs lost when the process running them stops (e.g.
+    a restart) are marked failed by fail_if_stale() when their page or status is requested.
+
+    Attributes:
+        job_type (JobType): records loaded from the file
+        broker (Broker): brokerage the file is from
+        filename (str): name of file in the job type's media input directory
+        status (Status):
+        progress (int): number of records saved so far
+        total (int): number of records to save. 0 until the file is parsed
+        error (str): repr of the exception if the job failed
+        result (Optional[dict]): summary if the job succeeded. keys "sec_ns_str" (str) tickers of default securities
+            created and "eiacd_list" (list[dict]) investment account and date combinations with existing records. the
+            saved records are linked to the job (upload_job field) and are read one page at a time with result_page()
+        create_time (datetime.datetime):
+        start_time (Optional[datetime.datetime]):
+        end_time (Optional[datetime.datetime]):
+        heartbeat_time (Optional[datetime.datetime]): last time the running job reported it is alive
+    """
+    class JobType(models.TextChoices):
+        CLOSED_POSITION = "CLOSED_POSITION", gettext_lazy("CLOSED_POSITION")
+        TRANSACTION = "TRANSACTION", gettext_lazy("TRANSACTION")
+
+    class Status(models.TextChoices):
+        QUEUED = "QUEUED", gettext_lazy("QUEUED")
+        RUNNING = "RUNNING", gettext_lazy("RUNNING")
+        SUCCEEDED = "SUCCEEDED", gettext_lazy("SUCCEEDED")
+        FAILED = "FAILED", gettext_lazy("FAILED")
+
+    class Meta:
+        ordering = ["-create_time"]
+
+    job_type = models.CharField(max_length=20, choices=JobType.choices)
+    broker = models.CharField(max_length=30, choices=Broker.choices)
+    filename = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    result = models.JSONField(blank=True, null=True)
+    create_time = models.DateTimeField(auto_now_add=True)
+    start_time = models.DateTimeField(blank=True, null=True)
+    end_time = models.DateTimeField(blank=True, null=True)
+    heartbeat_time = models.DateTimeField(blank=True, null=True)
+
+    objects = UploadJobManager()
+
+    # jobs share one small pool per process. created on first submit so importing models doesn't start threads
+    _executor = None
+    _executor_lock = threading.Lock()
+    max_workers = 2
+    # saved records are linked to the job with one update per batch of content hashes
+    link_batch_size = 5000
+    heartbeat_seconds = 30
+    # running jobs without a heartbeat and queued jobs not started for this long are stale
+    stale_seconds = 300
+    queued_stale_seconds = 3600
+
+    def __repr__(self):
+        return repr(self.pk) + ", " + self.job_type + ", " + self.filename + ", " + self.status
+
+    def __str__(self):
+        return str(self.pk) + ", " + self.job_type + ", " + self.filename + ", " + self.status
+
+    def fail_if_stale(self):
+        """ Mark the job failed if it stopped without finishing. The file is deleted like a failed load
+
+        A running job is stale if its last heartbeat (or start) is more than stale_seconds ago. A queued job is stale if
+        it was created more than queued_stale_seconds ago. The job is only changed if it was not updated since it was
+        read, so a job that is still alive keeps running.
+
+        Returns:
+            bool: True if the job was marked failed
+        """
+        if self.status == UploadJob.Status.QUEUED:
+            last_time, timeout = self.create_time, UploadJob.queued_stale_seconds
+        elif self.status == UploadJob.Status.RUNNING:
+            last_time, timeout = self.heartbeat_time or self.start_time, UploadJob.stale_seconds
+        else:
+            return False
+        now = timezone.now()
+        if now - last_time <= datetime.timedelta(seconds=timeout):
+            return False
+
+        if UploadJob.objects.filter(pk=self.pk, status=self.status, heartbeat_time=self.heartbeat_time).update(
+                status=UploadJob.Status.FAILED, end_time=now,
+                error="Job stopped without finishing. The process running it may have restarted") == 0:
+            return False
+        FileSystemStorage().delete(self.file_path())
+        self.refresh_from_db()
+        return True
+
+    def file_path(self):
+        """ Get the path of the job's file relative to the media directory
+
+        Returns:
+            str: e.g. "files/input/transactions/history.csv"
+        """
+        return UploadJob.input_dir(self.job_type) + self.filename
+
+    def is_done(self):
+        """ Is the job finished (succeeded or failed)
+
+        Returns:
+            bool:
+        """
+        return self.status in (UploadJob.Status.SUCCEEDED, UploadJob.Status.FAILED)
+
+    def records(self):
+        """ Get the records saved by the job
+
+        Returns:
+            Union[models.QuerySet[Transaction], models.QuerySet[ClosedPosition]]: in load order
+        """
+        model = Transaction if self.job_type == UploadJob.JobType.TRANSACTION else ClosedPosition
+        return model.objects.filter(upload_job=self).select_related("investment_account", "security").order_by("pk")
+
+    def result_page(self, page_number, per_page=100):
+        """ Get one page of the records saved by the job formatted for display
+
+        Only the records on the page are read from the database.
+
+        Args:
+            page_number (Union[int, str]): 1 based. non integers return the first page and out of range numbers return
+                the last page
+            per_page (int): Default 100
+
+        Returns:
+            django.core.paginator.Page: page of rows (list[str]). empty if the job has no result
+        """
+        records = Transaction.objects.none() if self.result is None else self.records()
+        page = Paginator(records, per_page).get_page(page_number)
+        row_func = UploadJob._transaction_row if self.job_type == UploadJob.JobType.TRANSACTION \
+            else UploadJob._closed_position_row
+        page.object_list = [row_func(x) for x in page.object_list]
+        return page
+
+    def run(self):
+        """ Load the file and save the result or error on the job. The file is deleted if the load fails
+
+        Normally called in a pool thread by submit(). Exceptions are recorded on the job and not raised. A job that is
+        no longer queued (e.g. marked failed by fail_if_stale()) is not run.
+        """
+        self.status = UploadJob.Status.RUNNING
+        self.start_time = self.heartbeat_time = timezone.now()
+        if UploadJob.objects.filter(pk=self.pk, status=UploadJob.Status.QUEUED).update(
+                status=self.status, start_time=self.start_time, heartbeat_time=self.heartbeat_time) == 0:
+            self.refresh_from_db()
+            return
+        stop_event = threading.Event()
+        heartbeat_thread = threading.Thread(target=UploadJob._heartbeat, args=(self.pk, stop_event),
+                                            name="uploadjob-heartbeat", daemon=True)
+        heartbeat_thread.start()
+
+        def progress_func(progress, total):
+            self.progress = progress
+            self.total = total
+            self.heartbeat_time = timezone.now()
+            self.save(update_fields=["progress", "total", "heartbeat_time"])
+
+        try:
+            if self.job_type == UploadJob.JobType.TRANSACTION:
+                model = Transaction
+                obj_list, sec_ns_list, exist_inv_acc_dates_set = Transaction.load_transactions_from_file(
+                    Broker(self.broker), self.filename, bulk=True, progress_func=progress_func)
+            else:
+                model = ClosedPosition
+                obj_list, sec_ns_list, exist_inv_acc_dates_set = ClosedPosition.load_closed_positions_from_file(
+                    Broker(self.broker), self.filename, bulk=True, progress_func=progress_func)
+            # bulk_create doesn't set primary keys on every backend so saved records are found by content hash
+            hash_list = [x.content_hash for x in obj_list]
+            for start in range(0, len(hash_list), UploadJob.link_batch_size):
+                model.objects.filter(content_hash__in=hash_list[start:start + UploadJob.link_batch_size]).update(
+                    upload_job=self)
+        except Exception as ex:
+            self.status = UploadJob.Status.FAILED
+            self.error = repr(ex)
+            FileSystemStorage().delete(self.file_path())
+        else:
+            self.status = UploadJob.Status.SUCCEEDED
+            self.progress = self.total = len(obj_list)
+            self.result = {
+                "sec_ns_str": ", ".join(sorted([x.ticker for x in sec_ns_list])),
+                "eiacd_list": sorted([{"broker": x[0].broker, "account_name": x[0].account_name, "date": str(x[1])}
+                                      for x in exist_inv_acc_dates_set],
+                                     key=lambda x: (x["broker"], x["account_name"], x["date"]))}
+        finally:
+            stop_event.set()
+            heartbeat_thread.join()
+        self.end_time = timezone.now()
+        self.save()
+
+    def submit(self):
+        """ Run the job in the upload job thread pool
+
+        Returns:
+            concurrent.futures.Future: future of run()
+        """
+        with UploadJob._executor_lock:
+            if UploadJob._executor is None:
+                UploadJob._executor = ThreadPoolExecutor(max_workers=UploadJob.max_workers,
+                                                         thread_name_prefix="uploadjob")
+        return UploadJob._executor.submit(UploadJob._run_in_thread, self.pk)
+
+    @classmethod
+    def input_dir(cls, job_type):
+        """ Get the media input directory of files loaded by job_type
+
+        Args:
+            job_type (UploadJob.JobType):
+
+        Returns:
+            str: directory relative to the media directory, ending in "/"
+        """
+        return "files/input/transactions/" if job_type == UploadJob.JobType.TRANSACTION \
+            else "files/input/closedpositions/"
+
+    @classmethod
+    def _heartbeat(cls, pk, stop_event):
+        """ Update heartbeat_time of the job with primary key pk every heartbeat_seconds until stop_event is set
+
+        Args:
+            pk (int):
+            stop_event (threading.Event):
+        """
+        try:
+            while not stop_event.wait(cls.heartbeat_seconds):
+                try:
+                    cls.objects.filter(pk=pk, status=UploadJob.Status.RUNNING).update(heartbeat_time=timezone.now())
+                except DatabaseError:
+                    # a missed heartbeat only matters if the next ones are missed too
+                    pass
+        finally:
+            connections.close_all()
+
+    @classmethod
+    def _run_in_thread(cls, pk):
+        """ Run the job with primary key pk. connections opened by the pool thread are closed when it finishes
+
+        Args:
+            pk (int):
+        """
+        try:
+            cls.objects.get(pk=pk).run()
+        finally:
+            connections.close_all()
+
+    @staticmethod
+    def _closed_position_row(pos):
+        return [pos.investment_account.broker, pos.investment_account.account_name, str(pos.enter_date),
+                str(pos.close_date), pos.security.ticker, str(pos.quantity), str(pos.enter_price_net),
+                str(pos.close_price_net), str(pos.cost_basis_price), str(pos.cost_basis_total),
+                str(pos.proceeds_price), str(pos.proceeds_total), str(pos.short_term_pnl), str(pos.long_term_pnl),
+                str(pos.cost_basis_price_unadj), str(pos.cost_basis_total_unadj), str(pos.short_term_pnl_unadj),
+                str(pos.long_term_pnl_unadj)]
+
+    @staticmethod
+    def _transaction_row(trans):
+        return [trans.investment_account.broker, trans.investment_account.account_name, str(trans.trans_date),
+                str(trans.trans_type), str(trans.action_type), trans.description,
+                "" if trans.security is None else trans.security.ticker, str(trans.quantity), str(trans.price),
+                str(trans.amount_net), str(trans.commission), str(trans.fees)]
@@ -0,0 +1 @@
+from .lotbook import Lot, LotBook
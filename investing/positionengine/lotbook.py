@@ -0,0 +1,323 @@
+from decimal import Decimal
+import bisect
+
+
+class Lot:
+    """ Lot (or aggregate position) held in a LotBook
+
+    Attributes:
+        security (SecurityMaster):
+        quantity (Decimal): negative for short positions
+        enter_date (Optional[datetime.date]): None for the aggregate position of a security that is not broken into lots
+        enter_price (Decimal):
+        enter_total (Decimal):
+        enter_price_net (Decimal):
+        enter_total_net (Decimal):
+        cost_basis_price (Optional[Decimal]): None for short positions until the cost basis is known
+        cost_basis_total (Optional[Decimal]): None for short positions until the cost basis is known
+        seq (int): order the lot was added to the book. lots added earlier are matched first
+
+    See Also:
+        Position class docstring for field descriptions
+    """
+    FIELDS = ("security", "quantity", "enter_date", "enter_price", "enter_total", "enter_price_net", "enter_total_net",
+              "cost_basis_price", "cost_basis_total")
+
+    def __init__(self, security, quantity, enter_date, enter_price, enter_total, enter_price_net, enter_total_net,
+                 cost_basis_price, cost_basis_total, seq):
+        self.security = security
+        self.quantity = quantity
+        self.enter_date = enter_date
+        self.enter_price = enter_price
+        self.enter_total = enter_total
+        self.enter_price_net = enter_price_net
+        self.enter_total_net = enter_total_net
+        self.cost_basis_price = cost_basis_price
+        self.cost_basis_total = cost_basis_total
+        self.seq = seq
+
+    def __repr__(self):
+        return "Lot(" + repr(self.security) + ", " + repr(self.quantity) + ", " + repr(self.enter_date) + ")"
+
+    def to_tuple(self):
+        """ Lot values in Lot.FIELDS order
+
+        Returns:
+            tuple:
+        """
+        return (self.security, self.quantity, self.enter_date, self.enter_price, self.enter_total, self.enter_price_net,
+                self.enter_total_net, self.cost_basis_price, self.cost_basis_total)
+
+
+class LotBook:
+    """ In memory book of the open positions of a single investment account
+
+    Positions with an enter date are lots. Lots are kept per security in the order they were added (first in, first
+    out) and are removed once their quantity reaches 0. Positions without an enter date (securities that are not broken
+    into lots) are combined into a single aggregate position per security: quantity and totals are summed and prices
+    keep the first value that is not None. Aggregate positions are kept even if their quantity is 0.
+
+    Lots are also indexed by security and enter date with cost basis price and enter price net in sorted order so
+    closed positions are matched to lots with a bisect instead of a scan of all lots.
+
+    The book is changed in place as transactions are applied. snapshot() returns the current positions.
+
+    Attributes:
+        core_security (SecurityMaster): cash is held in this security at price 1
+        dp_dict (dict[str, int]): Position decimal field name (keys) to decimal places (values)
+    """
+    def __init__(self, core_security, dp_dict):
+        self.core_security = core_security
+        self.dp_dict = dp_dict
+        # SecurityMaster (keys) to lots ordered by Lot.seq (values)
+        self._sec_lots_dict = {}
+        # SecurityMaster (keys) to aggregate position (values)
+        self._sec_agg_dict = {}
+        # (SecurityMaster, enter_date) (keys) to lots sorted by (cost_basis_price, seq) (values). lots with
+        # cost_basis_price None are not included
+        self._cbp_index_dict = {}
+        # (SecurityMaster, enter_date) (keys) to lots sorted by (enter_price_net, seq) (values)
+        self._epn_index_dict = {}
+        self._seq = 0
+
+    def add_core(self, amount):
+        """ Add cash to (or remove cash from if amount is negative) the core security aggregate position
+
+        Args:
+            amount (Decimal): price and cost basis price are 1 so quantity and totals are amount
+
+        Returns:
+            Lot: core security aggregate position
+        """
+        return self.add_lot(self.core_security, amount, None, Decimal(1), amount, Decimal(1), amount, Decimal(1),
+                            amount)
+
+    def add_lot(self, security, quantity, enter_date, enter_price, enter_total, enter_price_net, enter_total_net,
+                cost_basis_price, cost_basis_total):
+        """ Add a lot or add to the aggregate position of security if enter_date is None
+
+        Args:
+            see Lot class docstring
+
+        Returns:
+            Lot: new lot or the aggregate position of security
+        """
+        if enter_date is not None:
+            lot = Lot(security, quantity, enter_date, enter_price, enter_total, enter_price_net, enter_total_net,
+                      cost_basis_price, cost_basis_total, self._next_seq())
+            self._sec_lots_dict.setdefault(security, []).append(lot)
+            self._index_lot(lot)
+            return lot
+
+        agg = self._sec_agg_dict.get(security)
+        if agg is None:
+            # totals are summed so a total that is None is 0
+            agg = Lot(security, quantity, None, enter_price, self._zero_if_none(enter_total), enter_price_net,
+                      self._zero_if_none(enter_total_net), cost_basis_price, self._zero_if_none(cost_basis_total),
+                      self._next_seq())
+            self._sec_agg_dict[security] = agg
+        else:
+            self._add_to_agg(agg, Lot(security, quantity, None, enter_price, enter_total, enter_price_net,
+                                      enter_total_net, cost_basis_price, cost_basis_total, None))
+        return agg
+
+    def close_long(self, security, enter_date, cost_basis_price, quantity, cost_basis_total):
+        """ Reduce the first lot that matches a closed long position
+
+        A lot matches if it has the same security and enter date and its cost basis price is within 0.001 of
+        cost_basis_price. partial shares cost basis prices do not match within 0.001 due to rounding issues so quantity
+        less than 1 allows a difference less than 0.02.
+
+        Args:
+            security (SecurityMaster):
+            enter_date (datetime.date):
+            cost_basis_price (Decimal): closed position cost basis price before wash sale adjustment
+            quantity (Decimal): closed position quantity
+            cost_basis_total (Decimal): closed position cost basis total before wash sale adjustment
+
+        Returns:
+            bool: True if a lot matched and was reduced, False if no lot matched
+        """
+        lot = self._match_lot(self._cbp_index_dict, "cost_basis_price", security, enter_date, cost_basis_price,
+                              Decimal("0.02") if quantity < Decimal(1) else Decimal("0.001"))
+        if lot is None:
+            return False
+
+        # lot enter_total is before commission and fees but all closed position fields are after commission and fees.
+        # use ratio of quantity sold to quantity held before sale to get enter_total after sale
+        lot.enter_total -= round(lot.enter_total * quantity / lot.quantity, self.dp_dict["enter_total"])
+        # for long positions, enter_total_net and cost_basis_total are the same
+        lot.quantity -= quantity
+        lot.enter_total_net -= cost_basis_total
+        lot.cost_basis_total -= cost_basis_total
+        self._remove_if_closed(lot)
+        return True
+
+    def close_short(self, security, enter_date, enter_price_net, quantity, proceeds_total):
+        """ Reduce the first lot that matches a closed short position
+
+        A lot matches if it has the same security and enter date and its enter price net is within 0.001 of
+        enter_price_net.
+
+        Args:
+            security (SecurityMaster):
+            enter_date (datetime.date):
+            enter_price_net (Decimal): closed position enter price net
+            quantity (Decimal): closed position quantity
+            proceeds_total (Decimal): closed position proceeds total
+
+        Returns:
+            bool: True if a lot matched and was reduced, False if no lot matched
+        """
+        lot = self._match_lot(self._epn_index_dict, "enter_price_net", security, enter_date, enter_price_net,
+                              Decimal("0.001"))
+        if lot is None:
+            return False
+
+        # lot enter_total is before commission and fees but all closed position fields are after commission and fees.
+        # use ratio of quantity covered to quantity held before cover to get enter_total after cover
+        lot.enter_total -= round(lot.enter_total * quantity / abs(lot.quantity), self.dp_dict["enter_total"])
+        lot.quantity += quantity
+        lot.enter_total_net -= proceeds_total
+        # TODO update cost_basis_price and cost_basis_total for current and previous positions
+        # TODO if not all quantity of the position is covered, will need to keep the cost basis values
+        # TODO as None for the non covered quantity and create a new lot for the covered quantity with
+        # TODO closed cost basis values
+        self._remove_if_closed(lot)
+        return True
+
+    def merge(self, old_ticker, new_security):
+        """ Move all positions in the security with old_ticker to new_security
+
+        Args:
+            old_ticker (str): ticker of the security merged into new_security
+            new_security (SecurityMaster):
+        """
+        for old_sec in [sec for sec in self._securities() if sec.ticker == old_ticker and sec != new_security]:
+            old_lot_list = self._sec_lots_dict.pop(old_sec, [])
+            for lot in old_lot_list:
+                self._unindex_lot(lot)
+                lot.security = new_security
+                self._index_lot(lot)
+            if len(old_lot_list) > 0:
+                self._sec_lots_dict[new_security] = sorted(
+                    self._sec_lots_dict.get(new_security, []) + old_lot_list, key=lambda x: x.seq)
+
+            old_agg = self._sec_agg_dict.pop(old_sec, None)
+            if old_agg is not None:
+                old_agg.security = new_security
+                new_agg = self._sec_agg_dict.get(new_security)
+                if new_agg is None:
+                    self._sec_agg_dict[new_security] = old_agg
+                elif new_agg.seq < old_agg.seq:
+                    self._add_to_agg(new_agg, old_agg)
+                else:
+                    self._add_to_agg(old_agg, new_agg)
+                    self._sec_agg_dict[new_security] = old_agg
+
+    def quantity(self, security):
+        """ Total quantity of security
+
+        Args:
+            security (SecurityMaster):
+
+        Returns:
+            Decimal: sum of lot and aggregate position quantities. 0 if security is not in the book
+        """
+        agg = self._sec_agg_dict.get(security)
+        return sum((lot.quantity for lot in self._sec_lots_dict.get(security, [])),
+                   Decimal(0) if agg is None else agg.quantity)
+
+    def snapshot(self):
+        """ Current positions
+
+        Returns:
+            list[tuple]: one tuple per position with values in Lot.FIELDS order. positions of a security are ordered by
+                aggregate position first then lots in the order they were added
+        """
+        row_list = []
+        for sec in self._securities():
+            agg = self._sec_agg_dict.get(sec)
+            if agg is not None:
+                row_list.append(agg.to_tuple())
+            row_list.extend(lot.to_tuple() for lot in self._sec_lots_dict.get(sec, []))
+        return row_list
+
+    def split(self, security, split_quantity):
+        """ Apply a stock split to all positions in security
+
+        Split ratio is split_quantity / current quantity + 1. Quantities are multiplied and prices divided by the ratio.
+
+        Args:
+            security (SecurityMaster):
+            split_quantity (Decimal): total quantity received from all split transactions for security
+
+        Raises:
+            decimal.DivisionByZero: if there is no quantity of security
+        """
+        split_ratio = split_quantity / self.quantity(security) + 1
+        agg = self._sec_agg_dict.get(security)
+        for lot in self._sec_lots_dict.get(security, []) + ([] if agg is None else [agg]):
+            # prices change so the lot is placed again in the sorted indexes
+            self._unindex_lot(lot)
+            lot.quantity = round(lot.quantity * split_ratio, self.dp_dict["quantity"])
+            for field in ["enter_price", "enter_price_net", "cost_basis_price"]:
+                val = getattr(lot, field)
+                if val is not None:
+                    setattr(lot, field, round(val / split_ratio, self.dp_dict[field]))
+            self._index_lot(lot)
+
+    def _add_to_agg(self, agg, lot):
+        agg.quantity += lot.quantity
+        for field in ["enter_total", "enter_total_net", "cost_basis_total"]:
+            setattr(agg, field, getattr(agg, field) + self._zero_if_none(getattr(lot, field)))
+        for field in ["enter_price", "enter_price_net", "cost_basis_price"]:
+            if getattr(agg, field) is None:
+                setattr(agg, field, getattr(lot, field))
+
+    def _index_lot(self, lot):
+        if lot.enter_date is None:
+            return
+        key = (lot.security, lot.enter_date)
+        if lot.cost_basis_price is not None:
+            bisect.insort(self._cbp_index_dict.setdefault(key, []), lot, key=lambda x: (x.cost_basis_price, x.seq))
+        bisect.insort(self._epn_index_dict.setdefault(key, []), lot, key=lambda x: (x.enter_price_net, x.seq))
+
+    def _match_lot(self, index_dict, field, security, enter_date, price, tolerance):
+        # lots with field strictly within tolerance of price. the lot added first is matched
+        lot_list = index_dict.get((security, enter_date), [])
+        lo = bisect.bisect_right(lot_list, price - tolerance, key=lambda x: getattr(x, field))
+        hi = bisect.bisect_left(lot_list, price + tolerance, lo=lo, key=lambda x: getattr(x, field))
+        return min(lot_list[lo:hi], key=lambda x: x.seq, default=None)
+
+    def _next_seq(self):
+        self._seq += 1
+        return self._seq
+
+    def _remove_if_closed(self, lot):
+        if lot.quantity != Decimal(0):
+            return
+        self._unindex_lot(lot)
+        lot_list = self._sec_lots_dict[lot.security]
+        del lot_list[bisect.bisect_left(lot_list, lot.seq, key=lambda x: x.seq)]
+
+    def _securities(self):
+        return list(dict.fromkeys(list(self._sec_agg_dict.keys()) + list(self._sec_lots_dict.keys())))
+
+    def _unindex_lot(self, lot):
+        if lot.enter_date is None:
+            return
+        key = (lot.security, lot.enter_date)
+        for index_dict, field in [(self._cbp_index_dict, "cost_basis_price"),
+                                  (self._epn_index_dict, "enter_price_net")]:
+            if field == "cost_basis_price" and lot.cost_basis_price is None:
+                continue
+            lot_list = index_dict[key]
+            del lot_list[bisect.bisect_left(lot_list, (getattr(lot, field), lot.seq),
+                                            key=lambda x: (getattr(x, field), x.seq))]
+            if len(lot_list) == 0:
+                del index_dict[key]
+
+    @staticmethod
+    def _zero_if_none(val):
+        return Decimal(0) if val is None else val
@@ -0,0 +1 @@
+from .barstore import BarStore
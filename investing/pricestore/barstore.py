@@ -0,0 +1,219 @@
+""" Module for the local columnar store of historical price bars. """
+from enum import Enum
+import json
+import os
+import threading
+
+import numpy as np
+
+
+class BarStore:
+    """ Columnar memory mapped store of price bars
+
+    Each symbol and interval has a directory with one raw binary file per column so appends only add to the end of
+    the files and reads memory map them. index.json in the store root has the number of rows and the first and last
+    time of every symbol and interval. Rows past the indexed count (e.g. from an interrupted append) are ignored and
+    truncated by the next append.
+
+    Reads return read only numpy views of the memory mapped files. No data is copied until the caller uses it, so
+    opening ten years of closes for hundreds of symbols takes milliseconds. Writes are not safe across processes.
+
+    Class Attributes:
+        DAILY (str): interval of AlphaVantage.daily() bars. intraday intervals are IntradayInterval values
+        COLUMNS (dict[str, np.dtype]): stored columns. time is the bar timestamp (daily bars at midnight)
+
+    Attributes:
+        path (str): store root directory. created if it does not exist
+    """
+    DAILY = "daily"
+    COLUMNS = {"time": np.dtype("datetime64[s]"), "open": np.dtype("float64"), "high": np.dtype("float64"),
+               "low": np.dtype("float64"), "close": np.dtype("float64"), "volume": np.dtype("int64")}
+
+    def __init__(self, path):
+        """ init
+
+        Args:
+            path (str): store root directory. created if it does not exist
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        # (symbol, interval, column) to memory map of the indexed rows
+        self._mmap_dict = {}
+        self._index = self._read_index()
+
+    def append(self, symbol, interval, df):
+        """ Append bars from an AlphaVantage.daily() or AlphaVantage.intraday() DataFrame
+
+        Bars are sorted by timestamp. Bars at or before the last stored time are skipped so the same or overlapping
+        frames can be appended again (e.g. a nightly OutputSize.COMPACT refresh).
+
+        Args:
+            symbol (str): e.g. IBM
+            interval (Union[str, IntradayInterval]): BarStore.DAILY or an IntradayInterval
+            df (pd.DataFrame): columns timestamp (datetime.date or datetime.datetime), open, high, low, close, volume
+
+        Returns:
+            int: number of bars appended
+        """
+        interval = BarStore._interval_str(interval)
+        time_arr = np.array(df["timestamp"], dtype="datetime64[s]")
+        order_arr = np.argsort(time_arr, kind="stable")
+        time_arr = time_arr[order_arr]
+
+        with self._lock:
+            meta = self._index.get(interval, {}).get(symbol)
+            rows = 0 if meta is None else meta["rows"]
+            if meta is not None:
+                keep_arr = time_arr > np.datetime64(meta["last"], "s")
+                order_arr, time_arr = order_arr[keep_arr], time_arr[keep_arr]
+            # duplicate timestamps in df keep the first bar
+            if len(time_arr) > 1:
+                keep_arr = np.concatenate([[True], time_arr[1:] != time_arr[:-1]])
+                order_arr, time_arr = order_arr[keep_arr], time_arr[keep_arr]
+            if len(time_arr) == 0:
+                return 0
+
+            series_dir = self._series_dir(symbol, interval)
+            os.makedirs(series_dir, exist_ok=True)
+            for col, dtype in BarStore.COLUMNS.items():
+                arr = time_arr if col == "time" else np.asarray(df[col].to_numpy()[order_arr], dtype=dtype)
+                with open(os.path.join(series_dir, col + ".bin"), "ab") as f:
+                    f.truncate(rows * dtype.itemsize)
+                    f.write(np.ascontiguousarray(arr).tobytes())
+                self._mmap_dict.pop((symbol, interval, col), None)
+
+            self._index.setdefault(interval, {})[symbol] = {
+                "rows": rows + len(time_arr), "first": str(time_arr[0]) if meta is None else meta["first"],
+                "last": str(time_arr[-1])}
+            self._write_index()
+        return len(time_arr)
+
+    def date_range(self, symbol, interval):
+        """ Get the first and last bar time of symbol and interval
+
+        Args:
+            symbol (str):
+            interval (Union[str, IntradayInterval]):
+
+        Returns:
+            Optional[tuple[np.datetime64, np.datetime64]]: None if no bars are stored
+        """
+        meta = self._index.get(BarStore._interval_str(interval), {}).get(symbol)
+        return None if meta is None else (np.datetime64(meta["first"], "s"), np.datetime64(meta["last"], "s"))
+
+    def delete(self, symbol, interval):
+        """ Delete all bars of symbol and interval
+
+        Args:
+            symbol (str):
+            interval (Union[str, IntradayInterval]):
+        """
+        interval = BarStore._interval_str(interval)
+        with self._lock:
+            if self._index.get(interval, {}).pop(symbol, None) is None:
+                return
+            self._write_index()
+            for col in BarStore.COLUMNS:
+                self._mmap_dict.pop((symbol, interval, col), None)
+                try:
+                    os.remove(os.path.join(self._series_dir(symbol, interval), col + ".bin"))
+                except FileNotFoundError:
+                    pass
+
+    def read(self, symbol, interval, start=None, end=None, columns=("time", "close")):
+        """ Get bars of symbol and interval from start through end
+
+        Args:
+            symbol (str):
+            interval (Union[str, IntradayInterval]):
+            start (Optional[Union[datetime.date, datetime.datetime, np.datetime64]]): Default None for the first bar
+            end (Optional[Union[datetime.date, datetime.datetime, np.datetime64]]): inclusive. a date includes the
+                whole day. Default None for the last bar
+            columns (Iterable[str]): keys of BarStore.COLUMNS. Default ("time", "close")
+
+        Returns:
+            dict[str, np.ndarray]: column to read only array view of the memory mapped file sorted by time. empty
+                arrays if no bars are stored
+        """
+        interval = BarStore._interval_str(interval)
+        time_arr = self._column(symbol, interval, "time")
+        lo = 0 if start is None else np.searchsorted(time_arr, np.datetime64(start, "s"), side="left")
+        hi = len(time_arr) if end is None else np.searchsorted(time_arr, BarStore._end_time(end), side="right")
+        return {col: self._column(symbol, interval, col)[lo:hi] for col in columns}
+
+    def read_many(self, symbols, interval, start=None, end=None, columns=("time", "close")):
+        """ read() for many symbols
+
+        Args:
+            symbols (Iterable[str]):
+            interval, start, end, columns: See read()
+
+        Returns:
+            dict[str, dict[str, np.ndarray]]: symbol to read() result for symbols with bars stored
+        """
+        interval = BarStore._interval_str(interval)
+        symbol_dict = self._index.get(interval, {})
+        return {symbol: self.read(symbol, interval, start, end, columns) for symbol in symbols
+                if symbol in symbol_dict}
+
+    def symbols(self, interval):
+        """ Get symbols with bars stored for interval
+
+        Args:
+            interval (Union[str, IntradayInterval]):
+
+        Returns:
+            list[str]: sorted
+        """
+        return sorted(self._index.get(BarStore._interval_str(interval), {}))
+
+    def _column(self, symbol, interval, col):
+        key = (symbol, interval, col)
+        mmap = self._mmap_dict.get(key)
+        if mmap is None:
+            meta = self._index.get(interval, {}).get(symbol)
+            if meta is None:
+                return np.empty(0, dtype=BarStore.COLUMNS[col])
+            mmap = np.memmap(os.path.join(self._series_dir(symbol, interval), col + ".bin"),
+                             dtype=BarStore.COLUMNS[col], mode="r", shape=(meta["rows"],))
+            self._mmap_dict[key] = mmap
+        return mmap
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.path, "index.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _series_dir(self, symbol, interval):
+        if not symbol or os.sep in symbol or symbol.startswith("."):
+            raise ValueError("invalid symbol: " + repr(symbol))
+        return os.path.join(self.path, interval, symbol)
+
+    def _write_index(self):
+        # replace the index in one step so readers never see a partial file
+        tmp_file = os.path.join(self.path, "index.json.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_file, os.path.join(self.path, "index.json"))
+
+    @staticmethod
+    def _end_time(end):
+        """ Get the last time included by end. a date (without time) includes the whole day
+
+        Args:
+            end (Union[datetime.date, datetime.datetime, np.datetime64]):
+
+        Returns:
+            np.datetime64: seconds resolution
+        """
+        end = np.datetime64(end)
+        if np.datetime_data(end.dtype)[0] in ("D", "W", "M", "Y"):
+            return np.datetime64(end + np.timedelta64(1, "D"), "s") - np.timedelta64(1, "s")
+        return np.datetime64(end, "s")
+
+    @staticmethod
+    def _interval_str(interval):
+        return interval.value if isinstance(interval, Enum) else interval
@@ -1,7 +1,18 @@
 from .dataprovider.test_alphavantage import AlphaVantageTests
+from .dataprovider.test_ratelimiter import TokenBucketTests
+from .dataprovider.test_responsecache import ResponseCacheTests
+from .forms.test_modelforms import SecurityMasterAdminFormTests
 from .models.test_closedposition import ClosedPositionTests
+from .models.test_dailyprice import DailyPriceTests
 from .models.test_investmentaccount import InvestmentAccountTests
 from .models.test_newssentiment import NewsSentimentTests
-from .models.test_position import PositionTests
+from .models.test_performance import DailyPerformanceTests
+from .models.test_position import PositionProcessesTests, PositionTests
 from .models.test_securitymaster import SecurityMasterTests
 from .models.test_transaction import TransactionTests
+from .models.test_uploadjob import UploadJobTests
+from .positionengine.test_lotbook import LotBookTests
+from .pricestore.test_barstore import BarStoreTests
+from .util.test_fixedpointutil import FixedPointUtilTests
+from .util.test_pythonutil import PythonUtilTests
+from .views.test_uploadjobview import UploadJobViewTests
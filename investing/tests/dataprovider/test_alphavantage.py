@@ -1,12 +1,20 @@
 from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest import skip
 from unittest.mock import patch
 import datetime
+import os
+import tempfile
+import threading
+import time
+
 import requests
 
 from ...dataprovider.alphavantage import AlphaVantage, Endpoints, NewsSentiment, TickerSentiment, TickerSentimentLabel,\
     TopicSentiment
 from ...dataprovider.dataproviderexception import DataProviderException
+from ...dataprovider.ratelimiter import TokenBucket
+from ...dataprovider.responsecache import ResponseCache
 from util.testcasebase import TestCaseBase
 
 
@@ -97,7 +105,7 @@ class AlphaVantageTests(TestCaseBase):
         url_test = AlphaVantage._URL_BASE + "function=" + Endpoints.CPI.value + param_str + "&apikey=" + av.api_key
         self.assertEqual(url, url_test)
 
-    @patch("requests.get")
+    @patch.object(requests.Session, "get")
     def test_base_request(self, mock_requests_get):
         with self.subTest():
             # test status code 200 exception
@@ -130,6 +138,158 @@ class AlphaVantageTests(TestCaseBase):
             mock_response._content = str.encode('asdf')
             AlphaVantage()._base_request(Endpoints.TIME_SERIES_INTRADAY, {})
 
+    @patch.object(requests.Session, "get")
+    def test_base_request_cache(self, mock_requests_get):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        cache = ResponseCache(os.path.join(temp_dir.name, "cache.sqlite3"))
+
+        def get(url, timeout):
+            response = requests.Response()
+            response.url = url
+            response.status_code = 200
+            response.encoding = "utf-8"
+            response._content = str.encode("timestamp,close\n2023-01-03," + str(mock_requests_get.call_count))
+            return response
+        mock_requests_get.side_effect = get
+
+        av = AlphaVantage(rate_limiter=TokenBucket(1000, 1000), cache=cache)
+        response = av._base_request(Endpoints.TIME_SERIES_DAILY, {"symbol": "IBM"})
+        with self.subTest():
+            # cached response is returned without a request. cache key does not have the api key
+            cached_response = av._base_request(Endpoints.TIME_SERIES_DAILY, {"symbol": "IBM"})
+            self.assertEqual(mock_requests_get.call_count, 1)
+            self.assertEqual(cached_response.text, response.text)
+            self.assertNotIn(av.api_key, cached_response.url)
+
+        with self.subTest():
+            # different parameters and refresh are requested
+            av._base_request(Endpoints.TIME_SERIES_DAILY, {"symbol": "MSFT"})
+            self.assertEqual(mock_requests_get.call_count, 2)
+            AlphaVantage(rate_limiter=TokenBucket(1000, 1000), cache=cache, refresh=True)._base_request(
+                Endpoints.TIME_SERIES_DAILY, {"symbol": "IBM"})
+            self.assertEqual(mock_requests_get.call_count, 3)
+            self.assertEqual(av._base_request(Endpoints.TIME_SERIES_DAILY, {"symbol": "IBM"}).text,
+                             "timestamp,close\n2023-01-03,3")
+
+        with self.subTest():
+            # expired responses are requested
+            with patch("time.time", return_value=time.time() + AlphaVantage._CACHE_TTL[
+                    Endpoints.TIME_SERIES_DAILY].total_seconds() + 1):
+                av._base_request(Endpoints.TIME_SERIES_DAILY, {"symbol": "IBM"})
+            self.assertEqual(mock_requests_get.call_count, 4)
+
+        with self.subTest():
+            # errors are not cached
+            mock_requests_get.side_effect = None
+            error_response = requests.Response()
+            error_response.url = "https://test.test.test/"
+            error_response.status_code = 200
+            error_response._content = str.encode('{"Error Message":"test error"}')
+            mock_requests_get.return_value = error_response
+            for _ in range(2):
+                with self.assertRaises(DataProviderException):
+                    av._base_request(Endpoints.OVERVIEW, {"symbol": "BAD"})
+            self.assertEqual(mock_requests_get.call_count, 6)
+
+    def test_base_request_retry(self):
+        # local stub server returns the queued (status code, body) responses in order
+        response_list = []
+        request_list = []
+
+        class StubHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                request_list.append(self.path)
+                status, body = response_list.pop(0)
+                if status is None:
+                    time.sleep(body)
+                    status, body = 200, "late"
+                try:
+                    self.send_response(status)
+                    self.end_headers()
+                    self.wfile.write(body.encode())
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client already timed out and closed the connection
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        av = AlphaVantage(timeout=(1, 0.2), max_retries=2, backoff=0, rate_limiter=TokenBucket(1000, 1000),
+                          url_base="http://127.0.0.1:" + str(server.server_port) + "/query?")
+        throttle = '{"Note": "Our standard API call frequency is 5 calls per minute."}'
+
+        with self.subTest():
+            # 5xx and throttle responses are retried
+            response_list.extend([(503, "unavailable"), (200, throttle), (200, "timestamp,close\n2023-01-03,1.5")])
+            response = av._base_request(Endpoints.TIME_SERIES_DAILY, {"symbol": "IBM"})
+            self.assertEqual(response.text, "timestamp,close\n2023-01-03,1.5")
+            self.assertEqual(len(request_list), 3)
+            self.assertTrue(request_list[0].startswith("/query?function=TIME_SERIES_DAILY&symbol=IBM&apikey="))
+
+        with self.subTest():
+            # error raised after max_retries
+            request_list.clear()
+            response_list.extend([(200, throttle)] * 3)
+            with self.assertRaises(DataProviderException):
+                av._base_request(Endpoints.TIME_SERIES_DAILY, {"symbol": "IBM"})
+            self.assertEqual(len(request_list), 3)
+
+        with self.subTest():
+            # errors that are not throttling are not retried
+            request_list.clear()
+            response_list.extend([(400, "bad request"), (200, '{"Error Message": "Invalid API call"}')])
+            for _ in range(2):
+                with self.assertRaises(DataProviderException):
+                    av._base_request(Endpoints.TIME_SERIES_DAILY, {"symbol": "IBM"})
+            self.assertEqual(len(request_list), 2)
+
+        with self.subTest():
+            # read timeouts are retried
+            request_list.clear()
+            response_list.extend([(None, 0.5), (200, "ok")])
+            self.assertEqual(av._base_request(Endpoints.TIME_SERIES_DAILY, {"symbol": "IBM"}).text, "ok")
+            self.assertEqual(len(request_list), 2)
+
+    @patch.object(requests.Session, "get")
+    def test_daily_batch(self, mock_requests_get):
+        lock = threading.Lock()
+        active_list = [0, 0]
+
+        def get(url, timeout):
+            # track the max number of concurrent requests
+            with lock:
+                active_list[0] += 1
+                active_list[1] = max(active_list)
+            time.sleep(0.05)
+            with lock:
+                active_list[0] -= 1
+            response = requests.Response()
+            response.url = url
+            response.status_code = 200
+            if "symbol=BAD" in url:
+                response._content = str.encode('{"Error Message":"Invalid API call"}')
+            else:
+                response._content = str.encode("timestamp,open,high,low,close,volume\n2023-01-03,1,2,0.5,1.5,100")
+            return response
+        mock_requests_get.side_effect = get
+
+        av = AlphaVantage(rate_limiter=TokenBucket(1000, 1000))
+        symbols = ["IBM", "BAD", "MSFT", "AAPL", "IBM", "NVDA"]
+        df_dict, error_dict = av.daily_batch(symbols, adjusted=False, max_workers=3)
+        self.assertEqual(list(df_dict), ["IBM", "MSFT", "AAPL", "NVDA"])
+        self.assertEqual(list(error_dict), ["BAD"])
+        self.assertIsInstance(error_dict["BAD"], DataProviderException)
+        self.assertEqual(df_dict["MSFT"]["timestamp"].tolist(), [datetime.date(2023, 1, 3)])
+        self.assertEqual(mock_requests_get.call_count, 5)
+        self.assertGreater(active_list[1], 1)
+        self.assertLessEqual(active_list[1], 3)
+        self.assertEqual(av.daily_batch([]), ({}, {}))
+
     @skip
     def test_alphavantage_intraday(self):
         pass
@@ -0,0 +1,38 @@
+import threading
+import time
+
+from ...dataprovider.ratelimiter import TokenBucket
+from util.testcasebase import TestCaseBase
+
+
+class TokenBucketTests(TestCaseBase):
+
+    def equal(self, obj1: object, obj2: object):
+        pass
+
+    def test_init(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(0, 1)
+        with self.assertRaises(ValueError):
+            TokenBucket(1, 0.5)
+
+    def test_acquire(self):
+        # full bucket allows a burst of capacity requests. then requests wait for refill
+        bucket = TokenBucket(20, 2)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertFalse(bucket.try_acquire())
+        start = time.monotonic()
+        self.assertGreater(bucket.acquire(), 0)
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    def test_acquire_threads(self):
+        # 4 threads share 1 token per 0.02 seconds after the first token
+        bucket = TokenBucket(50, 1)
+        start = time.monotonic()
+        thread_list = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(3)]) for _ in range(4)]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        self.assertGreaterEqual(time.monotonic() - start, 11 * 0.02 - 0.01)
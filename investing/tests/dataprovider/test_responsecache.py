@@ -0,0 +1,48 @@
+from unittest.mock import patch
+import os
+import tempfile
+
+from ...dataprovider.responsecache import ResponseCache
+from util.testcasebase import TestCaseBase
+
+
+class ResponseCacheTests(TestCaseBase):
+
+    def equal(self, obj1: object, obj2: object):
+        pass
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.cache = ResponseCache(os.path.join(temp_dir.name, "cache.sqlite3"))
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get("url1", 60))
+        self.cache.set("url1", "DAILY", b"a,b\n1,2", "utf-8")
+        self.cache.set("url2", "OVERVIEW", b'{"Symbol": "IBM"}')
+        self.assertEqual(self.cache.get("url1", 60), (b"a,b\n1,2", "utf-8"))
+        self.assertEqual(self.cache.get("url2", 60), (b'{"Symbol": "IBM"}', None))
+
+        # set replaces the cached body
+        self.cache.set("url1", "DAILY", b"a,b\n3,4", "utf-8")
+        self.assertEqual(self.cache.get("url1", 60), (b"a,b\n3,4", "utf-8"))
+
+        # a new cache on the same file sees the cached responses
+        self.assertEqual(ResponseCache(self.cache.path).get("url2", 60)[0], b'{"Symbol": "IBM"}')
+
+    def test_get_expired(self):
+        with patch("time.time", return_value=1000.):
+            self.cache.set("url1", "DAILY", b"body")
+        with patch("time.time", return_value=1060.):
+            self.assertEqual(self.cache.get("url1", 60), (b"body", None))
+            self.assertIsNone(self.cache.get("url1", 59))
+
+    def test_clear(self):
+        self.cache.set("url1", "DAILY", b"1")
+        self.cache.set("url2", "DAILY", b"2")
+        self.cache.set("url3", "OVERVIEW", b"3")
+        self.assertEqual(self.cache.clear("DAILY"), 2)
+        self.assertIsNone(self.cache.get("url1", 60))
+        self.assertEqual(self.cache.get("url3", 60), (b"3", None))
+        self.assertEqual(self.cache.clear(), 1)
+        self.assertIsNone(self.cache.get("url3", 60))
@@ -0,0 +1,40 @@
+from django.test import TestCase
+
+from ...forms.modelforms import SecurityMasterAdminForm
+from ...models.securitymaster import AssetClass, AssetSubClass, SecurityMaster
+from ..models.test_securitymaster import SecurityMasterTests
+
+
+class SecurityMasterAdminFormTests(TestCase):
+
+    def test_security_master_admin_form_my_id(self):
+        def form_data(ticker, asset_class, asset_subclass):
+            return {"my_id": "NS_0000000", "ticker": ticker, "asset_class": asset_class,
+                    "asset_subclass": asset_subclass, "has_fidelity_lots": True}
+
+        # option data can't be inferred from ticker. no my_id is generated
+        form = SecurityMasterAdminForm(data=form_data("AAPL OPTION", AssetClass.OPTION, AssetSubClass.EQUITY_OPTION))
+        with self.subTest():
+            self.assertFalse(form.is_valid())
+            self.assertEqual(SecurityMaster.generate_my_id(AssetClass.OPTION), "OP_0000001")
+
+        # my_id is generated when saved
+        form = SecurityMasterAdminForm(data=form_data("AAPL", AssetClass.EQUITY, AssetSubClass.COMMON_STOCK))
+        with self.subTest():
+            self.assertTrue(form.is_valid())
+            self.assertEqual(form.save().my_id, "EQ_0000001")
+            self.assertEqual(SecurityMaster.objects.get(ticker="AAPL").my_id, "EQ_0000001")
+
+        # my_id is only generated again if asset class changes
+        msft = SecurityMasterTests.sm_msft()
+        form = SecurityMasterAdminForm(data=form_data("MSFT", AssetClass.EQUITY, AssetSubClass.ETF) | {
+            "my_id": msft.my_id}, instance=msft)
+        with self.subTest():
+            self.assertTrue(form.is_valid())
+            self.assertEqual(form.save(commit=False).my_id, msft.my_id)
+
+        form = SecurityMasterAdminForm(data=form_data("MSFT", AssetClass.MUTUAL_FUND, AssetSubClass.MONEY_MARKET) | {
+            "my_id": msft.my_id}, instance=msft)
+        with self.subTest():
+            self.assertTrue(form.is_valid())
+            self.assertEqual(form.save().my_id, "MF_0000001")
@@ -2,6 +2,7 @@ from decimal import Decimal
 import datetime
 
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
+import pandas as pd
 
 from ...models.investmentaccount import Broker
 from ...models.closedposition import ClosedPosition
@@ -15,7 +16,8 @@ class ClosedPositionTests(DjangoModelTestCaseBase):
     def equal(self, model1: ClosedPosition, model2: ClosedPosition):
         InvestmentAccountTests().equal(model1.investment_account, model2.investment_account)
         SecurityMasterTests().equal(model1.security, model2.security)
-        self.simple_equal(model1, model2, ClosedPosition, rem_attr_list=["investment_account", "security"])
+        self.simple_equal(model1, model2, ClosedPosition,
+                          rem_attr_list=["investment_account", "security", "content_hash"])
 
     def test_save_clean(self):
         pos = ClosedPositionTests.closedposition_fidelity_individual_aaplput_long()
@@ -32,6 +34,22 @@ class ClosedPositionTests(DjangoModelTestCaseBase):
         with self.assertRaises(ValidationError):
             pos.clean_fields()
 
+    def test_validate_df(self):
+        inv_acc_fid_ind = InvestmentAccountTests.inv_acc_fidelity_individual()
+        inv_acc_fid_roth = InvestmentAccountTests.inv_acc_fidelity_roth()
+        pos_df = pd.DataFrame({"investment_account": [inv_acc_fid_ind, inv_acc_fid_roth],
+                               "short_term_pnl": [Decimal(1), Decimal(0)],
+                               "short_term_pnl_unadj": [Decimal(1), Decimal(0)]})
+        # taxable account can have short term pnl
+        ClosedPosition.validate_df(pos_df)
+
+        for col in ["short_term_pnl", "short_term_pnl_unadj"]:
+            with self.subTest(col=col):
+                bad_df = pos_df.copy()
+                bad_df.loc[1, col] = Decimal(1)
+                with self.assertRaises(ValidationError):
+                    ClosedPosition.validate_df(bad_df)
+
     def test_load_closed_positions_from_fidelity_file(self):
         self.maxDiff = None
 
@@ -0,0 +1,88 @@
+from decimal import Decimal
+from unittest.mock import patch
+import datetime
+
+import pandas as pd
+
+from ...dataprovider.alphavantage import AlphaVantage, OutputSize
+from ...dataprovider.dataproviderexception import DataProviderException
+from ...models.dailyprice import DailyPrice
+from .test_securitymaster import SecurityMasterTests
+from util.djangomodeltestcasebase import DjangoModelTestCaseBase
+
+
+class DailyPriceTests(DjangoModelTestCaseBase):
+
+    def equal(self, model1: DailyPrice, model2: DailyPrice):
+        SecurityMasterTests().equal(model1.security, model2.security)
+        self.simple_equal(model1, model2, DailyPrice, rem_attr_list=["security"])
+
+    def test_close_price_df(self):
+        aapl = SecurityMasterTests.sm_aapl()
+        msft = SecurityMasterTests.sm_msft()
+        for sec, day, close in [(aapl, 1, "150"), (aapl, 6, "151"), (aapl, 7, "152"), (aapl, 9, "153"),
+                                (msft, 8, "250")]:
+            DailyPrice.objects.create(security=sec, price_date=datetime.date(2022, 9, day), close=Decimal(close))
+
+        # latest price on or before start date is included. securities without one start from their first price
+        price_df = DailyPrice.objects.close_price_df([aapl, msft], datetime.date(2022, 9, 6), datetime.date(2022, 9, 8))
+        self.assertEqual(list(price_df.itertuples(index=False, name=None)), [
+            (aapl.pk, pd.Timestamp(2022, 9, 6), Decimal(151)), (aapl.pk, pd.Timestamp(2022, 9, 7), Decimal(152)),
+            (msft.pk, pd.Timestamp(2022, 9, 8), Decimal(250))])
+
+    @patch.object(AlphaVantage, "daily")
+    def test_load_alphavantage_daily(self, mock_daily):
+        aapl = SecurityMasterTests.sm_aapl()
+        DailyPrice.objects.create(security=aapl, price_date=datetime.date(2022, 9, 7), close=Decimal(1))
+        mock_daily.return_value = pd.DataFrame({
+            "timestamp": [datetime.date(2022, 9, 8), datetime.date(2022, 9, 7)], "open": [155.0, 154.0],
+            "high": [156.0, 155.0], "low": [153.0, 152.0], "close": [154.46, 155.96], "volume": [100, 200]})
+
+        # existing prices are updated
+        DailyPrice.objects.load_alphavantage_daily(aapl)
+        self.assertEqual(list(DailyPrice.objects.order_by("price_date").values_list("price_date", "close")), [
+            (datetime.date(2022, 9, 7), Decimal("155.96")), (datetime.date(2022, 9, 8), Decimal("154.46"))])
+
+    @patch.object(AlphaVantage, "daily")
+    def test_sync_alphavantage_daily(self, mock_daily):
+        aapl = SecurityMasterTests.sm_aapl()
+        msft = SecurityMasterTests.sm_msft()
+        nvda = SecurityMasterTests.sm_nvda()
+        DailyPrice.objects.create(security=aapl, price_date=datetime.date(2022, 9, 6), open=Decimal(10),
+                                  high=Decimal(11), low=Decimal(9), close=Decimal("10.5"), volume=100)
+        DailyPrice.objects.create(security=aapl, price_date=datetime.date(2022, 9, 7), close=Decimal(1))
+        call_list = []
+
+        def daily(symbol, adjusted, output_size):
+            call_list.append((symbol, output_size))
+            if symbol == "NVDA":
+                raise DataProviderException("test error")
+            return pd.DataFrame({
+                "timestamp": [datetime.date(2022, 9, 8), datetime.date(2022, 9, 7), datetime.date(2022, 9, 6)],
+                "open": [12., 11., 10.], "high": [13., 12., 11.], "low": [11., 10., 9.], "close": [12.5, 11.5, 10.5],
+                "volume": [300, 200, 100]})
+        mock_daily.side_effect = daily
+
+        # aapl has a recent bar and gets the compact series. unchanged bars are not saved
+        count_dict, error_dict = DailyPrice.objects.sync_alphavantage_daily([aapl, msft, nvda],
+                                                                           today=datetime.date(2022, 9, 9))
+        self.assertEqual(sorted(call_list), [("AAPL", OutputSize.COMPACT), ("MSFT", OutputSize.FULL),
+                                             ("NVDA", OutputSize.FULL)])
+        self.assertEqual(count_dict, {"AAPL": 2, "MSFT": 3})
+        self.assertEqual(list(error_dict), ["NVDA"])
+        self.assertEqual(list(DailyPrice.objects.filter(security=aapl).order_by("price_date").values_list(
+            "price_date", "open", "high", "low", "close", "volume")), [
+            (datetime.date(2022, 9, 6), Decimal(10), Decimal(11), Decimal(9), Decimal("10.5"), 100),
+            (datetime.date(2022, 9, 7), Decimal(11), Decimal(12), Decimal(10), Decimal("11.5"), 200),
+            (datetime.date(2022, 9, 8), Decimal(12), Decimal(13), Decimal(11), Decimal("12.5"), 300)])
+        self.assertEqual(DailyPrice.objects.filter(security=msft).count(), 3)
+
+        # nothing changed. securities with a latest bar older than 100 business days get the full series
+        call_list.clear()
+        count_dict, error_dict = DailyPrice.objects.sync_alphavantage_daily([aapl, msft],
+                                                                           today=datetime.date(2023, 1, 26))
+        self.assertEqual(sorted(call_list), [("AAPL", OutputSize.FULL), ("MSFT", OutputSize.FULL)])
+        self.assertEqual((count_dict, error_dict), ({"AAPL": 0, "MSFT": 0}, {}))
+        call_list.clear()
+        DailyPrice.objects.sync_alphavantage_daily([aapl], today=datetime.date(2023, 1, 25))
+        self.assertEqual(call_list, [("AAPL", OutputSize.COMPACT)])
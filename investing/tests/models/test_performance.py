@@ -0,0 +1,85 @@
+from decimal import Decimal
+import datetime
+
+from ...models.dailyprice import DailyPrice
+from ...models.performance import DailyPerformance
+from ...models.transaction import ActionType, Transaction, TransactionType
+from .test_investmentaccount import InvestmentAccountTests
+from .test_position import PositionTests
+from .test_securitymaster import SecurityMasterTests
+from util.djangomodeltestcasebase import DjangoModelTestCaseBase
+
+
+class DailyPerformanceTests(DjangoModelTestCaseBase):
+
+    def equal(self, model1: DailyPerformance, model2: DailyPerformance):
+        InvestmentAccountTests().equal(model1.investment_account, model2.investment_account)
+        self.simple_equal(model1, model2, DailyPerformance, rem_attr_list=["investment_account"])
+
+    def test_generate_performance_history(self):
+        inv_acc = InvestmentAccountTests.inv_acc_fidelity_roth()
+
+        def cash_transfer(trans_date, amount_net):
+            Transaction.objects.create(
+                investment_account=inv_acc, trans_date=trans_date, trans_type=TransactionType.TRANSFER,
+                action_type=ActionType.TRANSFER, description="CONTRIBUTION", amount_net=amount_net,
+                commission=Decimal(0), fees=Decimal(0))
+
+        cash_transfer(datetime.date(2022, 9, 6), Decimal(1000))
+        cash_transfer(datetime.date(2022, 9, 8), Decimal(550))
+        for day, mv in [(6, 1000), (7, 1100), (8, 1600)]:
+            PositionTests.position_fidelity_roth_spaxx(datetime.date(2022, 9, day), Decimal(mv)).save()
+
+        perf_list = DailyPerformance.generate_performance_history()
+        with self.subTest():
+            self.assertEqual([(perf.cash_flow, perf.pnl, perf.daily_return) for perf in perf_list], [
+                (Decimal(1000), Decimal(0), Decimal(0)), (Decimal(0), Decimal(100), Decimal("0.1")),
+                (Decimal(550), Decimal(-50), Decimal("-0.03030303"))])
+            self.assertEqual(perf_list[-1].twr, Decimal("0.06666667"))
+            self.assertEqual(perf_list[-1].cumulative_pnl, Decimal(50))
+
+        # weekend transfer is added to the next end of day date. cached dates are not recalculated
+        cash_transfer(datetime.date(2022, 9, 10), Decimal(100))
+        PositionTests.position_fidelity_roth_spaxx(datetime.date(2022, 9, 12), Decimal(1800)).save()
+        perf_list = DailyPerformance.generate_performance_history()
+        with self.subTest():
+            self.assertEqual(len(perf_list), 1)
+            self.assertEqual((perf_list[0].cash_flow, perf_list[0].pnl), (Decimal(100), Decimal(100)))
+            self.assertEqual(perf_list[0].twr, Decimal("0.12941177"))
+            self.assertEqual(DailyPerformance.objects.count(), 4)
+            self.assertEqual(len(DailyPerformance.generate_performance_history(rebuild=True)), 4)
+
+        perf_df = DailyPerformance.objects.series_df([inv_acc], start_date=datetime.date(2022, 9, 8), combined=True)
+        with self.subTest():
+            self.assertEqual(list(perf_df["cumulative_pnl"]), [Decimal(-50), Decimal(50)])
+            self.assertAlmostEqual(perf_df["twr"].iloc[-1], 1600 / 1650 * 1800 / 1700 - 1)
+
+    def test_generate_performance_history_security_transfer(self):
+        inv_acc = InvestmentAccountTests.inv_acc_fidelity_roth()
+        aapl = SecurityMasterTests.sm_aapl()
+        DailyPrice.objects.create(security=aapl, price_date=datetime.date(2022, 9, 6), close=Decimal(150))
+        Transaction.objects.create(
+            investment_account=inv_acc, trans_date=datetime.date(2022, 9, 6), trans_type=TransactionType.TRANSFER,
+            action_type=ActionType.TRANSFER, description="CONTRIBUTION", amount_net=Decimal(1000),
+            commission=Decimal(0), fees=Decimal(0))
+        # amount_net of a security transfer is not its value
+        Transaction.objects.create(
+            investment_account=inv_acc, trans_date=datetime.date(2022, 9, 7), trans_type=TransactionType.TRANSFER,
+            action_type=ActionType.TRANSFER, description="TRANSFER OF ASSETS", security=aapl, quantity=Decimal(680),
+            amount_net=Decimal(0), commission=Decimal(0), fees=Decimal(0))
+        for day in [6, 7, 8]:
+            PositionTests.position_fidelity_roth_spaxx(datetime.date(2022, 9, day), Decimal(1000)).save()
+        for eod_date, close in [(datetime.date(2022, 9, 7), Decimal(150)), (datetime.date(2022, 9, 8), Decimal(155))]:
+            pos = PositionTests.position_fidelity_roth_aapl_20220907_680()
+            pos.eod_date, pos.eod_price, pos.market_value = eod_date, close, 680 * close
+            pos.save()
+
+        # the transferred security's market value is a cash flow (priced from the latest close on or before the
+        # transfer date) so only the price change after the transfer is pnl
+        perf_list = DailyPerformance.generate_performance_history()
+        with self.subTest():
+            self.assertEqual([(perf.market_value, perf.cash_flow, perf.pnl, perf.daily_return) for perf in perf_list], [
+                (Decimal(1000), Decimal(1000), Decimal(0), Decimal(0)),
+                (Decimal(103000), Decimal(102000), Decimal(0), Decimal(0)),
+                (Decimal(106400), Decimal(0), Decimal(3400), Decimal("0.03300971"))])
+            self.assertEqual(perf_list[-1].twr, Decimal("0.03300971"))
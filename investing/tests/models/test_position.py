@@ -1,15 +1,25 @@
 from decimal import Decimal
+from unittest.mock import patch
 import datetime
+import io
 
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.test import TransactionTestCase
+import django_pandas.io
+import pandas as pd
 
 from ...models.closedposition import ClosedPosition
+from ...models.dailyprice import DailyPrice
 from ...models.investmentaccount import Broker
-from ...models.position import Position
-from ...models.transaction import Transaction
+from ...models.position import Position, PositionInterval
+from ...models.securitymaster import ChangeType, TickerHistory
+from ...models.transaction import ActionType, Transaction, TransactionType
 from .test_investmentaccount import InvestmentAccountTests
 from .test_securitymaster import SecurityMasterTests
 from util.djangomodeltestcasebase import DjangoModelTestCaseBase
+import util.fixedpointutil as FpUtil
 
 
 class PositionTests(DjangoModelTestCaseBase):
@@ -19,6 +29,25 @@ class PositionTests(DjangoModelTestCaseBase):
         SecurityMasterTests().equal(model1.security, model2.security)
         self.simple_equal(model1, model2, Position, rem_attr_list=["investment_account", "security"])
 
+    def test_mark_to_market(self):
+        aapl = SecurityMasterTests.sm_aapl()
+        PositionTests.position_fidelity_roth_aapl_20220907_680().save()
+        PositionTests.position_fidelity_roth_aapl_20220908_380().save()
+        PositionTests.position_fidelity_roth_spaxx(datetime.date(2022, 9, 8), Decimal("6648.02")).save()
+
+        # no prices. values are unchanged
+        with self.subTest():
+            self.assertEqual(Position.mark_to_market(), 0)
+
+        # 2022-09-08 price is forward filled from 2022-09-07. core security price is 1
+        DailyPrice.objects.create(security=aapl, price_date=datetime.date(2022, 9, 7), close=Decimal("155.96"))
+        with self.subTest():
+            self.assertEqual(Position.mark_to_market(), 2)
+            self.assertEqual(list(Position.objects.order_by("pk").values_list("eod_price", "market_value")), [
+                (Decimal("155.96"), Decimal("106052.80")), (Decimal("155.96"), Decimal("59264.80")),
+                (Decimal(1), Decimal("6648.02"))])
+            self.assertEqual(Position.mark_to_market(), 0)
+
     def test_save_clean(self):
         pos = PositionTests.position_fidelity_roth_aapl_20220907_680()
         pos.enter_date = None
@@ -29,6 +58,26 @@ class PositionTests(DjangoModelTestCaseBase):
         with self.assertRaises(ValidationError):
             pos.clean_fields()
 
+    def test_as_of(self):
+        inv_acc = InvestmentAccountTests.inv_acc_fidelity_roth()
+        PositionTests.position_fidelity_roth_aapl_20220907_680().save()
+        PositionTests.position_fidelity_roth_spaxx(datetime.date(2022, 9, 7), Decimal("6648.02")).save()
+        PositionTests.position_fidelity_roth_aapl_20220908_380().save()
+
+        pos_df = Position.objects.as_of([inv_acc], datetime.date(2022, 9, 7))
+        with self.subTest():
+            self.assertEqual(list(pos_df["ticker"]), ["AAPL", "SPAXX"])
+            self.assertEqual(list(pos_df["quantity"]), [Decimal(680), Decimal("6648.02")])
+            self.assertEqual(pos_df["eod_date"].dtype, "datetime64[ns]")
+            self.assertEqual(pos_df["investment_account"].iloc[0], inv_acc.pk)
+
+        # no positions on a weekend date unless the nearest prior date is used
+        with self.subTest():
+            self.assertEqual(len(Position.objects.as_of(inv_acc, datetime.date(2022, 9, 10))), 0)
+            pos_df = Position.objects.as_of(inv_acc, datetime.date(2022, 9, 10), nearest_prior=True, as_float=True)
+            self.assertEqual(list(pos_df["quantity"]), [380.0])
+            self.assertEqual(pos_df["quantity"].dtype, "float64")
+
     def test_generate_position_history(self):
         self.maxDiff = None
 
@@ -123,6 +172,215 @@ class PositionTests(DjangoModelTestCaseBase):
             self.equal(PositionTests.position_fidelity_roth_spaxx(datetime.date(2022, 9, 20), Decimal("28735.3100")),
                        pos_list[37])
 
+    def test_generate_position_history_incremental(self):
+        inv_acc = InvestmentAccountTests.inv_acc_fidelity_roth()
+        SecurityMasterTests.sm_spaxx_set()
+
+        def cash_transfer(trans_date, amount_net):
+            Transaction.objects.create(
+                investment_account=inv_acc, trans_date=trans_date, trans_type=TransactionType.TRANSFER,
+                action_type=ActionType.TRANSFER, description="CONTRIBUTION", amount_net=amount_net,
+                commission=Decimal(0), fees=Decimal(0))
+
+        cash_transfer(datetime.date(2022, 9, 7), Decimal("1000.00"))
+        pos_list = Position.generate_position_history(Broker.FIDELITY, incremental=True)
+        with self.subTest():
+            self.assertEqual(len(pos_list), 2)
+            self.equal(PositionTests.position_fidelity_roth_spaxx(datetime.date(2022, 9, 6), Decimal(0)), pos_list[0])
+            self.equal(PositionTests.position_fidelity_roth_spaxx(datetime.date(2022, 9, 7), Decimal("1000.00")),
+                       pos_list[1])
+
+        # only days after the latest end of day date are generated, starting from the positions on that date
+        cash_transfer(datetime.date(2022, 9, 9), Decimal("500.00"))
+        pos_list = Position.generate_position_history(Broker.FIDELITY, incremental=True)
+        with self.subTest():
+            self.assertEqual(len(pos_list), 2)
+            self.equal(PositionTests.position_fidelity_roth_spaxx(datetime.date(2022, 9, 8), Decimal("1000.00")),
+                       pos_list[0])
+            self.equal(PositionTests.position_fidelity_roth_spaxx(datetime.date(2022, 9, 9), Decimal("1500.00")),
+                       pos_list[1])
+
+        # no new transactions so nothing to generate
+        with self.subTest():
+            self.assertEqual(Position.generate_position_history(Broker.FIDELITY, incremental=True), [])
+
+    def test_generate_position_history_bulk(self):
+        inv_acc = InvestmentAccountTests.inv_acc_fidelity_roth()
+        SecurityMasterTests.sm_spaxx_set()
+        Transaction.objects.create(
+            investment_account=inv_acc, trans_date=datetime.date(2022, 9, 9), trans_type=TransactionType.TRANSFER,
+            action_type=ActionType.TRANSFER, description="CONTRIBUTION", amount_net=Decimal("1000.00"),
+            commission=Decimal(0), fees=Decimal(0))
+
+        progress_list = []
+        pos_list = Position.generate_position_history(
+            Broker.FIDELITY, bulk=True, batch_size=3, progress_func=lambda saved, total: progress_list.append(saved))
+        with self.subTest():
+            self.assertEqual(len(pos_list), 4)
+            self.assertEqual(Position.objects.count(), 4)
+            self.assertEqual(progress_list, [3, 4])
+        with self.subTest():
+            for pos, eod_date, qty in zip(Position.objects.order_by("eod_date"),
+                                          [datetime.date(2022, 9, d) for d in range(6, 10)],
+                                          [Decimal(0), Decimal(0), Decimal(0), Decimal("1000.00")]):
+                self.equal(PositionTests.position_fidelity_roth_spaxx(eod_date, qty), pos)
+
+    def test_generate_position_history_intervals(self):
+        inv_acc = InvestmentAccountTests.inv_acc_fidelity_roth()
+        SecurityMasterTests.sm_spaxx_set()
+
+        def cash_transfer(trans_date, amount_net):
+            Transaction.objects.create(
+                investment_account=inv_acc, trans_date=trans_date, trans_type=TransactionType.TRANSFER,
+                action_type=ActionType.TRANSFER, description="CONTRIBUTION", amount_net=amount_net,
+                commission=Decimal(0), fees=Decimal(0))
+
+        cash_transfer(datetime.date(2022, 9, 7), Decimal("1000.00"))
+        cash_transfer(datetime.date(2022, 9, 9), Decimal("500.00"))
+        pi_list = Position.generate_position_history(Broker.FIDELITY, intervals=True)
+        with self.subTest():
+            self.assertEqual(Position.objects.count(), 0)
+            self.assertEqual([(pi.valid_from, pi.valid_to, pi.quantity) for pi in pi_list], [
+                (datetime.date(2022, 9, 6), datetime.date(2022, 9, 6), Decimal(0)),
+                (datetime.date(2022, 9, 7), datetime.date(2022, 9, 8), Decimal("1000.00")),
+                (datetime.date(2022, 9, 9), datetime.date(2022, 9, 9), Decimal("1500.00"))])
+
+        # unchanged position on the next business day extends the last interval
+        cash_transfer(datetime.date(2022, 9, 13), Decimal("100.00"))
+        pi_list = Position.generate_position_history(Broker.FIDELITY, incremental=True, intervals=True)
+        with self.subTest():
+            self.assertEqual([(pi.valid_from, pi.valid_to, pi.quantity) for pi in pi_list], [
+                (datetime.date(2022, 9, 9), datetime.date(2022, 9, 12), Decimal("1500.00")),
+                (datetime.date(2022, 9, 13), datetime.date(2022, 9, 13), Decimal("1600.00"))])
+            self.assertEqual(PositionInterval.objects.count(), 4)
+
+        # expanded to one position per business day
+        pos_list = PositionInterval.objects.expand(start_date=datetime.date(2022, 9, 8))
+        with self.subTest():
+            self.assertEqual(len(pos_list), 4)
+            for pos, eod_date, qty in zip(pos_list, [datetime.date(2022, 9, d) for d in [8, 9, 12, 13]],
+                                          [Decimal("1000.00"), Decimal("1500.00"), Decimal("1500.00"),
+                                           Decimal("1600.00")]):
+                self.equal(PositionTests.position_fidelity_roth_spaxx(eod_date, qty), pos)
+
+    def test_generate_position_history_merger_transfer_security(self):
+        inv_acc = InvestmentAccountTests.inv_acc_fidelity_roth()
+        SecurityMasterTests.sm_spaxx_set()
+        aapl = SecurityMasterTests.sm_aapl()
+        msft = SecurityMasterTests.sm_msft()
+
+        def create_transaction(trans_date, trans_type, action_type, description, security, quantity):
+            Transaction.objects.create(
+                investment_account=inv_acc, trans_date=trans_date, trans_type=trans_type, action_type=action_type,
+                description=description, security=security, quantity=quantity, amount_net=Decimal(0),
+                commission=Decimal(0), fees=Decimal(0))
+
+        # 2 msft lots are transferred in on 2022-09-07 and merged into aapl on 2022-09-09
+        create_transaction(datetime.date(2022, 9, 7), TransactionType.TRANSFER, ActionType.TRANSFER,
+                           "TRANSFER OF ASSETS ACAT RECEIVE", msft, Decimal(100))
+        create_transaction(datetime.date(2022, 9, 9), TransactionType.CORP_ACT, ActionType.MERGER_OLD,
+                           "MERGER MER PAYOUT #REOR M0051542700000", msft, Decimal(-100))
+        create_transaction(datetime.date(2022, 9, 9), TransactionType.CORP_ACT, ActionType.MERGER_NEW,
+                           "MERGER MER FROM MSFT#REOR M0051542700001", aapl, Decimal(100))
+
+        # rows for another date or another account are not applied
+        transfer_security_csv = (
+            "trans_date,account_id,ticker,quantity,enter_date,cost_basis_price,cost_basis_total\n"
+            "2022-09-07,123456789,MSFT,60,2016-01-28,23.424,1405.44\n"
+            "2022-09-07,123456789,MSFT,40,2018-03-01,93,3720\n"
+            "2022-09-08,123456789,MSFT,10,2019-05-01,125,1250\n"
+            "2022-09-07,Z12345678,MSFT,5,2020-01-02,160,800\n")
+
+        def pos_tuples(pos_list):
+            return [(pos.eod_date, pos.security.ticker, pos.enter_date, pos.quantity, pos.cost_basis_price,
+                     pos.cost_basis_total) for pos in pos_list]
+
+        with self.subTest():
+            # merger ticker history not created
+            with self.assertRaises(ObjectDoesNotExist):
+                Position.generate_position_history(
+                    Broker.FIDELITY, transfer_security_file=ContentFile(transfer_security_csv.encode()))
+            self.assertEqual(Position.objects.count(), 0)
+
+        TickerHistory.objects.create(security=aapl, new_ticker="AAPL", old_ticker="MSFT",
+                                     change_date=datetime.date(2022, 9, 9), change_type=ChangeType.MERGER)
+        pos_list = Position.generate_position_history(
+            Broker.FIDELITY, transfer_security_file=ContentFile(transfer_security_csv.encode()))
+
+        def day_tuples(eod_date, ticker):
+            return [(eod_date, ticker, datetime.date(2016, 1, 28), Decimal(60), Decimal("23.4240"),
+                     Decimal("1405.44")),
+                    (eod_date, ticker, datetime.date(2018, 3, 1), Decimal(40), Decimal("93.0000"), Decimal("3720.00")),
+                    (eod_date, "SPAXX", None, Decimal(0), Decimal(1), Decimal(0))]
+
+        # the merged lots keep their enter dates and cost basis
+        expected_list = [(datetime.date(2022, 9, 6), "SPAXX", None, Decimal(0), Decimal(1), Decimal(0))] + \
+            day_tuples(datetime.date(2022, 9, 7), "MSFT") + day_tuples(datetime.date(2022, 9, 8), "MSFT") + \
+            day_tuples(datetime.date(2022, 9, 9), "AAPL")
+        with self.subTest():
+            self.assertEqual(pos_tuples(pos_list), expected_list)
+            self.assertEqual(pos_tuples(Position.objects.order_by("eod_date", "security__ticker", "enter_date")),
+                             expected_list)
+
+        # same positions when one account is generated and loads its own merger ticker history. dates with existing
+        # positions are skipped so they are deleted first
+        trans_df = django_pandas.io.read_frame(Transaction.objects.order_by("trans_date", "security"), verbose=False)
+        trans_df["security"] = trans_df["security"].map({sec.pk: sec for sec in [aapl, msft]})
+        ts_df = pd.read_csv(io.StringIO(transfer_security_csv), dtype=str)
+        for col in ["trans_date", "enter_date"]:
+            ts_df[col] = pd.to_datetime(ts_df[col]).dt.date
+        for col in ["quantity", "cost_basis_price", "cost_basis_total"]:
+            ts_df[col] = ts_df[col].map(Decimal)
+        Position.objects.all().delete()
+        pos_df = Position.generate_position_history_by_account(
+            trans_df, django_pandas.io.read_frame(ClosedPosition.objects.all(), verbose=False), ts_df, inv_acc,
+            SecurityMasterTests.sm_spaxx_set(), FpUtil.decimal_places_dict(Position))
+        with self.subTest():
+            self.assertEqual(
+                sorted(zip(pos_df["eod_date"], pos_df["security"].map(lambda x: x.ticker), pos_df["enter_date"],
+                           pos_df["quantity"], pos_df["cost_basis_price"], pos_df["cost_basis_total"]),
+                       key=lambda x: (x[0], x[1], x[2] or datetime.date.min)), expected_list)
+
+    def test_iter_position_history_by_account(self):
+        inv_acc = InvestmentAccountTests.inv_acc_fidelity_roth()
+        spaxx = SecurityMasterTests.sm_spaxx_set()
+        for trans_date, amount_net in [(datetime.date(2022, 9, 7), Decimal("1000.00")),
+                                       (datetime.date(2022, 9, 9), Decimal("500.00"))]:
+            Transaction.objects.create(
+                investment_account=inv_acc, trans_date=trans_date, trans_type=TransactionType.TRANSFER,
+                action_type=ActionType.TRANSFER, description="CONTRIBUTION", amount_net=amount_net,
+                commission=Decimal(0), fees=Decimal(0))
+        trans_df = django_pandas.io.read_frame(Transaction.objects.order_by("trans_date"), verbose=False)
+        cp_df = django_pandas.io.read_frame(ClosedPosition.objects.all(), verbose=False)
+        dp_dict = FpUtil.decimal_places_dict(Position)
+
+        def day_list(changes_only):
+            return [(eod_date, [row[3] for row in row_list], [row[3] for row in ended_row_list])
+                    for eod_date, row_list, ended_row_list in Position.iter_position_history_by_account(
+                        trans_df, cp_df, None, inv_acc, spaxx, dp_dict, changes_only=changes_only)]
+
+        # one snapshot per business day from the account create date
+        with self.subTest():
+            self.assertEqual(day_list(False), [
+                (datetime.date(2022, 9, 6), [Decimal(0)], []), (datetime.date(2022, 9, 7), [Decimal("1000.00")], []),
+                (datetime.date(2022, 9, 8), [Decimal("1000.00")], []),
+                (datetime.date(2022, 9, 9), [Decimal("1500.00")], [])])
+
+        # changed positions replace the ended positions of the previous date
+        with self.subTest():
+            self.assertEqual(day_list(True), [
+                (datetime.date(2022, 9, 6), [Decimal(0)], []),
+                (datetime.date(2022, 9, 7), [Decimal("1000.00")], [Decimal(0)]), (datetime.date(2022, 9, 8), [], []),
+                (datetime.date(2022, 9, 9), [Decimal("1500.00")], [Decimal("1000.00")])])
+
+    def test_last_eod_date_dict(self):
+        self.assertEqual(Position.objects.last_eod_date_dict(Broker.FIDELITY), {})
+
+        PositionTests.position_fidelity_roth_aapl_20220907_680().save()
+        PositionTests.position_fidelity_roth_aapl_20220908_380().save()
+        self.assertEqual(Position.objects.last_eod_date_dict(Broker.FIDELITY),
+                         {InvestmentAccountTests.inv_acc_fidelity_roth().pk: datetime.date(2022, 9, 8)})
+
     def test_load_positions_from_fidelity_file(self):
         with self.assertRaises(NotImplementedError):
             Position.load_positions_from_file(Broker.FIDELITY, "test positions.csv")
@@ -395,4 +653,39 @@ class PositionTests(DjangoModelTestCaseBase):
             security=SecurityMasterTests.sm_nvda_set(), quantity=Decimal("100"), eod_price=Decimal("-12345.6789"),
             market_value=Decimal("-1234567.89"), enter_date=datetime.date(2016, 1, 28), enter_price=Decimal("23.4240"),
             enter_total=Decimal("2342.40"), enter_price_net=Decimal("23.4240"), enter_total_net=Decimal("2342.40"),
-            cost_basis_price=Decimal("23.4240"), cost_basis_total=Decimal("2342.40"))
\ No newline at end of file
+            cost_basis_price=Decimal("23.4240"), cost_basis_total=Decimal("2342.40"))
+
+
+class PositionProcessesTests(TransactionTestCase):
+    """ Worker processes need committed data and connections that can be closed so TestCase transactions can't be used
+    """
+
+    def test_generate_position_history_processes(self):
+        SecurityMasterTests.sm_spaxx_set()
+        for inv_acc, trans_date in [(InvestmentAccountTests.inv_acc_fidelity_roth(), datetime.date(2022, 9, 9)),
+                                    (InvestmentAccountTests.inv_acc_fidelity_individual(), datetime.date(2021, 8, 2))]:
+            Transaction.objects.create(
+                investment_account=inv_acc, trans_date=trans_date, trans_type=TransactionType.TRANSFER,
+                action_type=ActionType.TRANSFER, description="CONTRIBUTION", amount_net=Decimal("1000.00"),
+                commission=Decimal(0), fees=Decimal(0))
+
+        def pos_tuples(pos_list):
+            return [(pos.eod_date, pos.investment_account.pk, pos.security.ticker, pos.enter_date, pos.quantity,
+                     pos.cost_basis_total, pos.market_value) for pos in pos_list]
+
+        serial_list = pos_tuples(Position.generate_position_history(Broker.FIDELITY))
+        Position.objects.all().delete()
+        process_list = pos_tuples(Position.generate_position_history(Broker.FIDELITY, processes=2))
+        with self.subTest():
+            self.assertEqual(len(serial_list), 11 + 4)
+            self.assertEqual(process_list, serial_list)
+            self.assertEqual(pos_tuples(Position.objects.order_by("eod_date", "investment_account")), serial_list)
+
+        # closing connections for worker processes would break the transaction so accounts are generated serially
+        Position.objects.all().delete()
+        with transaction.atomic(), patch("investing.models.position.ProcessPoolExecutor") as executor_mock:
+            atomic_list = pos_tuples(Position.generate_position_history(Broker.FIDELITY, processes=2))
+        with self.subTest():
+            executor_mock.assert_not_called()
+            self.assertEqual(atomic_list, serial_list)
+            self.assertEqual(Position.objects.count(), len(serial_list))
@@ -2,9 +2,10 @@ from decimal import Decimal, InvalidOperation
 import datetime
 
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
-from django.db import IntegrityError, transaction
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
 
-from ...models.securitymaster import AssetClass, AssetSubClass, OptionType, SecurityMaster
+from ...models.securitymaster import AssetClass, AssetSubClass, MyIdSequence, OptionType, SecurityMaster
 from util.djangomodeltestcasebase import DjangoModelTestCaseBase
 
 
@@ -81,6 +82,27 @@ class SecurityMasterTests(DjangoModelTestCaseBase):
         # test create default object. create default object then test equality to ensure it is a default object
         self.equal(SecurityMaster.objects.get_or_create_default("NVDA"), SecurityMasterTests.sm_nvda())
 
+    def test_get_or_create_defaults(self):
+        aapl = SecurityMasterTests.sm_aapl()
+        SecurityMaster.objects.create_default("NS1")
+
+        # existing tickers in one query. defaults created in one query after one my_id query
+        with CaptureQueriesContext(connection) as ctx:
+            sec_dict, sec_ns_list = SecurityMaster.objects.get_or_create_defaults(
+                ["NVDA", "AAPL", "TSLA", "NVDA"], has_fidelity_lots={"NVDA": True, "TSLA": False})
+        self.assertEqual(len([q for q in ctx.captured_queries if q["sql"].startswith(("SELECT", "INSERT"))]),
+                         3 if connection.features.can_return_rows_from_bulk_insert else 4)
+        self.assertEqual(list(sec_dict), ["AAPL", "NVDA", "TSLA"])
+        self.equal(sec_dict["AAPL"], aapl)
+        self.assertEqual([(sec.ticker, sec.my_id, sec.has_fidelity_lots) for sec in sec_ns_list],
+                         [("NVDA", "NS_0000002", True), ("TSLA", "NS_0000003", False)])
+        self.equal(sec_ns_list[0], SecurityMaster.objects.get(ticker="NVDA"))
+
+        # cached tickers are not looked up
+        with self.assertNumQueries(0):
+            self.assertEqual(SecurityMaster.objects.get_or_create_defaults(["AAPL", "TSLA"], sec_dict=sec_dict),
+                             (sec_dict, []))
+
     def test_field_to_security_dict(self):
         with self.assertRaises(ValueError):
             SecurityMaster.objects.field_to_security_dict("fail", [])
@@ -158,6 +180,30 @@ class SecurityMasterTests(DjangoModelTestCaseBase):
         SecurityMasterTests.sm_msft()
         self.assertEqual(SecurityMaster.generate_my_id(AssetClass.EQUITY), "EQ_1000002")
 
+    def test_generate_my_ids(self):
+        self.assertEqual(SecurityMaster.generate_my_ids(AssetClass.EQUITY, 2), ["EQ_0000001", "EQ_0000002"])
+        SecurityMasterTests.sm_msft()
+        self.assertEqual(SecurityMaster.generate_my_ids(AssetClass.EQUITY, 3),
+                         ["EQ_1000002", "EQ_1000003", "EQ_1000004"])
+        self.assertEqual(SecurityMaster.generate_my_ids(AssetClass.EQUITY, 0), [])
+
+    def test_my_id_sequence_reserve(self):
+        # counter starts after the largest existing my_id
+        SecurityMasterTests.sm_msft()
+        self.assertEqual(MyIdSequence.objects.reserve(AssetClass.EQUITY, 3), 1000002)
+        self.assertEqual(MyIdSequence.objects.reserve(AssetClass.EQUITY, 1), 1000005)
+        self.assertEqual(MyIdSequence.objects.get(asset_class=AssetClass.EQUITY).last_value, 1000005)
+
+        # my_ids set directly move the counter forward but never back
+        SecurityMaster.objects.create(my_id="EQ_2000000", ticker="TSLA", asset_class=AssetClass.EQUITY,
+                                      asset_subclass=AssetSubClass.COMMON_STOCK)
+        SecurityMasterTests.sm_aapl()
+        self.assertEqual(MyIdSequence.objects.reserve(AssetClass.EQUITY, 1), 2000001)
+
+        # asset classes have separate counters
+        self.assertEqual(MyIdSequence.objects.reserve(AssetClass.BOND, 2), 1)
+        self.assertEqual(MyIdSequence.objects.reserve(AssetClass.BOND, 0), 3)
+
     def test_get_option_data_from_ticker(self):
         # underlying security does not exist
         with self.subTest():
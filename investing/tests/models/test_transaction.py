@@ -2,6 +2,8 @@ from decimal import Decimal
 import datetime
 
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
+import numpy as np
+import pandas as pd
 
 from ...models.investmentaccount import Broker
 from ...models.transaction import ActionType, Transaction, TransactionType
@@ -16,7 +18,8 @@ class TransactionTests(DjangoModelTestCaseBase):
         InvestmentAccountTests().equal(model1.investment_account, model2.investment_account)
         if model1.security is not None or model2.security is not None:
             SecurityMasterTests().equal(model1.security, model2.security)
-        self.simple_equal(model1, model2, Transaction, rem_attr_list=["investment_account", "security"])
+        self.simple_equal(model1, model2, Transaction,
+                          rem_attr_list=["investment_account", "security", "content_hash"])
 
     def test_action_type_get_transaction_type(self):
         # all ActionType enums are set in get_transaction_type()
@@ -49,6 +52,100 @@ class TransactionTests(DjangoModelTestCaseBase):
         with self.assertRaises(ValidationError):
             trans.clean_fields()
 
+    def test_content_hash_srs(self):
+        trans_df = pd.DataFrame({
+            "investment_account": [1, 1, 1, 2], "trans_date": [datetime.date(2023, 10, 27)] * 4,
+            "trans_type": [TransactionType.TRADE] * 4, "action_type": [ActionType.BUY] * 4,
+            "description": ["YOU BOUGHT"] * 4, "quantity": [1000000, 1000000, 2000000, 1000000],
+            "price": [1500000] * 4, "amount_net": [-15000] * 4, "commission": [0] * 4, "fees": [0] * 4})
+        hash_srs = Transaction.content_hash_srs(trans_df)
+
+        with self.subTest():
+            # identical transactions have different hashes
+            self.assertEqual(len(hash_srs.drop_duplicates()), 4)
+        with self.subTest():
+            # hashes do not depend on other rows. identical transactions are numbered in order
+            self.assertEqual(Transaction.content_hash_srs(trans_df.iloc[[0, 3]]).tolist(),
+                             hash_srs.iloc[[0, 3]].tolist())
+            self.assertEqual(Transaction.content_hash_srs(trans_df.iloc[[1]]).tolist(), hash_srs.iloc[[0]].tolist())
+
+    def test_validate_df(self):
+        trans_df = pd.DataFrame({
+            "trans_type": [TransactionType.TRANSFER, TransactionType.TRADE],
+            "action_type": [ActionType.TRANSFER, ActionType.BUY], "security": [None, "AAPL"]})
+        Transaction.validate_df(trans_df)
+
+        with self.subTest():
+            # action type does not match transaction type
+            bad_df = trans_df.copy()
+            bad_df.loc[1, "action_type"] = ActionType.DIV
+            with self.assertRaises(ValidationError):
+                Transaction.validate_df(bad_df)
+
+        with self.subTest():
+            # transaction type requires a security
+            bad_df = trans_df.copy()
+            bad_df.loc[1, "security"] = None
+            with self.assertRaises(ValidationError):
+                Transaction.validate_df(bad_df)
+
+    def test_fidelity_trans_act_type_df(self):
+        # one description per rule in FIDELITY_DESCRIPTION_RULES order
+        desc_type_list = [
+            ("DIVIDEND RECEIVED", TransactionType.CORP_ACT, ActionType.DIV),
+            ("INCREASE COLLATERAL MARK TO MARKET ADJ", TransactionType.OTHER, ActionType.LOAN),
+            ("YOU LOANED VS Z21-323368-1", TransactionType.OTHER, ActionType.LOAN),
+            ("LOAN RETURNED YOU RETURNED VS Z21-323368-1", TransactionType.OTHER, ActionType.LOAN),
+            ("REINVESTMENT REINVEST @ $1.000", TransactionType.TRADE, ActionType.BUY),
+            ("YOU BOUGHT", TransactionType.TRADE, ActionType.BUY),
+            ("CONTRIB CURRENT YR CASH CONTRB CURR YR ER46855432 /WEB", TransactionType.TRANSFER, ActionType.TRANSFER),
+            ("MONEY LINE PAID EFT FUNDS PAID ED07172945 /WEB", TransactionType.TRANSFER, ActionType.TRANSFER),
+            ("ROLLOVER CASH DIRECT ROLLOVER FROM FIRSCO PLAN 38452", TransactionType.TRANSFER, ActionType.TRANSFER),
+            ("TRANSFER OF ASSETS ACAT RECEIVE", TransactionType.TRANSFER, ActionType.TRANSFER),
+            ("TRANSFERRED TO VS 237-198406-1 CURRENT CONTRIBUTION", TransactionType.TRANSFER, ActionType.TRANSFER),
+            ("WIRE TRANS FROM BANK WR45932686", TransactionType.TRANSFER, ActionType.TRANSFER),
+            ("RECEIVED FROM YOU", TransactionType.TRANSFER, ActionType.TRANSFER),
+            ("INTEREST", TransactionType.INTEREST, ActionType.INT_PMT),
+            ("YOU SOLD", TransactionType.TRADE, ActionType.SELL),
+            ("YOU SOLD OPENING TRANSACTION", TransactionType.TRADE, ActionType.SELL_SHORT),
+            ("EXPIRED CALL (AAPL) PROSHARES ULTRAPRO SEP 16 22 $41.5", TransactionType.OTHER, ActionType.OPT_EXP),
+            ("EXPIRED PUT (AAPL) PROSHARES ULTRAPRO SEP 16 22 $41.5", TransactionType.OTHER, ActionType.OPT_EXP),
+            # not caught by YOU BOUGHT
+            ("YOU BOUGHT CLOSING TRANSACTION", TransactionType.TRADE, ActionType.BUY_COVER),
+            ("FEE CHARGED", TransactionType.OTHER, ActionType.FEE),
+            ("DISTRIBUTION", TransactionType.CORP_ACT, ActionType.STOCK_SPLIT),
+            # MERGER MER FROM is matched before MERGER MER
+            ("MERGER MER FROM MSFT#REOR M0051542700001", TransactionType.CORP_ACT, ActionType.MERGER_NEW),
+            ("MERGER MER PAYOUT #REOR M0051542700000", TransactionType.CORP_ACT, ActionType.MERGER_OLD),
+        ]
+        self.assertEqual(len(desc_type_list), len(Transaction.FIDELITY_DESCRIPTION_RULES))
+
+        # descriptions repeat and the index is kept
+        desc_srs = pd.Series([d for d, _, _ in desc_type_list] * 2, index=range(100, 100 + 2 * len(desc_type_list)))
+        type_df = Transaction._fidelity_trans_act_type_df(desc_srs, np.ones(len(desc_srs), dtype=np.int64))
+        self.assertEqual(type_df.index.tolist(), desc_srs.index.tolist())
+        self.assertEqual(list(zip(type_df["Transaction Type"], type_df["Action Type"])),
+                         [(t, a) for _, t, a in desc_type_list] * 2)
+
+        # DISTRIBUTION is a STOCK_SPLIT if quantity is positive and a STOCK_CONS if quantity is negative
+        type_df = Transaction._fidelity_trans_act_type_df(pd.Series(["DISTRIBUTION", "DISTRIBUTION", "YOU SOLD"]),
+                                                          np.array([20000, -20000, -20000], dtype=np.int64))
+        self.assertEqual(type_df["Action Type"].tolist(), [ActionType.STOCK_SPLIT, ActionType.STOCK_CONS,
+                                                           ActionType.SELL])
+
+        with self.subTest():
+            # DISTRIBUTION quantity is 0
+            with self.assertRaises(ValueError):
+                Transaction._fidelity_trans_act_type_df(pd.Series(["YOU BOUGHT", "DISTRIBUTION"]),
+                                                        np.array([10000, 0], dtype=np.int64))
+
+        with self.subTest():
+            # description does not match a rule. YOU BOUGHT and YOU SOLD are exact matches
+            for desc in ["JOURNALED", "YOU BOUGHT PROSPECTUS UNDER SEPARATE COVER", ""]:
+                with self.assertRaises(ValueError):
+                    Transaction._fidelity_trans_act_type_df(pd.Series(["YOU SOLD", desc]),
+                                                            np.array([-10000, 10000], dtype=np.int64))
+
     def test_load_transactions_from_fidelity_file(self):
         self.maxDiff = None
 
@@ -0,0 +1,107 @@
+from unittest.mock import patch
+import datetime
+
+from django.utils import timezone
+
+from ...models.investmentaccount import Broker
+from ...models.transaction import ActionType, Transaction, TransactionType
+from ...models.uploadjob import UploadJob
+from .test_investmentaccount import InvestmentAccountTests
+from .test_securitymaster import SecurityMasterTests
+from util.djangomodeltestcasebase import DjangoModelTestCaseBase
+
+
+class UploadJobTests(DjangoModelTestCaseBase):
+
+    def equal(self, model1: UploadJob, model2: UploadJob):
+        self.simple_equal(model1, model2, UploadJob)
+
+    def test_fail_if_stale(self):
+        now = timezone.now()
+        job = UploadJob.objects.create_job(UploadJob.JobType.TRANSACTION, Broker.FIDELITY, "stale.csv")
+        self.assertFalse(job.fail_if_stale())
+
+        # queued job that was never started, e.g. the process restarted before the pool ran it
+        UploadJob.objects.filter(pk=job.pk).update(create_time=now - datetime.timedelta(hours=2))
+        job = UploadJob.objects.get(pk=job.pk)
+        self.assertTrue(job.fail_if_stale())
+        self.assertEqual(job.status, UploadJob.Status.FAILED)
+        self.assertIn("stopped without finishing", job.error)
+        self.assertFalse(job.fail_if_stale())
+        # a stale job is not run if the pool gets to it later
+        job.run()
+        self.assertEqual(UploadJob.objects.get(pk=job.pk).status, UploadJob.Status.FAILED)
+
+        # running job is stale once its heartbeat stops
+        job = UploadJob.objects.create_job(UploadJob.JobType.TRANSACTION, Broker.FIDELITY, "stale.csv")
+        UploadJob.objects.filter(pk=job.pk).update(status=UploadJob.Status.RUNNING,
+                                                   start_time=now - datetime.timedelta(hours=1),
+                                                   heartbeat_time=now - datetime.timedelta(seconds=10))
+        job = UploadJob.objects.get(pk=job.pk)
+        self.assertFalse(job.fail_if_stale())
+        UploadJob.objects.filter(pk=job.pk).update(heartbeat_time=now - datetime.timedelta(minutes=10))
+        job = UploadJob.objects.get(pk=job.pk)
+        # a heartbeat after the job was read means it is still alive
+        UploadJob.objects.filter(pk=job.pk).update(heartbeat_time=now)
+        self.assertFalse(job.fail_if_stale())
+        self.assertEqual(UploadJob.objects.get(pk=job.pk).status, UploadJob.Status.RUNNING)
+        UploadJob.objects.filter(pk=job.pk).update(heartbeat_time=now - datetime.timedelta(minutes=10))
+        job = UploadJob.objects.get(pk=job.pk)
+        self.assertTrue(job.fail_if_stale())
+        self.assertEqual(UploadJob.objects.get(pk=job.pk).status, UploadJob.Status.FAILED)
+
+    def test_run_failed(self):
+        job = UploadJob.objects.create_job(UploadJob.JobType.TRANSACTION, Broker.FIDELITY,
+                                           "upload job missing file.csv")
+        self.assertEqual(job.status, UploadJob.Status.QUEUED)
+        self.assertFalse(job.is_done())
+
+        # errors are recorded on the job and not raised
+        job.run()
+        job = UploadJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, UploadJob.Status.FAILED)
+        self.assertTrue(job.is_done())
+        self.assertIn("FileNotFoundError", job.error)
+        self.assertIsNone(job.result)
+        self.assertIsNotNone(job.end_time)
+        self.assertIsNotNone(job.heartbeat_time)
+        self.assertEqual(job.result_page(1).object_list, [])
+
+    @patch.object(Transaction, "load_transactions_from_file")
+    def test_run_succeeded(self, mock_load):
+        inv_acc = InvestmentAccountTests.inv_acc_fidelity_individual()
+        aapl = SecurityMasterTests.sm_aapl()
+        trans_date = datetime.date(2022, 9, 6)
+        trans_list = [Transaction(investment_account=inv_acc, trans_date=trans_date, security=aapl,
+                                  trans_type=TransactionType.INTEREST, action_type=ActionType.INT_PMT,
+                                  description="interest " + str(i), quantity=0, price=0, amount_net=i, commission=0,
+                                  fees=0, content_hash=str(i)) for i in range(6)]
+        # saved before the job so it is not one of the job's records
+        trans_list.pop().save()
+        progress_list = []
+
+        def load(broker, file, bulk, progress_func):
+            self.assertEqual(UploadJob.objects.get(pk=job.pk).status, UploadJob.Status.RUNNING)
+            for start, progress in ((0, 2), (2, 4), (4, 5)):
+                Transaction.objects.bulk_create(trans_list[start:progress])
+                progress_func(progress, 5)
+                progress_list.append(UploadJob.objects.values_list("progress", "total").get(pk=job.pk))
+            return trans_list, [aapl], {(inv_acc, trans_date)}
+        mock_load.side_effect = load
+
+        job = UploadJob.objects.create_job(UploadJob.JobType.TRANSACTION, Broker.FIDELITY, "transactions.csv")
+        job.run()
+        self.assertEqual(progress_list, [(2, 5), (4, 5), (5, 5)])
+
+        job = UploadJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, UploadJob.Status.SUCCEEDED)
+        self.assertEqual((job.progress, job.total), (5, 5))
+        self.assertEqual(job.result["sec_ns_str"], "AAPL")
+        self.assertEqual(len(job.result["eiacd_list"]), 1)
+
+        # rows are paged in load order from the records linked to the job
+        self.assertEqual(job.records().count(), 5)
+        page = job.result_page(2, per_page=2)
+        self.assertEqual([row[5] for row in page.object_list], ["interest 2", "interest 3"])
+        self.assertEqual(page.paginator.num_pages, 3)
+        self.assertEqual(job.result_page(99, per_page=2).number, 3)
@@ -0,0 +1,136 @@
+from decimal import Decimal
+import datetime
+
+from ..models.test_securitymaster import SecurityMasterTests
+from ...positionengine.lotbook import Lot, LotBook
+from util.testcasebase import TestCaseBase
+
+
+class LotBookTests(TestCaseBase):
+
+    def equal(self, obj1: object, obj2: object):
+        pass
+
+    def test_add_lot(self):
+        spaxx = SecurityMasterTests.sm_spaxx_set()
+        aapl = SecurityMasterTests.sm_aapl()
+        lot_book = LotBookTests.lot_book(spaxx)
+
+        # aggregate position sums quantity and totals. prices keep the first value
+        lot_book.add_core(Decimal(100))
+        agg = lot_book.add_core(Decimal(-40))
+        self.assertEqual(agg.quantity, Decimal(60))
+        self.assertEqual(agg.enter_total_net, Decimal(60))
+        self.assertEqual(agg.cost_basis_price, Decimal(1))
+
+        lot1 = lot_book.add_lot(aapl, Decimal(2), datetime.date(2022, 9, 7), Decimal(10), Decimal(20), Decimal(10),
+                                Decimal(20), Decimal(10), Decimal(20))
+        lot2 = lot_book.add_lot(aapl, Decimal(3), datetime.date(2022, 9, 7), Decimal(11), Decimal(33), Decimal(11),
+                                Decimal(33), Decimal(11), Decimal(33))
+        self.assertLess(lot1.seq, lot2.seq)
+        self.assertEqual(lot_book.quantity(aapl), Decimal(5))
+        self.assertEqual(lot_book.snapshot(), [agg.to_tuple(), lot1.to_tuple(), lot2.to_tuple()])
+        self.assertEqual(len(lot_book.snapshot()[0]), len(Lot.FIELDS))
+
+    def test_close_long(self):
+        spaxx = SecurityMasterTests.sm_spaxx_set()
+        aapl = SecurityMasterTests.sm_aapl()
+        lot_book = LotBookTests.lot_book(spaxx)
+        ed = datetime.date(2022, 9, 7)
+        lot1 = lot_book.add_lot(aapl, Decimal(4), ed, Decimal(10), Decimal(40), Decimal(10), Decimal(40), Decimal(10),
+                                Decimal(40))
+        lot2 = lot_book.add_lot(aapl, Decimal("0.5"), ed, Decimal(12), Decimal(6), Decimal(12), Decimal(6),
+                                Decimal(12), Decimal(6))
+
+        # no lot with enter date or cost basis price within tolerance
+        self.assertFalse(lot_book.close_long(aapl, datetime.date(2022, 9, 8), Decimal(10), Decimal(1), Decimal(10)))
+        self.assertFalse(lot_book.close_long(aapl, ed, Decimal("10.001"), Decimal(1), Decimal(10)))
+
+        self.assertTrue(lot_book.close_long(aapl, ed, Decimal("10.0005"), Decimal(1), Decimal(10)))
+        self.assertEqual(lot1.quantity, Decimal(3))
+        self.assertEqual(lot1.enter_total, Decimal(30))
+        self.assertEqual(lot1.cost_basis_total, Decimal(30))
+
+        # partial shares allow a greater tolerance. lots with 0 quantity are removed
+        self.assertTrue(lot_book.close_long(aapl, ed, Decimal("12.015"), Decimal("0.5"), Decimal(6)))
+        self.assertEqual(lot2.quantity, Decimal(0))
+        self.assertEqual(lot_book.snapshot(), [lot1.to_tuple()])
+
+    def test_close_long_index(self):
+        spaxx = SecurityMasterTests.sm_spaxx_set()
+        aapl = SecurityMasterTests.sm_aapl()
+        lot_book = LotBookTests.lot_book(spaxx)
+        ed = datetime.date(2022, 9, 7)
+        lot_list = [lot_book.add_lot(aapl, Decimal(1), ed, price, price, price, price, price, price)
+                    for price in [Decimal(30), Decimal(10), Decimal("10.0005"), Decimal(20)]]
+
+        # lots within tolerance are matched in the order they were added, not by cost basis price
+        self.assertTrue(lot_book.close_long(aapl, ed, Decimal("10.0004"), Decimal(1), Decimal(10)))
+        self.assertEqual(lot_book.snapshot(), [lot.to_tuple() for lot in lot_list if lot is not lot_list[1]])
+        self.assertTrue(lot_book.close_long(aapl, ed, Decimal("10.0004"), Decimal(1), Decimal(10)))
+        self.assertFalse(lot_book.close_long(aapl, ed, Decimal("10.0004"), Decimal(1), Decimal(10)))
+
+        # lots are matched at split adjusted prices
+        lot_book.split(aapl, Decimal(2))
+        self.assertFalse(lot_book.close_long(aapl, ed, Decimal(20), Decimal(1), Decimal(10)))
+        self.assertTrue(lot_book.close_long(aapl, ed, Decimal(10), Decimal(2), Decimal(20)))
+        self.assertEqual(lot_book.snapshot(), [lot_list[0].to_tuple()])
+
+    def test_close_short(self):
+        spaxx = SecurityMasterTests.sm_spaxx_set()
+        aapl_call = SecurityMasterTests.sm_aapl_call()
+        lot_book = LotBookTests.lot_book(spaxx)
+        ed = datetime.date(2022, 9, 7)
+        lot = lot_book.add_lot(aapl_call, Decimal(-2), ed, Decimal("1.5"), Decimal(300), Decimal("1.49"), Decimal(298),
+                               None, None)
+
+        self.assertFalse(lot_book.close_short(aapl_call, ed, Decimal("1.48"), Decimal(1), Decimal(100)))
+        self.assertTrue(lot_book.close_short(aapl_call, ed, Decimal("1.49"), Decimal(1), Decimal(100)))
+        self.assertEqual(lot.quantity, Decimal(-1))
+        self.assertEqual(lot.enter_total, Decimal(150))
+        self.assertEqual(lot.enter_total_net, Decimal(198))
+        self.assertTrue(lot_book.close_short(aapl_call, ed, Decimal("1.49"), Decimal(1), Decimal(100)))
+        self.assertEqual(lot_book.snapshot(), [])
+
+    def test_merge(self):
+        spaxx = SecurityMasterTests.sm_spaxx_set()
+        aapl = SecurityMasterTests.sm_aapl()
+        msft = SecurityMasterTests.sm_msft()
+        lot_book = LotBookTests.lot_book(spaxx)
+        lot1 = lot_book.add_lot(msft, Decimal(1), datetime.date(2022, 9, 7), Decimal(10), Decimal(10), Decimal(10),
+                                Decimal(10), Decimal(10), Decimal(10))
+        lot2 = lot_book.add_lot(aapl, Decimal(2), datetime.date(2022, 9, 8), Decimal(20), Decimal(40), Decimal(20),
+                                Decimal(40), Decimal(20), Decimal(40))
+
+        # lots moved to the new security stay in the order they were added
+        lot_book.merge("MSFT", aapl)
+        self.assertEqual(lot1.security, aapl)
+        self.assertEqual(lot_book.quantity(msft), Decimal(0))
+        self.assertEqual(lot_book.quantity(aapl), Decimal(3))
+        self.assertEqual(lot_book.snapshot(), [lot1.to_tuple(), lot2.to_tuple()])
+
+    def test_split(self):
+        spaxx = SecurityMasterTests.sm_spaxx_set()
+        aapl = SecurityMasterTests.sm_aapl()
+        lot_book = LotBookTests.lot_book(spaxx)
+        lot1 = lot_book.add_lot(aapl, Decimal(2), datetime.date(2022, 9, 7), Decimal(10), Decimal(20), Decimal(10),
+                                Decimal(20), Decimal(10), Decimal(20))
+        lot2 = lot_book.add_lot(aapl, Decimal(-2), datetime.date(2022, 9, 8), Decimal(12), Decimal(24), Decimal(12),
+                                Decimal(24), None, None)
+        lot_book.add_lot(aapl, Decimal(2), datetime.date(2022, 9, 9), Decimal(14), Decimal(28), Decimal(14),
+                         Decimal(28), Decimal(14), Decimal(28))
+
+        # 2 shares held. 4 shares received is a 3 for 1 split
+        lot_book.split(aapl, Decimal(4))
+        self.assertEqual(lot1.quantity, Decimal(6))
+        self.assertEqual(lot1.enter_price, Decimal("3.3333"))
+        self.assertEqual(lot1.cost_basis_price, Decimal("3.3333"))
+        self.assertEqual(lot1.enter_total, Decimal(20))
+        self.assertEqual(lot2.quantity, Decimal(-6))
+        self.assertIsNone(lot2.cost_basis_price)
+
+    @staticmethod
+    def lot_book(core_security):
+        return LotBook(core_security, {"quantity": 4, "eod_price": 4, "market_value": 2, "enter_price": 4,
+                                       "enter_total": 2, "enter_price_net": 4, "enter_total_net": 2,
+                                       "cost_basis_price": 4, "cost_basis_total": 2})
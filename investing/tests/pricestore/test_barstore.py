@@ -0,0 +1,99 @@
+import datetime
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from ...dataprovider.alphavantage import IntradayInterval
+from ...pricestore.barstore import BarStore
+from util.testcasebase import TestCaseBase
+
+
+class BarStoreTests(TestCaseBase):
+
+    def equal(self, obj1: object, obj2: object):
+        pass
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = temp_dir.name
+        self.store = BarStore(self.path)
+
+    def test_append_read(self):
+        # AlphaVantage frames are newest first
+        df = BarStoreTests.daily_df([datetime.date(2023, 1, 5), datetime.date(2023, 1, 4), datetime.date(2023, 1, 3)],
+                                    [3., 2., 1.])
+        self.assertEqual(self.store.append("IBM", BarStore.DAILY, df), 3)
+        bar_dict = self.store.read("IBM", BarStore.DAILY, columns=("time", "close", "volume"))
+        self.assertEqual(list(bar_dict["time"]), list(np.array(["2023-01-03", "2023-01-04", "2023-01-05"],
+                                                                dtype="datetime64[s]")))
+        self.assertEqual(list(bar_dict["close"]), [1., 2., 3.])
+        self.assertEqual(list(bar_dict["volume"]), [100, 200, 300])
+        self.assertIsInstance(bar_dict["close"], np.memmap)
+        self.assertFalse(bar_dict["close"].flags.writeable)
+
+        # overlapping frames only append new bars
+        df = BarStoreTests.daily_df([datetime.date(2023, 1, 6), datetime.date(2023, 1, 5)], [4., 30.])
+        self.assertEqual(self.store.append("IBM", BarStore.DAILY, df), 1)
+        self.assertEqual(self.store.append("IBM", BarStore.DAILY, df), 0)
+        self.assertEqual(list(self.store.read("IBM", BarStore.DAILY)["close"]), [1., 2., 3., 4.])
+        self.assertEqual(self.store.date_range("IBM", BarStore.DAILY),
+                         (np.datetime64("2023-01-03", "s"), np.datetime64("2023-01-06", "s")))
+
+        # date window is inclusive and dates include the whole day
+        self.assertEqual(list(self.store.read("IBM", BarStore.DAILY, datetime.date(2023, 1, 4),
+                                              datetime.date(2023, 1, 5))["close"]), [2., 3.])
+        self.assertEqual(len(self.store.read("IBM", BarStore.DAILY, datetime.date(2023, 2, 1))["close"]), 0)
+        self.assertEqual(len(self.store.read("AAPL", BarStore.DAILY)["close"]), 0)
+
+        # intraday bars are stored separately from daily bars
+        df = BarStoreTests.daily_df([datetime.datetime(2023, 1, 5, 9, 30), datetime.datetime(2023, 1, 5, 9, 35)],
+                                    [5., 6.])
+        self.assertEqual(self.store.append("IBM", IntradayInterval.M5, df), 2)
+        self.assertEqual(list(self.store.read("IBM", IntradayInterval.M5, end=np.datetime64("2023-01-05T09:30"))[
+            "close"]), [5.])
+        self.assertEqual(len(self.store.read("IBM", BarStore.DAILY)["close"]), 4)
+
+        # a new store on the same path reads the index and ignores rows past the indexed count
+        with open(os.path.join(self.path, BarStore.DAILY, "IBM", "close.bin"), "ab") as f:
+            f.write(np.array([99.]).tobytes())
+        store = BarStore(self.path)
+        self.assertEqual(store.symbols(BarStore.DAILY), ["IBM"])
+        self.assertEqual(list(store.read("IBM", BarStore.DAILY)["close"]), [1., 2., 3., 4.])
+        df = BarStoreTests.daily_df([datetime.date(2023, 1, 9)], [5.])
+        self.assertEqual(store.append("IBM", BarStore.DAILY, df), 1)
+        self.assertEqual(list(store.read("IBM", BarStore.DAILY)["close"]), [1., 2., 3., 4., 5.])
+
+        store.delete("IBM", BarStore.DAILY)
+        self.assertIsNone(store.date_range("IBM", BarStore.DAILY))
+        self.assertEqual(store.symbols(BarStore.DAILY), [])
+        self.assertRaises(ValueError, store.append, "../IBM", BarStore.DAILY, df)
+
+    def test_read_many(self):
+        # ten years of daily closes for 500 symbols
+        date_arr = np.arange(np.datetime64("2013-01-01"), np.datetime64("2023-01-01"))
+        date_arr = date_arr[np.is_busday(date_arr)]
+        close_arr = np.arange(len(date_arr), dtype=float)
+        symbols = ["S" + str(i) for i in range(500)]
+        for symbol in symbols:
+            self.store.append(symbol, BarStore.DAILY, BarStoreTests.daily_df(date_arr, close_arr))
+
+        store = BarStore(self.path)
+        start_time = time.perf_counter()
+        bar_dict = store.read_many(symbols + ["NONE"], BarStore.DAILY, datetime.date(2018, 1, 1))
+        self.assertLess(time.perf_counter() - start_time, 1.)
+        self.assertEqual(sorted(bar_dict), sorted(symbols))
+        start = np.searchsorted(date_arr, np.datetime64("2018-01-01"))
+        for symbol in symbols:
+            self.assertEqual(len(bar_dict[symbol]["close"]), len(date_arr) - start)
+        self.assertEqual(bar_dict["S0"]["close"][0], close_arr[start])
+        self.assertEqual(bar_dict["S499"]["time"][-1], np.datetime64(date_arr[-1], "s"))
+
+    @staticmethod
+    def daily_df(timestamps, closes):
+        closes = np.asarray(closes, dtype=float)
+        return pd.DataFrame({"timestamp": list(timestamps), "open": closes, "high": closes, "low": closes,
+                             "close": closes, "volume": (np.arange(len(closes)) + 1)[::-1] * 100})
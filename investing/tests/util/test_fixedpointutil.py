@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from util.testcasebase import TestCaseBase
+import util.fixedpointutil as FpUtil
+
+
+class FixedPointUtilTests(TestCaseBase):
+    """ Results are compared to round(Decimal, decimal places), which rounds half even """
+
+    def equal(self, obj1: object, obj2: object):
+        pass
+
+    def test_div_round(self):
+        arr = np.arange(-60, 61, dtype=np.int64)
+        for divisor in [1, 2, 4, 10, 7]:
+            with self.subTest(divisor=divisor):
+                self.assertEqual(FpUtil.div_round(arr, divisor).tolist(),
+                                 [int(round(Decimal(int(x)) / divisor, 0)) for x in arr])
+
+        # ties round to the even quotient for positive and negative values
+        self.assertEqual(FpUtil.div_round(np.array([5, 15, 25, -5, -15, -25, 14, -16]), 10).tolist(),
+                         [0, 2, 2, 0, -2, -2, 1, -2])
+
+    def test_mul(self):
+        # quantity (4 decimal places) * price (4 decimal places) rounded to 2 decimal places
+        qty_list = [Decimal("1.25"), Decimal("-1.25"), Decimal("0.0050"), Decimal("-0.0050"), Decimal("0.0150"),
+                    Decimal("123.4567"), Decimal("-0.0001"), Decimal(0)]
+        price_list = [Decimal("1.0002"), Decimal("1.0002"), Decimal(1), Decimal(1), Decimal(1), Decimal("98.7654"),
+                      Decimal("0.5"), Decimal("12.34")]
+        self.assertEqual(
+            FpUtil.mul(FpUtil.to_scaled(qty_list, 4), 4, FpUtil.to_scaled(price_list, 4), 4, 2).tolist(),
+            FixedPointUtilTests.decimal_scaled([q * p for q, p in zip(qty_list, price_list)], 2))
+
+        # products that could overflow int64 are calculated with python integers. ties still round half even
+        arr1 = np.array([10 ** 13 + 1, -(10 ** 13 + 1), 10 ** 13 + 3, 7], dtype=np.int64)
+        arr2 = np.array([10 ** 9 + 500000, 10 ** 9 + 500000, 10 ** 9 + 500000, 3], dtype=np.int64)
+        self.assertGreater(float(arr1[0]) * float(arr2[0]), FpUtil.INT64_MAX)
+        self.assertEqual(FpUtil.mul(arr1, 4, arr2, 4, 2).tolist(), FixedPointUtilTests.decimal_scaled(
+            [Decimal(int(x)).scaleb(-4) * Decimal(int(y)).scaleb(-4) for x, y in zip(arr1, arr2)], 2))
+        self.assertEqual(FpUtil.mul(np.array([], dtype=np.int64), 4, np.array([], dtype=np.int64), 4, 2).tolist(), [])
+
+        with self.subTest():
+            self.assertRaises(OverflowError, FpUtil.mul, arr1, 4, arr2, 4, 8)
+            self.assertRaises(ValueError, FpUtil.mul, arr1, 2, arr2, 2, 5)
+
+    def test_str_to_scaled(self):
+        str_list = ["-1234.5", ".25", "7", "0", "-0.001", "0.125", "0.135", "-0.125", "-0.135", "1.005", "1.015",
+                    "2.675", "-2.675", "1.0049999999", "1.0050000001", "12345678.995"]
+        for dp in [0, 2, 4]:
+            with self.subTest(decimal_places=dp):
+                self.assertEqual(FpUtil.str_to_scaled(pd.Series(str_list), dp).tolist(),
+                                 FixedPointUtilTests.decimal_scaled([Decimal(s) for s in str_list], dp))
+
+        # .5 midpoints at 0 decimal places round to even
+        self.assertEqual(FpUtil.str_to_scaled(pd.Series(["0.5", "1.5", "2.5", "-0.5", "-1.5", "-2.5"]), 0).tolist(),
+                         [0, 2, 2, 0, -2, -2])
+        # midpoints that are not exact in float64 (2.675 is 2.67499999...) still match Decimal
+        self.assertEqual(FpUtil.str_to_scaled(pd.Series(["2.675", "1.015"]), 2).tolist(), [268, 102])
+
+        with self.subTest():
+            self.assertRaises(ValueError, FpUtil.str_to_scaled, pd.Series(["1.5", "abc"]), 2)
+            self.assertRaises(ValueError, FpUtil.str_to_scaled, pd.Series(["1.5", "inf"]), 2)
+            self.assertRaises(OverflowError, FpUtil.str_to_scaled, pd.Series(["1e20"]), 2)
+
+    @staticmethod
+    def decimal_scaled(dec_list, decimal_places):
+        return [int(round(d, decimal_places).scaleb(decimal_places)) for d in dec_list]
@@ -0,0 +1,136 @@
+import datetime
+import itertools
+
+import numpy as np
+
+from util.testcasebase import TestCaseBase
+import util.pythonutil as PyUtil
+
+
+class PythonUtilTests(TestCaseBase):
+    """ Array versions of the date functions are compared to the scalar versions over dates around holidays and
+    weekends """
+
+    def equal(self, obj1: object, obj2: object):
+        pass
+
+    def test_change_dt_date_array(self):
+        dates = PythonUtilTests.dates()
+        for days, biz_days, holidays in itertools.product([0, -3, 1, 10], [0, -5, -1, 1, 5], [None, True]):
+            with self.subTest(days=days, biz_days=biz_days, holidays=holidays):
+                self.assertEqual(PyUtil.change_dt_date_array(dates, days=days, biz_days=biz_days,
+                                                             holidays=holidays).tolist(),
+                                 [PyUtil.change_dt_date(d, days=days, biz_days=biz_days, holidays=holidays)
+                                  for d in dates])
+
+        # 2022-07-01 is a Friday before independence day. 2022-07-02 is a Saturday
+        self.assertEqual(PyUtil.change_dt_date(datetime.date(2022, 7, 1), biz_days=1), datetime.date(2022, 7, 4))
+        self.assertEqual(PyUtil.change_dt_date(datetime.date(2022, 7, 1), biz_days=1, holidays=True),
+                         datetime.date(2022, 7, 5))
+        self.assertEqual(PyUtil.change_dt_date(datetime.date(2022, 7, 2), biz_days=1, holidays=True),
+                         datetime.date(2022, 7, 5))
+        self.assertEqual(PyUtil.change_dt_date(datetime.date(2022, 7, 5), biz_days=-1, holidays=True),
+                         datetime.date(2022, 7, 1))
+        self.assertEqual(PyUtil.change_dt_date(datetime.date(2022, 7, 3), days=1, holidays=True),
+                         datetime.date(2022, 7, 5))
+
+        # per date offsets
+        self.assertEqual(PyUtil.change_dt_date_array(dates[:3], biz_days=np.array([1, 0, -1])).tolist(),
+                         [PyUtil.change_dt_date(d, biz_days=b) for d, b in zip(dates[:3], [1, 0, -1])])
+
+    def test_date_diff_days_array(self):
+        dates = PythonUtilTests.dates()
+        dates2 = dates[::-1]
+        for biz_days, holidays in itertools.product([False, True], [None, True]):
+            with self.subTest(biz_days=biz_days, holidays=holidays):
+                self.assertEqual(PyUtil.date_diff_days_array(dates, dates2, biz_days=biz_days,
+                                                             holidays=holidays).tolist(),
+                                 [PyUtil.date_diff_days(d1, d2, biz_days=biz_days, holidays=holidays)
+                                  for d1, d2 in zip(dates, dates2)])
+
+        # friday before independence day to the tuesday after. saturday counts as friday
+        self.assertEqual(PyUtil.date_diff_days(datetime.date(2022, 7, 1), datetime.date(2022, 7, 5)), 4)
+        self.assertEqual(PyUtil.date_diff_days(datetime.date(2022, 7, 1), datetime.date(2022, 7, 5), biz_days=True),
+                         2)
+        self.assertEqual(PyUtil.date_diff_days(datetime.date(2022, 7, 2), datetime.date(2022, 7, 5), biz_days=True,
+                                               holidays=True), 1)
+        self.assertEqual(PyUtil.date_diff_days(datetime.date(2022, 7, 5), datetime.date(2022, 7, 1), biz_days=True,
+                                               holidays=True), -1)
+
+    def test_date_range_array(self):
+        start_end_list = [(datetime.date(2021, 12, 24), datetime.date(2022, 1, 17)),  # holidays at both ends
+                          (datetime.date(2022, 6, 18), datetime.date(2022, 7, 3)),  # weekends at both ends
+                          (datetime.date(2022, 6, 20), datetime.date(2022, 6, 21))]
+        for (start, end), biz_days, inc_start, inc_end, inc_holidays in itertools.product(
+                start_end_list, *[[True, False]] * 4):
+            with self.subTest(start=start, end=end, biz_days=biz_days, inc_start=inc_start, inc_end=inc_end,
+                              inc_holidays=inc_holidays):
+                kwargs = dict(biz_days=biz_days, inc_start=inc_start, inc_end=inc_end, inc_holidays=inc_holidays)
+                self.assertEqual(PyUtil.date_range_array(start, end, **kwargs).tolist(),
+                                 PyUtil.date_range(start, end, **kwargs))
+
+        # juneteenth (observed monday) and independence day are removed
+        self.assertEqual(PyUtil.date_range(datetime.date(2022, 6, 17), datetime.date(2022, 7, 5), inc_holidays=False),
+                         [datetime.date(2022, 6, 17)] + [datetime.date(2022, 6, d) for d in range(21, 25)]
+                         + [datetime.date(2022, 6, d) for d in range(27, 31)] + [datetime.date(2022, 7, 1),
+                                                                                  datetime.date(2022, 7, 5)])
+        # first and last dates are kept even if they are holidays
+        self.assertEqual(PyUtil.date_range(datetime.date(2022, 7, 4), datetime.date(2022, 7, 6), inc_holidays=False),
+                         [datetime.date(2022, 7, 4), datetime.date(2022, 7, 5), datetime.date(2022, 7, 6)])
+
+    def test_nearest_biz_day_array(self):
+        # 2022-07-01 friday through 2022-07-05 tuesday
+        dates = [datetime.date(2022, 7, d) for d in range(1, 6)]
+        self.assertEqual(PyUtil.nearest_biz_day_array(dates).tolist(),
+                         [datetime.date(2022, 7, d) for d in [1, 1, 1, 4, 5]])
+        self.assertEqual(PyUtil.nearest_biz_day_array(dates, past=False).tolist(),
+                         [datetime.date(2022, 7, d) for d in [1, 1, 4, 4, 5]])
+        for past in [True, False]:
+            with self.subTest(past=past):
+                dates = PythonUtilTests.dates()
+                self.assertEqual(PyUtil.nearest_biz_day_array(dates, past=past).tolist(),
+                                 [PyUtil.nearest_biz_day(d, past=past) for d in dates])
+
+    def test_nyse_calendar_years(self):
+        # holidays are only skipped for years in NYSE_CALENDAR_YEARS
+        self.assertEqual(PyUtil.NYSE_CALENDAR_YEARS, (1971, 2099))
+        self.assertEqual(PyUtil.change_dt_date(datetime.date(1970, 12, 24), biz_days=1, holidays=True),
+                         datetime.date(1970, 12, 25))
+        self.assertEqual(PyUtil.change_dt_date(datetime.date(1970, 12, 31), biz_days=1, holidays=True),
+                         datetime.date(1971, 1, 4))
+        self.assertEqual(PyUtil.change_dt_date(datetime.date(2099, 12, 24), biz_days=1, holidays=True),
+                         datetime.date(2099, 12, 28))
+        self.assertEqual(PyUtil.change_dt_date(datetime.date(2100, 12, 23), biz_days=1, holidays=True),
+                         datetime.date(2100, 12, 24))
+
+    def test_nyse_holidays(self):
+        # new year's day on a saturday (2011, 2022) is not observed on the previous friday
+        self.assertEqual(PyUtil.nyse_holidays(2011, output_type="int"),
+                         [20110117, 20110221, 20110422, 20110530, 20110704, 20110905, 20111124, 20111226])
+        self.assertEqual(PyUtil.nyse_holidays(2021, output_type="int"),
+                         [20210101, 20210118, 20210215, 20210402, 20210531, 20210705, 20210906, 20211125, 20211224])
+        # juneteenth from 2022. sunday juneteenth is observed monday
+        self.assertEqual(PyUtil.nyse_holidays(2022, output_type="int"),
+                         [20220117, 20220221, 20220415, 20220530, 20220620, 20220704, 20220905, 20221124, 20221226])
+        # good friday 2027-03-26. saturday juneteenth and christmas are observed friday
+        self.assertEqual(PyUtil.nyse_holidays(datetime.date(2027, 5, 5)),
+                         [datetime.date(2027, 1, 1), datetime.date(2027, 1, 18), datetime.date(2027, 2, 15),
+                          datetime.date(2027, 3, 26), datetime.date(2027, 5, 31), datetime.date(2027, 6, 18),
+                          datetime.date(2027, 7, 5), datetime.date(2027, 9, 6), datetime.date(2027, 11, 25),
+                          datetime.date(2027, 12, 24)])
+        # no martin luther king jr. day before 1998
+        self.assertNotIn(19970120, PyUtil.nyse_holidays(1997, output_type="int"))
+        self.assertIn(19980119, PyUtil.nyse_holidays(1998, output_type="int"))
+
+        self.assertEqual(sorted(PyUtil.nyse_holidays((20210601, 20220601), output_type="int")),
+                         sorted(PyUtil.nyse_holidays([2021, 2022], output_type="int")))
+        self.assertEqual(PyUtil.nyse_holidays([]), [])
+        with self.subTest():
+            self.assertRaises(ValueError, PyUtil.nyse_holidays, (2021, 2022, 2023))
+
+    @staticmethod
+    def dates():
+        # every day from before christmas 2021 through after martin luther king jr. day 2022 and around juneteenth
+        # and independence day 2022
+        return [datetime.date(2021, 12, 20) + datetime.timedelta(days=i) for i in range(32)] \
+            + [datetime.date(2022, 6, 15) + datetime.timedelta(days=i) for i in range(25)]
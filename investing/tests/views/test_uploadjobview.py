@@ -0,0 +1,108 @@
+from decimal import Decimal
+from unittest.mock import patch
+import datetime
+import os
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ...models.investmentaccount import Broker
+from ...models.transaction import ActionType, Transaction, TransactionType
+from ...models.uploadjob import UploadJob
+from ..models.test_investmentaccount import InvestmentAccountTests
+from ..models.test_securitymaster import SecurityMasterTests
+from util.testcasebase import TestCaseBase
+
+
+class UploadJobViewTests(TestCaseBase):
+
+    def equal(self, obj1: object, obj2: object):
+        pass
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.media_root = temp_dir.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    @patch.object(UploadJob, "submit")
+    def test_file_upload(self, mock_submit):
+        for url_name, job_type in [("investing:transactionfileupload", UploadJob.JobType.TRANSACTION),
+                                   ("investing:closedpositionfileupload", UploadJob.JobType.CLOSED_POSITION)]:
+            with self.subTest(url_name=url_name):
+                self.assertEqual(self.client.get(reverse(url_name)).status_code, 200)
+
+                # the file is saved and a queued job is submitted. the response redirects to the job page
+                response = self.client.post(reverse(url_name), {
+                    "broker": Broker.FIDELITY, "file": SimpleUploadedFile("upload.csv", b"a,b\n1,2\n")})
+                job = UploadJob.objects.get(job_type=job_type)
+                self.assertRedirects(response, reverse("investing:uploadjob", args=[job.pk]),
+                                     fetch_redirect_response=False)
+                self.assertEqual((job.status, job.broker, job.filename),
+                                 (UploadJob.Status.QUEUED, Broker.FIDELITY, "upload.csv"))
+                with open(os.path.join(self.media_root, job.file_path()), "rb") as f:
+                    self.assertEqual(f.read(), b"a,b\n1,2\n")
+        self.assertEqual(mock_submit.call_count, 2)
+
+    def test_upload_job(self):
+        job = UploadJob.objects.create_job(UploadJob.JobType.TRANSACTION, Broker.FIDELITY, "transactions.csv")
+        url = reverse("investing:uploadjob", args=[job.pk])
+        response = self.client.get(url)
+        self.assertTemplateUsed(response, "investing/uploadjob/uploadjob.html")
+        self.assertContains(response, "Status: QUEUED")
+
+        UploadJobViewTests.succeeded_job(job, 101)
+        response = self.client.get(url, {"page": 2})
+        self.assertTemplateUsed(response, "investing/transaction/transactionfileuploadsuccess.html")
+        self.assertEqual([row[5] for row in response.context["trans_list"]], ["interest 100"])
+        self.assertContains(response, "Page 2 of 2 (101 saved)")
+
+        UploadJob.objects.filter(pk=job.pk).update(status=UploadJob.Status.FAILED, error="ValueError('bad row')")
+        response = self.client.get(url)
+        self.assertTemplateUsed(response, "investing/transaction/transactionfileuploadfailed.html")
+        self.assertEqual(response.context["error"], "ValueError('bad row')")
+
+        self.assertEqual(self.client.get(reverse("investing:uploadjob", args=[job.pk + 1])).status_code, 404)
+
+    def test_upload_job_status(self):
+        job = UploadJob.objects.create_job(UploadJob.JobType.TRANSACTION, Broker.FIDELITY, "transactions.csv")
+        url = reverse("investing:uploadjobstatus", args=[job.pk])
+        self.assertEqual(self.client.get(url).json(), {
+            "id": job.pk, "job_type": UploadJob.JobType.TRANSACTION, "filename": "transactions.csv",
+            "status": UploadJob.Status.QUEUED, "progress": 0, "total": 0, "error": "", "page": 1, "num_pages": 1,
+            "count": 0, "rows": []})
+
+        UploadJobViewTests.succeeded_job(job, 101)
+        status_dict = self.client.get(url, {"page": 2}).json()
+        self.assertEqual((status_dict["status"], status_dict["progress"], status_dict["total"]),
+                         (UploadJob.Status.SUCCEEDED, 101, 101))
+        self.assertEqual((status_dict["page"], status_dict["num_pages"], status_dict["count"]), (2, 2, 101))
+        self.assertEqual(status_dict["rows"], [["FIDELITY", "Individual - Test", "2022-09-06", "INTEREST", "INT_PMT",
+                                                "interest 100", "AAPL", "0.0000", "0.0000", "100.00", "0.00", "0.00"]])
+        # page numbers that are not integers return the first page
+        self.assertEqual(self.client.get(url, {"page": "x"}).json()["page"], 1)
+
+        # a running job without a heartbeat is marked failed when its status is requested
+        job = UploadJob.objects.create_job(UploadJob.JobType.CLOSED_POSITION, Broker.FIDELITY, "closed.csv")
+        UploadJob.objects.filter(pk=job.pk).update(status=UploadJob.Status.RUNNING, start_time=timezone.now(),
+                                                   heartbeat_time=timezone.now() - datetime.timedelta(hours=1))
+        status_dict = self.client.get(reverse("investing:uploadjobstatus", args=[job.pk])).json()
+        self.assertEqual(status_dict["status"], UploadJob.Status.FAILED)
+        self.assertIn("stopped without finishing", status_dict["error"])
+
+    @staticmethod
+    def succeeded_job(job, count):
+        inv_acc = InvestmentAccountTests.inv_acc_fidelity_individual()
+        aapl = SecurityMasterTests.sm_aapl()
+        Transaction.objects.bulk_create([Transaction(
+            investment_account=inv_acc, trans_date=datetime.date(2022, 9, 6), trans_type=TransactionType.INTEREST,
+            action_type=ActionType.INT_PMT, description="interest " + str(i), security=aapl, quantity=Decimal(0),
+            price=Decimal(0), amount_net=Decimal(i), commission=Decimal(0), fees=Decimal(0), content_hash=str(i),
+            upload_job=job) for i in range(count)])
+        UploadJob.objects.filter(pk=job.pk).update(status=UploadJob.Status.SUCCEEDED, progress=count, total=count,
+                                                   result={"sec_ns_str": "", "eiacd_list": []})
@@ -17,4 +17,7 @@ urlpatterns = [
 
     path("transaction/", views.transaction_home, name="transaction"),
     path("transaction/file/upload/", views.transaction_file_upload, name="transactionfileupload"),
+
+    path("uploadjob/<int:pk>/", views.upload_job, name="uploadjob"),
+    path("uploadjob/<int:pk>/status/", views.upload_job_status, name="uploadjobstatus"),
 ]
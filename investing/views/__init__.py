@@ -4,3 +4,4 @@ from .investingview import investing_home
 from .positionview import position_home
 from .securitymasterview import security_master_home
 from .transactionview import transaction_home, transaction_file_upload
+from .uploadjobview import upload_job, upload_job_status
@@ -0,0 +1,33 @@
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
+
+from ..models.uploadjob import UploadJob
+
+
+def upload_job(request, pk):
+    job = get_object_or_404(UploadJob, pk=pk)
+    job.fail_if_stale()
+    if job.job_type == UploadJob.JobType.TRANSACTION:
+        template_dir, list_name = "investing/transaction/transactionfileupload", "trans_list"
+    else:
+        template_dir, list_name = "investing/closedposition/closedpositionfileupload", "pos_list"
+
+    if job.status == UploadJob.Status.FAILED:
+        return render(request, template_dir + "failed.html", context={"filename": job.filename, "error": job.error})
+    elif job.status == UploadJob.Status.SUCCEEDED:
+        page = job.result_page(request.GET.get("page"))
+        return render(request, template_dir + "success.html",
+                      context={"sec_ns_str": job.result["sec_ns_str"], "eiacd_list": job.result["eiacd_list"],
+                               list_name: page.object_list, "page": page})
+    else:
+        return render(request, "investing/uploadjob/uploadjob.html", context={"job": job})
+
+
+def upload_job_status(request, pk):
+    job = get_object_or_404(UploadJob, pk=pk)
+    job.fail_if_stale()
+    page = job.result_page(request.GET.get("page"))
+    return JsonResponse({"id": job.pk, "job_type": job.job_type, "filename": job.filename, "status": job.status,
+                         "progress": job.progress, "total": job.total, "error": job.error,
+                         "page": page.number, "num_pages": page.paginator.num_pages, "count": page.paginator.count,
+                         "rows": page.object_list})
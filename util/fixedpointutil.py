@@ -0,0 +1,140 @@
+""" Fixed Point Utility Functions
+
+Decimal values are represented as int64 numpy arrays scaled by 10 ** decimal places so arithmetic can be vectorized.
+Rounding is half even, the same as round(Decimal, decimal places) and Decimal fields saved to the database.
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+
+import numpy as np
+from django.db import models
+import pandas as pd
+
+
+# largest absolute value that can be held in int64
+INT64_MAX = np.iinfo(np.int64).max
+
+
+def decimal_places_dict(model):
+    """ Create dict of decimal field name to decimal places for a django model
+
+    Args:
+        model (type[models.Model]):
+
+    Returns:
+        dict[str, int]: decimal field name (keys) to decimal places (values)
+    """
+    return {f.name: f.decimal_places for f in model._meta.get_fields() if isinstance(f, models.DecimalField)}
+
+
+def div_round(arr, divisor):
+    """ Divide int64 array by positive integer divisor and round half even
+
+    Args:
+        arr (np.ndarray): int64 array
+        divisor (int): positive integer
+
+    Returns:
+        np.ndarray: int64 array
+    """
+    quot, rem = np.divmod(arr, divisor)
+    rem_2 = 2 * rem
+    return quot + ((rem_2 > divisor) | ((rem_2 == divisor) & (quot % 2 == 1)))
+
+
+def from_scaled(arr, decimal_places):
+    """ Convert scaled int64 array to Decimal values
+
+    Args:
+        arr (np.ndarray): int64 array scaled by 10 ** decimal_places
+        decimal_places (int):
+
+    Returns:
+        list[Decimal]: Decimal values with exactly decimal_places decimal places
+    """
+    return [Decimal(int(x)).scaleb(-decimal_places) for x in arr]
+
+
+def mul(arr1, decimal_places1, arr2, decimal_places2, decimal_places):
+    """ Multiply scaled int64 arrays and round half even to decimal_places
+
+    The product is calculated exactly. if the product could overflow int64, the product is calculated with python
+    integers before rounding.
+
+    Args:
+        arr1 (np.ndarray): int64 array scaled by 10 ** decimal_places1
+        decimal_places1 (int):
+        arr2 (np.ndarray): int64 array scaled by 10 ** decimal_places2
+        decimal_places2 (int):
+        decimal_places (int): decimal places of the result. must not be more than decimal_places1 + decimal_places2
+
+    Returns:
+        np.ndarray: int64 array scaled by 10 ** decimal_places
+
+    Raises:
+        OverflowError: if the rounded product does not fit in int64
+        ValueError: if decimal_places is more than decimal_places1 + decimal_places2
+    """
+    shift = decimal_places1 + decimal_places2 - decimal_places
+    if shift < 0:
+        raise ValueError("decimal_places must not be more than decimal_places1 + decimal_places2")
+
+    if len(arr1) == 0 or (np.abs(arr1.astype(np.float64)) * np.abs(arr2.astype(np.float64))).max() < INT64_MAX / 2:
+        return div_round(arr1 * arr2, 10 ** shift)
+
+    # python integers do not overflow
+    divisor = 10 ** shift
+    res_list = []
+    for x, y in zip(arr1, arr2):
+        quot, rem = divmod(int(x) * int(y), divisor)
+        res_list.append(quot + (1 if 2 * rem > divisor or (2 * rem == divisor and quot % 2 == 1) else 0))
+    return np.array(res_list, dtype=np.int64)
+
+
+def str_to_scaled(str_srs, decimal_places):
+    """ Convert decimal strings to scaled int64 array without creating a Decimal for each value
+
+    Strings are parsed to float64 in bulk and rounded half even after scaling. Float parsing is exact enough to round
+    correctly unless a scaled value is within 0.001 of a rounding midpoint (only possible if a string has more than
+    decimal_places decimal places). those values are converted with Decimal so the result is always the same as
+    round(Decimal(value), decimal_places)
+
+    Args:
+        str_srs (pd.Series): str values. e.g. "-1234.5", ".25", "7"
+        decimal_places (int): scaled absolute values must be less than 2 ** 52
+
+    Returns:
+        np.ndarray: int64 array scaled by 10 ** decimal_places
+
+    Raises:
+        OverflowError: if a scaled absolute value is not less than 2 ** 52
+        ValueError: if a value is missing or is not a finite decimal string
+    """
+    scaled_arr = pd.to_numeric(str_srs).to_numpy(dtype=np.float64) * 10 ** decimal_places
+    if not np.isfinite(scaled_arr).all():
+        raise ValueError("Not a finite decimal string: " + repr(str_srs[~np.isfinite(scaled_arr)].iloc[0]))
+    if len(scaled_arr) > 0 and np.abs(scaled_arr).max() >= 2 ** 52:
+        raise OverflowError("Scaled value does not fit in float64 integer precision")
+
+    res_arr = np.rint(scaled_arr).astype(np.int64)
+    tie_arr = np.abs(scaled_arr - np.floor(scaled_arr) - 0.5) < 0.001
+    if tie_arr.any():
+        res_arr[tie_arr] = to_scaled([Decimal(str(x).strip()) for x in str_srs[tie_arr]], decimal_places)
+    return res_arr
+
+
+def to_scaled(values, decimal_places):
+    """ Convert Decimal (or int) values to scaled int64 array
+
+    Args:
+        values (Iterable[Union[Decimal, int]]): values must not be None
+        decimal_places (int): values are rounded half even to this many decimal places
+
+    Returns:
+        np.ndarray: int64 array scaled by 10 ** decimal_places
+
+    Raises:
+        OverflowError: if a scaled value does not fit in int64
+    """
+    exp = Decimal(1).scaleb(-decimal_places)
+    return np.array([int(Decimal(x).quantize(exp, rounding=ROUND_HALF_EVEN).scaleb(decimal_places)) for x in values],
+                    dtype=np.int64)
@@ -2,6 +2,7 @@
 
 """
 from typing import Any, Optional, Union
+import hashlib
 
 import pandas as pd
 
@@ -170,3 +171,25 @@ def ins_row_at_end(df, row):
     df.loc[0 if len(df) == 0 else (df.index.max() + 1)] = row
     return df
 
+
+def row_hashes(df):
+    """ Create a content hash for each row of dataframe
+
+    Row values are converted to str and joined column by column. Rows with the same values are numbered in order and
+    the number is included in the hash so identical rows each get a different hash. The hash of a row only depends on
+    its values and the number of identical rows before it, so the same rows hash the same in any dataframe they are in.
+
+    Args:
+        df (pd.DataFrame): dataframe with at least one column. values must have a consistent str representation (e.g.
+            scaled ints instead of Decimals with varying decimal places)
+
+    Returns:
+        pd.Series: sha256 hex digests (str) with df index
+    """
+    # unit separator is not expected in any value
+    key_srs = df.iloc[:, 0].astype(str)
+    for col in df.columns[1:]:
+        key_srs = key_srs + "\x1f" + df[col].astype(str)
+    key_srs = key_srs + "\x1f" + key_srs.groupby(key_srs, sort=False).cumcount().astype(str)
+
+    return pd.Series([hashlib.sha256(key.encode()).hexdigest() for key in key_srs], index=df.index, dtype=object)
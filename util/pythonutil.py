@@ -1,11 +1,15 @@
-from collections import defaultdict
 from typing import Optional, Union
 import datetime
+import functools
 import textwrap
 
 import numpy as np
 
 
+# regular nyse holidays are generated for years in this range (inclusive) when building business day calendars
+NYSE_CALENDAR_YEARS = (1971, 2099)
+
+
 def textwrap_lines(line_str, width=150, indent="  "):
     """ Wrap str to target width with specified indentation while preserving line breaks
 
@@ -26,7 +30,9 @@ def textwrap_lines(line_str, width=150, indent="  "):
 def nyse_holidays(years_dates, output_type="dd"):
     """ Get list of nyse holidays based on years which can be passed as 4 digit year or date
 
-    only set up for 2018 - 2024 inclusive. years outside this range are considered to have no holidays
+    Holidays are generated from the nyse holiday rules so any year can be used. Only regular holidays are generated.
+    Special closings (e.g. national days of mourning, weather) are not included. Martin Luther King Jr. Day is
+    included from 1998 and Juneteenth from 2022
 
     Args:
         years_dates (Union[int, datetime.date, list[int], list[datetime.date], tuple[datetime.date, datetime.date]]):
@@ -57,26 +63,19 @@ def nyse_holidays(years_dates, output_type="dd"):
         func = get_func(years_dates[0])
         years_dates = list(range(func(years_dates[0]), func(years_dates[1]) + 1))
 
+    if len(years_dates) == 0:
+        return []
+
     func = get_func(years_dates[0])
     year_set = set()
     for yd in years_dates:
         year_set.add(func(yd))
 
-    d = defaultdict(lambda: [],
-        {2018: [20180101, 20180115, 20180219, 20180330, 20180528, 20180704, 20180903, 20181122, 20181225],
-         2019: [20190101, 20190121, 20190218, 20190419, 20190527, 20190704, 20190902, 20191128, 20191225],
-         2020: [20200101, 20200120, 20200217, 20200410, 20200525, 20200703, 20200907, 20201126, 20201225],
-         2021: [20210101, 20210118, 20210215, 20210402, 20210531, 20210705, 20210906, 20211125, 20211224],
-         2022: [20220117, 20220221, 20220415, 20220530, 20220620, 20220704, 20220905, 20221124, 20221226],
-         2023: [20230102, 20230116, 20230220, 20230407, 20230529, 20230619, 20230704, 20230904, 20231123, 20231225],
-         2024: [20240101, 20240115, 20240219, 20240329, 20240527, 20240619, 20240704, 20240902, 20241128, 20241225]})
-
     holiday_list = []
     for y in year_set:
-        holiday_list += d[y]
+        holiday_list += _nyse_year_holidays(y)
 
-    return holiday_list if output_type == "int" else \
-        [datetime.date(d // 10000, month=(d % 10000 // 100), day=(d % 100)) for d in holiday_list]
+    return holiday_list if output_type == "dd" else [d.year * 10000 + d.month * 100 + d.day for d in holiday_list]
 
 
 def nearest_biz_day(date, past=True):
@@ -99,6 +98,23 @@ def nearest_biz_day(date, past=True):
     return date
 
 
+def nearest_biz_day_array(dates, past=True):
+    """ Array version of nearest_biz_day()
+
+    Args:
+        dates (Union[np.ndarray, list[datetime.date]]): array like of dates
+        past (boolean): Default True
+
+    Returns:
+        np.ndarray: datetime64[D] array of nearest business days
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    # 1970-01-01 (day 0) is a Thursday so Monday is 0
+    weekday = (dates.astype(np.int64) + 3) % 7
+    shift = np.where(weekday == 5, -1, np.where(weekday == 6, -2 if past else 1, 0))
+    return dates + shift.astype("timedelta64[D]")
+
+
 def change_dt_date(date, days=0, months=None, years=None, biz_days=0, biz_months=None, biz_years=None, holidays=None,
                    days_in_year=365, days_in_biz_year=260):
     """ Change datetime.date instance by specified values.
@@ -131,20 +147,12 @@ def change_dt_date(date, days=0, months=None, years=None, biz_days=0, biz_months
     Returns:
         datetime.date: date changed according to parameters
     """
-    def hol_count(sd, ed):
-        if sd <= ed:
-            return len([x for x in nyse_holidays((sd, ed)) if sd < x <= ed])
-        else:
-            return -len([x for x in nyse_holidays((ed, sd)) if ed <= x < sd])
-
-    # change by calendar days
-    start_date = date
-
     if not isinstance(days_in_year, int):
         days_in_year = 365
     if not isinstance(days_in_biz_year, int):
         days_in_biz_year = 260
 
+    # change by calendar days
     if not isinstance(days, int):
         days = 0
     if isinstance(months, (int, float)):
@@ -152,17 +160,13 @@ def change_dt_date(date, days=0, months=None, years=None, biz_days=0, biz_months
     if isinstance(years, (int, float)):
         days += round(days_in_year * years)
 
-    date += datetime.timedelta(days=days)
-
-    if holidays:
-        # there could be holidays between date and date + count but need to avoid infinite loop
-        day_chng = hol_count(start_date, date)
-        if day_chng != 0:
-            date = change_dt_date(date, days=day_chng, holidays=True)
+    if days != 0:
+        if holidays:
+            date = _offset_days(np.datetime64(date, "D"), days, True, False).item()
+        else:
+            date += datetime.timedelta(days=days)
 
     # change by business days
-    start_date = date
-
     if not isinstance(biz_days, int):
         biz_days = 0
     if isinstance(biz_months, (int, float)):
@@ -171,23 +175,42 @@ def change_dt_date(date, days=0, months=None, years=None, biz_days=0, biz_months
         biz_days += round(days_in_biz_year * biz_years)
 
     if biz_days != 0:
-        # move weekend date to previous friday
-        date = nearest_biz_day(date)
-        (skip_day, skip_len, inc) = (4, 3, 1) if biz_days >= 0 else (0, -3, -1)
+        date = _offset_days(np.datetime64(date, "D"), biz_days, bool(holidays), True).item()
 
-        for i in range(abs(biz_days)):
-            if datetime.date.weekday(date) == skip_day:
-                date += datetime.timedelta(days=skip_len)
-            else:
-                date += datetime.timedelta(days=inc)
+    return date
+
+
+def change_dt_date_array(dates, days=0, biz_days=0, holidays=None):
+    """ Array version of change_dt_date()
+
+    days are applied first. biz_days are applied next. See change_dt_date() for how weekend dates and holidays
+    are handled
+
+    Args:
+        dates (Union[np.ndarray, list[datetime.date]]): array like of dates
+        days (Union[int, np.ndarray]): int or int array broadcastable with dates. Default 0
+        biz_days (Union[int, np.ndarray]): int or int array broadcastable with dates. Default 0
+        holidays (Optional[boolean]): True to skip over nyse holidays. None or False to include holidays. Default None
+
+    Returns:
+        np.ndarray: datetime64[D] array of changed dates
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    days = np.asarray(days, dtype=np.int64)
+    biz_days = np.asarray(biz_days, dtype=np.int64)
 
+    if days.any():
         if holidays:
-            # there could be holidays between date and date + count but need to avoid infinite loop
-            day_chng = hol_count(start_date, date)
-            if day_chng != 0:
-                date = change_dt_date(date, biz_days=day_chng, holidays=True)
+            # dates are unchanged where days is 0
+            dates = np.where(days != 0, _offset_days(dates, days, True, False), dates)
+        else:
+            dates = dates + days.astype("timedelta64[D]")
 
-    return date
+    if biz_days.any():
+        # weekend dates are not moved where biz_days is 0
+        dates = np.where(biz_days != 0, _offset_days(dates, biz_days, bool(holidays), True), dates)
+
+    return dates
 
 
 def change_dt(dt, days=0, months=None, years=None, biz_days=0, biz_months=None, biz_years=None, hours=0, minutes=0,
@@ -484,6 +507,19 @@ def date_range(start, end, biz_days=True, inc_start=True, inc_end=True, inc_holi
     Returns:
         list[datetime.date]:
     """
+    return date_range_array(start, end, biz_days=biz_days, inc_start=inc_start, inc_end=inc_end,
+                            inc_holidays=inc_holidays).tolist()
+
+
+def date_range_array(start, end, biz_days=True, inc_start=True, inc_end=True, inc_holidays=True):
+    """ Array version of date_range()
+
+    Args:
+        See date_range()
+
+    Returns:
+        np.ndarray: datetime64[D] array of dates
+    """
     if inc_start and biz_days and datetime.date.weekday(start) in (5, 6):
         start = change_dt_date(start, biz_days=1)
     elif not inc_start:
@@ -491,24 +527,15 @@ def date_range(start, end, biz_days=True, inc_start=True, inc_end=True, inc_holi
     if not inc_end:
         end = change_dt_date(end, biz_days=-1) if biz_days else change_dt_date(end, days=-1)
 
-    dates = []
-    dt = start
+    dates = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1, dtype="datetime64[D]")
     if biz_days:
-        while dt <= end:
-            dates.append(dt)
-            dt = change_dt_date(dt, biz_days=1)
-    else:
-        while dt <= end:
-            dates.append(dt)
-            dt = change_dt_date(dt, days=1)
-
-    if not inc_holidays:
-        h_dates = nyse_holidays(dates)
-        if dates[0] in h_dates:
-            h_dates.remove(dates[0])
-        if dates[-1] in h_dates:
-            h_dates.remove(dates[-1])
-        dates = [x for x in dates if x not in h_dates]
+        dates = dates[np.is_busday(dates, busdaycal=_busday_calendar(False, False))]
+
+    if not inc_holidays and len(dates) > 2:
+        # first and last dates are kept even if they are holidays
+        keep = np.is_busday(dates, busdaycal=_busday_calendar(True, not biz_days))
+        keep[[0, -1]] = True
+        dates = dates[keep]
 
     return dates
 
@@ -585,25 +612,46 @@ def dt_range(start, end, mkt_time=None, interval="minute", finer_to_0=True):
     return dts
 
 
-def date_diff_days(date1, date2, biz_days=False):
+def date_diff_days(date1, date2, biz_days=False, holidays=None):
     """ Calculate number of days between date1 and date2
 
-    Holidays are not skipped. If either date is a weekend date and biz_days is True, those date(s) are moved to the
-    previous Friday. If date2 is less than date1, a negative number will be returned
+    If either date is a weekend date and biz_days is True, those date(s) are moved to the previous Friday.
+    If date2 is less than date1, a negative number will be returned
 
     Args:
         date1 (datetime.date):
         date2 (datetime.date):
         biz_days (boolean): Default False
+        holidays (Optional[boolean]): only used if biz_days is True. True to not count nyse holidays. None or False to
+            count holidays. Default None
 
     Returns:
         int: number of days such that if you start counting on date 1 (and consider biz days or not),
             you will end on date2
     """
-    if biz_days:
-        return np.busday_count(nearest_biz_day(date1), nearest_biz_day(date2))
-    else:
-        return (date2 - date1).days
+    return int(date_diff_days_array(date1, date2, biz_days=biz_days, holidays=holidays)) if biz_days \
+        else (date2 - date1).days
+
+
+def date_diff_days_array(dates1, dates2, biz_days=False, holidays=None):
+    """ Array version of date_diff_days()
+
+    Args:
+        dates1 (Union[np.ndarray, list[datetime.date]]): array like of dates
+        dates2 (Union[np.ndarray, list[datetime.date]]): array like of dates broadcastable with dates1
+        biz_days (boolean): Default False
+        holidays (Optional[boolean]): See date_diff_days()
+
+    Returns:
+        np.ndarray: int64 array of number of days
+    """
+    dates1 = np.asarray(dates1, dtype="datetime64[D]")
+    dates2 = np.asarray(dates2, dtype="datetime64[D]")
+    if not biz_days:
+        return (dates2 - dates1).astype(np.int64)
+
+    return np.busday_count(nearest_biz_day_array(dates1), nearest_biz_day_array(dates2),
+                           busdaycal=_busday_calendar(bool(holidays), False)).astype(np.int64)
 
 
 def html_rgd_fmt(numbers, comma=True, frac=0):
@@ -621,3 +669,99 @@ def html_rgd_fmt(numbers, comma=True, frac=0):
         numbers = [numbers]
     fmt_str = "${0:" + ("," if comma else "") + "." + str(frac) + "f}"
     return ["<font color=" + ('red' if x < 0 else 'green') + ">" + fmt_str.format(x) + "</font>" for x in numbers]
+
+
+@functools.lru_cache(maxsize=None)
+def _busday_calendar(holidays, weekends):
+    """ Create (cached) business day calendar
+
+    Args:
+        holidays (boolean): True to exclude nyse holidays for years in NYSE_CALENDAR_YEARS
+        weekends (boolean): True for weekends to be business days. False for Monday - Friday business days
+
+    Returns:
+        np.busdaycalendar:
+    """
+    return np.busdaycalendar(weekmask="1111111" if weekends else "1111100",
+                             holidays=nyse_holidays(NYSE_CALENDAR_YEARS) if holidays else [])
+
+
+def _offset_days(dates, offsets, holidays, biz_days):
+    """ Move dates by offsets days using business day calendar
+
+    If biz_days, weekend dates are moved to the previous Friday before moving. Counting starts after (before if offset
+    is negative) a holiday date, so a holiday date is rolled to the previous business day for positive offsets and to
+    the next business day for negative offsets. This matches stepping one day at a time and then stepping again for
+    each holiday passed over
+
+    Args:
+        dates (np.ndarray): datetime64[D] array or scalar
+        offsets (Union[int, np.ndarray]): int or int array broadcastable with dates. must not be 0
+        holidays (boolean): True to skip over nyse holidays
+        biz_days (boolean): True to skip over weekends
+
+    Returns:
+        np.ndarray: datetime64[D] array or scalar
+    """
+    cal = _busday_calendar(holidays, not biz_days)
+    back_dates = np.busday_offset(dates, offsets, roll="backward", busdaycal=cal)
+    if not holidays:
+        return back_dates
+
+    # negative offset from a weekday holiday (any holiday if not biz_days)
+    forward = np.less(offsets, 0) & (np.is_busday(dates, weekmask="1111100") if biz_days else True)
+    return np.where(forward, np.busday_offset(dates, offsets, roll="forward", busdaycal=cal), back_dates)
+
+
+@functools.lru_cache(maxsize=None)
+def _nyse_year_holidays(year):
+    """ Generate (cached) list of regular nyse holidays for year from the nyse holiday rules
+
+    Saturday holidays are observed on the previous Friday and Sunday holidays on the next Monday. New Year's Day on a
+    Saturday is not observed
+
+    Args:
+        year (int): 4 digit year
+
+    Returns:
+        list[datetime.date]: holidays in date order
+    """
+    def nth_weekday(month, weekday, n):
+        # nth (last if n is -1) weekday (Monday is 0) of month
+        if n > 0:
+            first = datetime.date(year, month, 1)
+            return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+        last = datetime.date(year, month + 1, 1) - datetime.timedelta(days=1)
+        return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+    def observed(date):
+        return nearest_biz_day(date, past=(date.weekday() == 5))
+
+    # easter sunday. anonymous gregorian algorithm
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    j = (32 + 2 * e + 2 * i - h - k) % 7
+    m = h + j - 7 * ((a + 11 * h + 19 * j) // 433)
+    easter_month = (m + 90) // 25
+    easter = datetime.date(year, easter_month, (m + 33 * easter_month + 19) % 32)
+
+    hol_list = []
+    new_years = datetime.date(year, 1, 1)
+    if new_years.weekday() != 5:
+        hol_list.append(observed(new_years))
+    if year >= 1998:
+        hol_list.append(nth_weekday(1, 0, 3))  # martin luther king jr. day
+    hol_list.append(nth_weekday(2, 0, 3))  # washington's birthday
+    hol_list.append(easter - datetime.timedelta(days=2))  # good friday
+    hol_list.append(nth_weekday(5, 0, -1))  # memorial day
+    if year >= 2022:
+        hol_list.append(observed(datetime.date(year, 6, 19)))  # juneteenth
+    hol_list.append(observed(datetime.date(year, 7, 4)))  # independence day
+    hol_list.append(nth_weekday(9, 0, 1))  # labor day
+    hol_list.append(nth_weekday(11, 3, 4))  # thanksgiving
+    hol_list.append(observed(datetime.date(year, 12, 25)))  # christmas
+
+    return hol_list